@@ -0,0 +1,312 @@
+# benchmarks/bot_api_emulator.py
+"""
+本地 Bot API 模拟器：端到端压测 main.py (含 PTB 的 HTTP 层和 ConversationHandler)，不接触 Telegram。
+
+    python -m benchmarks.bot_api_emulator --port 8081 --press-rate 200 --private-rate 20 --duration 120
+    BOT_API_BASE_URL=http://127.0.0.1:8081/bot BOT_MODE=polling python main.py
+
+- 实现 getUpdates 长轮询和本项目用到的方法 (copyMessage / editMessageCaption / editMessageReplyMarkup /
+  sendMessage / deleteMessage / pinChatMessage / getChat ...)，其余方法一律返回 true
+- 按设定速率注入频道按钮点击 (点赞/踩/收藏/展开评论) 和私聊 /start
+- 可按比例或全局速率上限模拟 429 RetryAfter
+- 定期输出：持续处理速率 (updates/s)、端到端延迟 p50/p99、回调应答延迟、每个更新的 API 调用数
+
+端到端延迟按更新的最终可见结果计算：频道按钮点击到该帖子的 editMessage* (含数据库读写和编辑合并的等待，
+合并成一次编辑的多次点击一起完成)，私聊消息/私聊按钮到机器人在该聊天里的第一次发送或编辑。
+answerCallbackQuery 在处理器第一行就发出，只单独统计为 "应答" 延迟。
+
+频道按钮点击的帖子 ID 取自 --posts 范围，数据库里应先有这些帖子 (可用基准测试的种子数据)。
+"""
+
+import time
+import json
+import random
+import asyncio
+import argparse
+import itertools
+from collections import deque, defaultdict
+
+from aiohttp import web
+
+CHANNEL_BUTTONS = ("react:like:{}", "react:dislike:{}", "collect:{}", "comment:show:{}")
+NO_THROTTLE = {"getUpdates", "getMe", "deleteWebhook", "setWebhook", "getWebhookInfo"}
+
+
+def percentile(values, q: float) -> float:
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class BotApiEmulator:
+    def __init__(self, args):
+        self.args = args
+        self.updates = asyncio.Queue()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(10_000_000)
+        self.bucket = float(args.max_rps)
+        self.bucket_at = time.monotonic()
+        # 未完成的更新：频道点击按帖子 message_id，私聊按 chat_id (先进先出)；未应答的回调按 callback_query_id
+        self.pending_posts = defaultdict(list)
+        self.pending_chats = defaultdict(deque)
+        self.pending_callbacks = {}
+        # 统计 (总计 / 本周期)
+        self.injected = self.answered = self.api_calls = self.throttled = 0
+        self.calls_by_method = defaultdict(int)
+        self.latencies = []
+        self.window = []
+        self.ack_latencies = []
+        self.started = time.monotonic()
+        self.connected = asyncio.Event()
+
+    # --- 注入 ---
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def track(self, update: dict):
+        """登记一个待响应的更新 (用于计算端到端延迟)"""
+        now = time.monotonic()
+        if "callback_query" in update:
+            query = update["callback_query"]
+            self.pending_callbacks[str(query["id"])] = now
+            message = query.get("message") or {}
+            if message.get("chat", {}).get("type") == "channel":
+                self.pending_posts[message["message_id"]].append(now)
+            elif message:
+                self.pending_chats[message["chat"]["id"]].append(now)
+        elif update.get("message", {}).get("chat", {}).get("type") == "private":
+            self.pending_chats[update["message"]["chat"]["id"]].append(now)
+
+    def inject_channel_press(self):
+        post_id = random.randint(*self.args.posts)
+        user_id = 5_000_000 + random.randrange(self.args.users)
+        query_id = str(next(self.update_ids))
+        self._put({"callback_query": {
+            "id": query_id, "from": self._user(user_id), "chat_instance": "emu",
+            "data": random.choice(CHANNEL_BUTTONS).format(post_id),
+            "message": {"message_id": post_id, "date": int(time.time()),
+                        "chat": {"id": self.args.channel_id, "type": "channel", "title": "emu"}, "caption": "emu"},
+        }})
+
+    def inject_private_start(self):
+        user_id = 5_000_000 + random.randrange(self.args.users)
+        self._put({"message": {
+            "message_id": next(self.message_ids), "date": int(time.time()), "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"}, "from": self._user(user_id),
+        }})
+
+    def _put(self, update: dict):
+        update["update_id"] = next(self.update_ids)
+        self.injected += 1
+        self.track(update)
+        self.updates.put_nowait(update)
+
+    async def generate(self, inject, rate: float):
+        """按固定速率注入 (按计划时间补偿，不随处理速度漂移)"""
+        if rate <= 0: return
+        interval, next_at = 1 / rate, time.monotonic()
+        while True:
+            inject()
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+    # --- 响应 ---
+
+    def _record(self, started_at: float):
+        latency = time.monotonic() - started_at
+        self.answered += 1
+        self.latencies.append(latency)
+        self.window.append(latency)
+
+    def _throttle(self) -> int:
+        """返回 retry_after 秒数，0 表示放行"""
+        if self.args.retry_rate and random.random() < self.args.retry_rate:
+            return self.args.retry_after
+        if self.args.max_rps:
+            now = time.monotonic()
+            self.bucket = min(self.args.max_rps, self.bucket + (now - self.bucket_at) * self.args.max_rps)
+            self.bucket_at = now
+            if self.bucket < 1:
+                return self.args.retry_after
+            self.bucket -= 1
+        return 0
+
+    def _chat(self, chat_id) -> dict:
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            return {"id": self.args.channel_id, "type": "channel", "title": "emu", "username": str(chat_id).lstrip("@")}
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}", "username": f"user{chat_id}"}
+        return {"id": chat_id, "type": "channel" if chat_id == self.args.channel_id else "supergroup", "title": "emu"}
+
+    def _message(self, params: dict, message_id: int = None) -> dict:
+        return {"message_id": message_id or next(self.message_ids), "date": int(time.time()),
+                "chat": self._chat(params.get("chat_id")), "text": params.get("text") or "emu"}
+
+    async def _params(self, request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            if not isinstance(value, str): continue
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = await self._params(request)
+
+        if method == "getUpdates":
+            self.connected.set()
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        if method not in NO_THROTTLE:
+            self.api_calls += 1
+            self.calls_by_method[method] += 1
+            retry_after = self._throttle()
+            if retry_after:
+                self.throttled += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }, status=429)
+
+        if method == "answerCallbackQuery":
+            started_at = self.pending_callbacks.pop(str(params.get("callback_query_id")), None)
+            if started_at is not None: self.ack_latencies.append(time.monotonic() - started_at)
+        elif method in ("sendMessage", "copyMessage", "sendPhoto") or method.startswith("editMessage"):
+            chat_id = _int(params.get("chat_id"))
+            if method.startswith("editMessage") and (chat_id is None or chat_id < 0):
+                # 频道帖子编辑：合并前的所有点击都在这次编辑里落地
+                for started_at in self.pending_posts.pop(_int(params.get("message_id")), ()):
+                    self._record(started_at)
+            else:
+                waiting = self.pending_chats.get(chat_id)
+                if waiting: self._record(waiting.popleft())
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Emulator", "username": self.args.bot_username}
+        elif method == "getChat":
+            result = self._chat(params.get("chat_id"))
+        elif method == "copyMessage":
+            result = {"message_id": next(self.message_ids)}
+        elif method in ("sendMessage", "sendPhoto"):
+            result = self._message(params)
+        elif method.startswith("editMessage"):
+            result = self._message(params, _int(params.get("message_id")))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> list:
+        limit = int(params.get("limit") or 100)
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout=float(params.get("timeout") or 0) or 0.01)
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while len(batch) < limit and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    # --- 报告 ---
+
+    def report(self, final: bool = False):
+        elapsed = time.monotonic() - self.started
+        window, self.window = self.window, []
+        sample = self.latencies if final else window
+        label = "总计" if final else "本周期"
+        print(
+            f"[{elapsed:7.1f}s] 注入 {self.injected} 响应 {self.answered} "
+            f"持续速率 {self.answered / elapsed:7.1f} upd/s | {label} p50 {percentile(sample, 0.5) * 1000:7.1f}ms "
+            f"p99 {percentile(sample, 0.99) * 1000:7.1f}ms 应答 p50 {percentile(self.ack_latencies, 0.5) * 1000:6.1f}ms | API/更新 {self.api_calls / max(1, self.answered):.2f} "
+            f"429 {self.throttled} 队列 {self.updates.qsize()}",
+            flush=True,
+        )
+        if final:
+            for method, n in sorted(self.calls_by_method.items(), key=lambda item: -item[1]):
+                print(f"  {method:<24} {n}")
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _range(text: str):
+    low, _, high = text.partition("-")
+    return int(low), int(high or low)
+
+
+async def start_server(emulator: BotApiEmulator, host: str, port: int):
+    """启动 HTTP 服务，返回 (runner, 实际端口)；port=0 时由系统分配"""
+    app = web.Application(client_max_size=20 * 1024 ** 2)
+    app.router.add_post("/bot{token}/{method}", emulator.handle)
+    app.router.add_get("/bot{token}/{method}", emulator.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, runner.addresses[0][1]
+
+
+async def serve(args):
+    emulator = BotApiEmulator(args)
+    runner, port = await start_server(emulator, args.host, args.port)
+    print(f"🧪 Bot API 模拟器已启动: BOT_API_BASE_URL=http://{args.host}:{port}/bot", flush=True)
+
+    # 等机器人第一次拉取更新后再开始计时注入
+    if not args.no_wait:
+        await emulator.connected.wait()
+    emulator.started = time.monotonic()
+    generators = [
+        asyncio.create_task(emulator.generate(emulator.inject_channel_press, args.press_rate)),
+        asyncio.create_task(emulator.generate(emulator.inject_private_start, args.private_rate)),
+    ]
+    try:
+        deadline = time.monotonic() + args.duration if args.duration else None
+        while deadline is None or time.monotonic() < deadline:
+            await asyncio.sleep(args.report_interval)
+            emulator.report()
+    finally:
+        for task in generators: task.cancel()
+        emulator.report(final=True)
+        await runner.cleanup()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="本地 Bot API 模拟器 (端到端压测)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--channel-id", type=int, default=-1002, help="与机器人的 CHANNEL_ID 一致")
+    parser.add_argument("--bot-username", default="emu_bot")
+    parser.add_argument("--posts", type=_range, default=(1, 200), help="频道按钮点击的帖子 ID 范围，如 1-200")
+    parser.add_argument("--users", type=int, default=10000, help="合成用户数")
+    parser.add_argument("--press-rate", type=float, default=50, help="频道按钮点击/秒")
+    parser.add_argument("--private-rate", type=float, default=5, help="私聊 /start 每秒")
+    parser.add_argument("--retry-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    parser.add_argument("--max-rps", type=float, default=0, help="全局 API 速率上限，超出返回 429 (0 为不限)")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 retry_after 秒数")
+    parser.add_argument("--duration", type=float, default=0, help="注入持续秒数 (0 为直到 Ctrl+C)")
+    parser.add_argument("--report-interval", type=float, default=5)
+    parser.add_argument("--no-wait", action="store_true", help="不等待机器人连上就开始注入")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
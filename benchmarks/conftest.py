@@ -0,0 +1,159 @@
+# benchmarks/conftest.py
+"""
+处理器级基准测试：直接调用热点处理器，使用记录型假 Bot 和一次性的本地 PostgreSQL 库。
+
+    pip install -r benchmarks/requirements.txt
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/postgres pytest benchmarks
+
+数据规模 (环境变量)：BENCH_POSTS / BENCH_COMMENTS_PER_POST / BENCH_REACTIONS_PER_POST
+本文件导入时会改写环境变量 (DATABASE_URL 等)，根目录的 pytest.ini 已排除 benchmarks/，
+在仓库根目录直接运行 pytest 不会加载它，需要显式指定 pytest benchmarks。
+除 pytest-benchmark 的耗时统计外，每个用例在 extra_info 中给出每次调用的数据库往返次数和 Bot API 调用次数。
+"""
+
+import os
+import asyncio
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+ADMIN_URL = os.environ.get("BENCH_DATABASE_URL", "postgresql://postgres@localhost:5432/postgres")
+BENCH_DB = f"pyouq_bench_{os.getpid()}"
+POSTS = int(os.environ.get("BENCH_POSTS", "200"))
+COMMENTS_PER_POST = int(os.environ.get("BENCH_COMMENTS_PER_POST", "20"))
+REACTIONS_PER_POST = int(os.environ.get("BENCH_REACTIONS_PER_POST", "50"))
+
+CHANNEL_ID = -1002
+ADMIN_GROUP_ID = -1001
+AUTHOR_ID = 1000       # 种子数据里一半的帖子属于这个作者
+
+# 必须在导入项目模块 (config) 之前设置
+os.environ.update(
+    TOKEN="123456:bench",
+    ADMIN_GROUP_ID=str(ADMIN_GROUP_ID),
+    CHANNEL_ID=str(CHANNEL_ID),
+    CHANNEL_USERNAME="bench_channel",
+    DISCUSSION_GROUP_ID="-1003",
+    BOT_USERNAME="bench_bot",
+    DATABASE_URL=urlunsplit(urlsplit(ADMIN_URL)._replace(path=f"/{BENCH_DB}")),
+    EDIT_DEBOUNCE_MS="0",   # 编辑立即发送，便于统计 API 调用
+    METRICS_PORT="1",       # 启用计时连接 (不启动 HTTP 服务)，用于统计数据库往返
+)
+
+import asyncpg  # noqa: E402
+import metrics  # noqa: E402
+from database import get_pool, close_pool, setup_database, rebuild_post_stats, rebuild_hot_scores  # noqa: E402
+from edit_scheduler import edit_scheduler  # noqa: E402
+from benchmarks.fakes import FakeBot  # noqa: E402
+
+SEED_SQL = [
+    """
+    INSERT INTO users (user_id, username, full_name)
+    SELECT 1000 + g, 'author' || g, 'Author ' || g FROM generate_series(0, 49) g
+    """,
+    """
+    INSERT INTO submissions (user_id, user_name, channel_message_id, content_text, timestamp)
+    SELECT CASE WHEN g % 2 = 0 THEN 1000 ELSE 1001 + g % 49 END, 'Author', g, '基准测试作品 ' || g || ' ' || md5(g::text),
+           CURRENT_TIMESTAMP - g * INTERVAL '1 minute'
+    FROM generate_series(1, $1::int) g
+    """,
+    """
+    INSERT INTO comments (channel_message_id, user_id, user_name, comment_text, timestamp)
+    SELECT p, 2000 + c, 'Commenter ' || c, '评论 ' || c || ' ' || md5((p * 1000 + c)::text),
+           CURRENT_TIMESTAMP - c * INTERVAL '1 second'
+    FROM generate_series(1, $1::int) p, generate_series(1, $2::int) c
+    """,
+    # 每个帖子四分之一的评论作为首条评论的楼中楼回复
+    """
+    UPDATE comments c SET parent_id = f.first_id
+    FROM (SELECT channel_message_id, MIN(id) AS first_id FROM comments GROUP BY channel_message_id) f
+    WHERE c.channel_message_id = f.channel_message_id AND c.id <> f.first_id AND c.id % 4 = 0
+    """,
+    """
+    INSERT INTO reactions (channel_message_id, user_id, reaction_type)
+    SELECT p, 3000 + r, CASE WHEN r % 5 = 0 THEN -1 ELSE 1 END
+    FROM generate_series(1, $1::int) p, generate_series(1, $3::int) r
+    """,
+    """
+    INSERT INTO collections (channel_message_id, user_id)
+    SELECT p, 3000 + r FROM generate_series(1, $1::int) p, generate_series(1, $3::int) r WHERE r % 3 = 0
+    """,
+]
+
+
+@pytest.fixture(scope="session")
+def run():
+    """所有异步代码跑在同一个事件循环上 (连接池绑定在这个循环)"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+async def _seed(conn):
+    sizes = (POSTS, COMMENTS_PER_POST, REACTIONS_PER_POST)
+    for sql in SEED_SQL:
+        # 每条语句只传它用到的参数 ($1..$n)
+        used = max((i for i in range(1, 4) if f"${i}" in sql), default=0)
+        await conn.execute(sql, *sizes[:used])
+    await rebuild_post_stats(conn)
+    await rebuild_hot_scores(conn)
+    await conn.execute("ANALYZE")
+
+
+@pytest.fixture(scope="session")
+def bench_db(run):
+    admin = run(asyncpg.connect(ADMIN_URL))
+    run(admin.execute(f'CREATE DATABASE "{BENCH_DB}"'))
+    try:
+        run(setup_database(None))
+        pool = run(get_pool())
+
+        async def seed():
+            async with pool.acquire() as conn:
+                await _seed(conn)
+        run(seed())
+        yield pool
+    finally:
+        run(close_pool())
+        run(admin.execute(f'DROP DATABASE IF EXISTS "{BENCH_DB}"'))
+        run(admin.close())
+
+
+@pytest.fixture
+def bot():
+    return FakeBot()
+
+
+def db_round_trips() -> int:
+    return sum(series[2] for series in metrics.DB_LATENCY._series.values())
+
+
+@pytest.fixture
+def measure(run, bot):
+    """
+    measure(benchmark, make_coro)：每轮调用 make_coro() 并等待编辑落地，
+    额外记录每次调用的数据库往返次数和 Bot API 调用次数。
+    """
+    def _measure(benchmark, make_coro, rounds: int = 50):
+        totals = {"calls": 0, "db": 0, "api": 0}
+
+        def once():
+            db_before = db_round_trips()
+            api_before = bot.count()
+            run(make_coro())
+            run(edit_scheduler.drain())
+            totals["calls"] += 1
+            totals["db"] += db_round_trips() - db_before
+            totals["api"] += bot.count() - api_before
+
+        benchmark.pedantic(once, rounds=rounds, iterations=1, warmup_rounds=1)
+        benchmark.extra_info["db_round_trips_per_call"] = round(totals["db"] / totals["calls"], 2)
+        benchmark.extra_info["api_calls_per_call"] = round(totals["api"] / totals["calls"], 2)
+        benchmark.extra_info["data_size"] = f"{POSTS} posts x {COMMENTS_PER_POST} comments x {REACTIONS_PER_POST} reactions"
+        return benchmark.extra_info
+    return _measure
+
+
+def pytest_report_header(config):
+    return f"bench data: {POSTS} posts, {COMMENTS_PER_POST} comments/post, {REACTIONS_PER_POST} reactions/post"
+
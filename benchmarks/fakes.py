@@ -0,0 +1,88 @@
+# benchmarks/fakes.py - 基准测试/回放共用的假 Bot 与更新构造工具
+
+import itertools
+from types import SimpleNamespace
+from telegram import Update
+
+
+class FakeBot:
+    """
+    记录型假 Bot：所有 Bot API 方法都只记录调用，不发网络请求。
+    copy_message / send_message 返回带递增 message_id 的消息对象。
+    """
+
+    def __init__(self, username: str = "bench_bot", first_message_id: int = 10_000_000):
+        self.username = username
+        self.id = 1
+        self.defaults = None
+        self.calls = []
+        self._message_ids = itertools.count(first_message_id)
+
+    def reset(self):
+        self.calls.clear()
+
+    def count(self, method: str = None) -> int:
+        if method is None: return len(self.calls)
+        return sum(1 for name, _ in self.calls if name == method)
+
+    def _message(self, chat_id):
+        return SimpleNamespace(message_id=next(self._message_ids), chat_id=chat_id)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.calls.append(("copy_message", kwargs))
+        return self._message(chat_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(("send_message", kwargs))
+        return self._message(chat_id)
+
+    def __getattr__(self, name):
+        if name.startswith("_"): raise AttributeError(name)
+
+        async def api_call(*args, **kwargs):
+            self.calls.append((name, kwargs))
+            return True
+        return api_call
+
+
+class FakeContext:
+    """处理器只用到 bot / user_data / chat_data / bot_data / args"""
+
+    def __init__(self, bot, user_data=None, args=None):
+        self.bot = bot
+        self.user_data = user_data if user_data is not None else {}
+        self.chat_data = {}
+        self.bot_data = {}
+        self.args = args or []
+        self.application = None
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int, name: str = "Bench"):
+    return {"id": user_id, "is_bot": False, "first_name": name, "username": f"user{user_id}"}
+
+
+def callback_update(bot, user_id: int, data: str, chat_id: int, chat_type: str, message_id: int,
+                    caption: str = None, text: str = None) -> Update:
+    message = {"message_id": message_id, "date": 0, "chat": {"id": chat_id, "type": chat_type, "title": "bench"}}
+    if caption is not None: message["caption"] = caption
+    if text is not None: message["text"] = text
+    return Update.de_json({
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)), "from": _user(user_id), "chat_instance": "bench",
+            "data": data, "message": message,
+        },
+    }, bot)
+
+
+def message_update(bot, user_id: int, text: str) -> Update:
+    return Update.de_json({
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids), "date": 0, "text": text,
+            "chat": {"id": user_id, "type": "private", "first_name": "Bench"}, "from": _user(user_id),
+        },
+    }, bot)
@@ -0,0 +1,130 @@
+# benchmarks/replay.py
+"""
+确定性回放：把 UPDATE_RECORD_PATH 录下的更新按原始节奏 (或加速) 喂给 main.py 构建的 Application，
+Bot API 由进程内的模拟器应答，用于在不同代码版本之间对比吞吐和数据库负载。
+
+    python -m benchmarks.replay capture.jsonl --speed 1      # 原速
+    python -m benchmarks.replay capture.jsonl --speed 10     # 10 倍速
+    python -m benchmarks.replay capture.jsonl --speed max    # 不等待，尽快喂入
+
+需要与录制时相同的环境变量 (TOKEN / CHANNEL_ID / DATABASE_URL ...)，DATABASE_URL 应指向库的副本：
+回放会真实写入点赞、评论等数据。输出：处理速率、端到端延迟 p50/p99、每个更新的 API 调用数与数据库负载。
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+
+from benchmarks.bot_api_emulator import BotApiEmulator, parse_args as emulator_args, start_server, percentile
+
+DB_STATS_SQL = """
+    SELECT xact_commit, tup_returned, tup_fetched, tup_inserted + tup_updated + tup_deleted AS tup_written,
+           blks_hit, blks_read
+    FROM pg_stat_database WHERE datname = current_database()
+"""
+
+
+def load_capture(path: str, limit: int = 0) -> list:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+                if limit and len(records) >= limit: break
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+async def db_stats(pool) -> dict:
+    async with pool.acquire() as conn:
+        await conn.execute("SELECT pg_stat_clear_snapshot()")
+        return dict(await conn.fetchrow(DB_STATS_SQL))
+
+
+async def replay(args):
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        print("❌ 录制文件为空")
+        return
+    emulator = BotApiEmulator(emulator_args([
+        "--press-rate", "0", "--private-rate", "0",
+        "--channel-id", os.environ.get("CHANNEL_ID", "-1002"),
+        "--retry-rate", str(args.retry_rate),
+    ]))
+    runner, port = await start_server(emulator, "127.0.0.1", 0)
+    os.environ["BOT_API_BASE_URL"] = f"http://127.0.0.1:{port}/bot"
+
+    # 必须在设置 BOT_API_BASE_URL 之后导入 (config 在导入时读取环境变量)
+    from telegram import Update
+    from main import build_application
+    from database import get_pool, close_pool
+    from edit_scheduler import edit_scheduler
+    from cluster import stop_invalidation_listener
+    from metrics import stop_metrics_server
+
+    application = build_application("webhook")
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        pool = await get_pool()
+        processor = application.update_processor
+        try:
+            before = await db_stats(pool)
+            processed_before = processor.processed
+            emulator.api_calls = 0
+            emulator.calls_by_method.clear()
+            started = time.monotonic()
+            first_at = records[0]["t"]
+            print(f"▶️ 回放 {len(records)} 个更新 (速度: {args.speed})", flush=True)
+
+            for record in records:
+                if speed:
+                    delay = started + (record["t"] - first_at) / speed - time.monotonic()
+                    if delay > 0: await asyncio.sleep(delay)
+                emulator.track(record["u"])
+                await application.update_queue.put(Update.de_json(record["u"], application.bot))
+            fed_at = time.monotonic()
+
+            # 等全部处理完，并等合并编辑落地
+            while processor.processed - processed_before < len(records):
+                await asyncio.sleep(0.01)
+            await edit_scheduler.drain()
+            elapsed = time.monotonic() - started
+
+            await asyncio.sleep(1)   # 等统计信息落到 pg_stat_database
+            after = await db_stats(pool)
+        finally:
+            await application.stop()
+            await stop_invalidation_listener()
+            await stop_metrics_server()
+    await close_pool()
+    await runner.cleanup()
+
+    n = len(records)
+    span = records[-1]["t"] - first_at
+    print(f"✅ 完成：{n} 个更新，录制时长 {span:.1f}s，回放 {elapsed:.2f}s (喂入 {fed_at - started:.2f}s)")
+    print(f"   处理速率      {n / elapsed:10.1f} upd/s")
+    print(f"   端到端延迟    p50 {percentile(emulator.latencies, 0.5) * 1000:.1f}ms  "
+          f"p99 {percentile(emulator.latencies, 0.99) * 1000:.1f}ms  (样本 {len(emulator.latencies)}，"
+          f"回调应答 p50 {percentile(emulator.ack_latencies, 0.5) * 1000:.1f}ms)")
+    print(f"   API 调用/更新 {emulator.api_calls / n:10.2f}  (429: {emulator.throttled})")
+    for key in before:
+        print(f"   {key + '/更新':<16}{(after[key] - before[key]) / n:10.2f}")
+    for method, count in sorted(emulator.calls_by_method.items(), key=lambda item: -item[1]):
+        print(f"     {method:<24} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的更新流")
+    parser.add_argument("capture", help="UPDATE_RECORD_PATH 录制的 JSON 行文件")
+    parser.add_argument("--speed", default="1", help="回放倍速，max 为不等待")
+    parser.add_argument("--limit", type=int, default=0, help="只回放前 N 个更新")
+    parser.add_argument("--retry-rate", type=float, default=0.0, help="模拟器随机返回 429 的比例")
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
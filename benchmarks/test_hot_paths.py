@@ -0,0 +1,82 @@
+# benchmarks/test_hot_paths.py - 热点处理器基准
+
+import itertools
+
+import pytest
+
+from handlers.channel_interact import handle_channel_interaction, build_threaded_comment_section, comment_section_cache
+from handlers.submission import navigate_my_posts, _page_callback, MY_POSTS_SQL, _fetch_keyset_page
+from handlers.commenting import handle_new_comment
+from handlers.approval import handle_approval
+from benchmarks.conftest import CHANNEL_ID, ADMIN_GROUP_ID, AUTHOR_ID, POSTS
+from benchmarks.fakes import FakeContext, callback_update, message_update
+
+BENCH_USER = 9_000_000   # 种子数据里没有的新用户，点赞/评论都由它发起
+HOT_POST = 1             # 评论/反应最多、最新的帖子
+
+
+@pytest.mark.parametrize("action", ["react:like", "collect"])
+def test_channel_interaction_toggle(benchmark, bench_db, bot, measure, action):
+    """频道点赞/收藏：锁 + 计数 + 渲染 + 合并编辑 (连续点击即来回切换)"""
+    data = f"{action}:{HOT_POST}"
+    measure(benchmark, lambda: handle_channel_interaction(
+        callback_update(bot, BENCH_USER, data, CHANNEL_ID, "channel", HOT_POST), FakeContext(bot)))
+
+
+def test_channel_interaction_show_comments(benchmark, bench_db, bot, measure):
+    """展开评论区 (第一次之后走评论区缓存)"""
+    measure(benchmark, lambda: handle_channel_interaction(
+        callback_update(bot, BENCH_USER, f"comment:show:{HOT_POST}", CHANNEL_ID, "channel", HOT_POST), FakeContext(bot)))
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["cold", "cached"])
+def test_build_threaded_comment_section(benchmark, bench_db, measure, cached):
+    async def build():
+        if not cached:
+            comment_section_cache.clear()
+        async with bench_db.acquire() as conn:
+            await build_threaded_comment_section(conn, HOT_POST)
+    measure(benchmark, build)
+
+
+@pytest.mark.parametrize("page", [1, 3])
+def test_navigate_my_posts(benchmark, bench_db, bot, measure, run, page):
+    data = "my_posts_page:1"
+    if page > 1:
+        # 先取到目标页前一页的最后一行作为游标，和真实翻页按钮完全一致
+        async def cursor():
+            rows, cursor_row = [], None
+            async with bench_db.acquire() as conn:
+                for _ in range(page - 1):
+                    rows, _ = await _fetch_keyset_page(conn, MY_POSTS_SQL, AUTHOR_ID, "n" if cursor_row else None, cursor_row)
+                    if not rows:
+                        return None
+                    last = rows[-1]
+                    cursor_row = (last['timestamp'], last['id'])
+            return _page_callback("my_posts_page", page, "n", rows[-1])
+        data = run(cursor())
+        if data is None:
+            pytest.skip("数据量不足以翻到该页")
+    context = FakeContext(bot)
+    measure(benchmark, lambda: navigate_my_posts(
+        callback_update(bot, AUTHOR_ID, data, AUTHOR_ID, "private", 1, text="menu"), context))
+
+
+def test_handle_new_comment(benchmark, bench_db, bot, measure):
+    """发表评论：写库 (同一事务更新计数、记录通知事件) + 失效评论区缓存 + 回复返回按钮"""
+    def new_comment():
+        context = FakeContext(bot, user_data={'commenting_on_message_id': HOT_POST})
+        return handle_new_comment(message_update(bot, BENCH_USER, "基准测试评论"), context)
+    measure(benchmark, new_comment)
+
+
+def test_handle_approval(benchmark, bench_db, bot, measure):
+    """审核通过：复制到频道 + 写投稿 + 初始按钮 + 回写审核群"""
+    source_ids = itertools.count(1)
+    caption = f"新投稿来自 Author 0 (ID: {AUTHOR_ID})\n\n基准测试投稿内容"
+
+    def approve():
+        data = f"approve:{AUTHOR_ID}:{next(source_ids)}"
+        return handle_approval(callback_update(bot, BENCH_USER, data, ADMIN_GROUP_ID, "supergroup", 1, caption=caption),
+                               FakeContext(bot))
+    measure(benchmark, approve, rounds=min(50, POSTS))
@@ -0,0 +1,96 @@
+# cache.py
+
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """进程内有界 LRU 缓存，带命中/未命中/淘汰计数"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 每次失效递增；渲染开始前记下，写回时对不上说明期间发生过失效，丢弃旧结果
+        self.epoch = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, epoch: int = None):
+        if self.maxsize <= 0: return
+        if epoch is not None and epoch != self.epoch: return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self.epoch += 1
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate) -> int:
+        """按条件批量失效，返回移除的条目数"""
+        self.epoch += 1
+        keys = [k for k in self._data if predicate(k)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def invalidate_items(self, predicate) -> int:
+        """按 (键, 值) 条件批量失效，返回移除的条目数"""
+        self.epoch += 1
+        keys = [k for k, v in self._data.items() if predicate(k, v)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def clear(self):
+        self.epoch += 1
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TTLCache(LRUCache):
+    """带过期时间的有界 LRU 缓存"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            # 过期视为未命中
+            self._data.pop(key, None)
+            self.hits -= 1
+            self.misses += 1
+            return default
+        return value
+
+    def put(self, key, value, epoch: int = None):
+        super().put(key, (time.monotonic() + self.ttl, value), epoch=epoch)
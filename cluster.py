@@ -0,0 +1,281 @@
+# cluster.py
+
+import os
+import sys
+import json
+import hmac
+import signal
+import asyncio
+import secrets
+import logging
+from typing import Optional
+import aiohttp
+import asyncpg
+from aiohttp import web
+from telegram import Bot, Update
+
+from config import (
+    TOKEN,
+    DATABASE_URL,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WORKER_PROCESSES,
+    WORKER_BASE_PORT,
+    BOT_API_BASE_URL,
+)
+from webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache_invalidate"
+NOTIFY_PAYLOAD_LIMIT = 7000     # NOTIFY 载荷上限 8000 字节，批量广播按此分片
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+# ==================== 跨进程缓存失效 ====================
+
+_invalidators = {}   # kind -> 本进程内的失效函数 (参数为 key)
+_batch_invalidators = {}   # kind -> 本进程内的批量失效函数 (参数为 key 列表)
+_listener_conn = None
+
+
+def register_invalidator(kind: str, func):
+    """注册一类缓存的本地失效函数，收到其他进程的广播时调用"""
+    _invalidators[kind] = func
+
+
+def register_batch_invalidator(kind: str, func):
+    """注册一类按 key 列表批量失效的本地函数，配合 publish_invalidation_batch 使用"""
+    _batch_invalidators[kind] = func
+
+
+async def publish_invalidation(conn, kind: str, key: int):
+    """多进程模式下广播缓存失效 (NOTIFY 随所在事务提交才送达)"""
+    if WORKER_PROCESSES <= 1: return
+    await conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, f"{kind}:{key}")
+
+
+async def publish_invalidation_batch(conn, kind: str, keys):
+    """多进程模式下一次广播一批 key：载荷为 kind:k1,k2,...，超长时分片，全部分片只用一条语句"""
+    if WORKER_PROCESSES <= 1 or not keys: return
+    payloads, chunk, size = [], [], 0
+    for key in keys:
+        text = str(key)
+        if chunk and size + len(text) + 1 > NOTIFY_PAYLOAD_LIMIT:
+            payloads.append(f"{kind}:{','.join(chunk)}")
+            chunk, size = [], 0
+        chunk.append(text)
+        size += len(text) + 1
+    payloads.append(f"{kind}:{','.join(chunk)}")
+    await conn.execute("SELECT pg_notify($1, p) FROM unnest($2::text[]) AS p", INVALIDATION_CHANNEL, payloads)
+
+
+def invalidate_local(kind: str, key: int):
+    """在本进程内执行一类缓存的失效 (供无法直接引用该缓存的模块使用)"""
+    func = _invalidators.get(kind)
+    if func is not None:
+        func(key)
+
+
+def _on_invalidation(conn, pid, channel, payload):
+    kind, _, key = payload.partition(":")
+    try:
+        batch = _batch_invalidators.get(kind)
+        if batch is not None:
+            batch([int(k) for k in key.split(",")])
+            return
+        invalidate_local(kind, int(key))
+    except Exception as e:
+        logger.warning(f"⚠️ 处理缓存失效广播失败 {payload}: {e}")
+
+
+async def start_invalidation_listener():
+    """LISTEN 需要独占连接，不从连接池借"""
+    global _listener_conn
+    if WORKER_PROCESSES <= 1 or _listener_conn is not None: return
+    _listener_conn = await asyncpg.connect(dsn=DATABASE_URL)
+    await _listener_conn.add_listener(INVALIDATION_CHANNEL, _on_invalidation)
+    logger.info("✅ 已订阅跨进程缓存失效广播")
+
+
+async def stop_invalidation_listener():
+    global _listener_conn
+    if _listener_conn is None: return
+    await _listener_conn.close()
+    _listener_conn = None
+
+
+# ==================== 入口分发 ====================
+
+_CHAT_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post",
+                "my_chat_member", "chat_member", "chat_join_request")
+_USER_FIELDS = ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query")
+
+
+def route_key(data: dict) -> Optional[int]:
+    """
+    返回分发用的粘滞 key：私聊/群组按 chat 固定到同一 worker (对话状态在进程内)；
+    频道按钮回调返回 None，可发给任意 worker (由帖子级 advisory 锁保证正确性)
+    """
+    query = data.get("callback_query")
+    if query:
+        chat = (query.get("message") or {}).get("chat") or {}
+        if chat.get("type") == "channel": return None
+        return chat.get("id") or query["from"]["id"]
+    for field in _CHAT_FIELDS:
+        obj = data.get(field)
+        if obj and "chat" in obj: return obj["chat"]["id"]
+    for field in _USER_FIELDS:
+        obj = data.get(field)
+        if obj and "from" in obj: return obj["from"]["id"]
+    return None
+
+
+class Supervisor:
+    """
+    多进程模式的主进程：
+    启动 N 个 worker (各自以本地 webhook 模式运行)，对外只暴露一个 webhook 入口并按 route_key 分发。
+    worker 0 为主 worker：负责建表迁移和后台定时任务，先于其他 worker 启动。
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.internal_secret = secrets.token_hex(16)
+        self._procs = [None] * workers
+        self._stopping = False
+        self._rr = 0
+        self._session = None
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post(WEBHOOK_PATH, self.handle_update)
+        self.app.router.add_get("/healthz", self.handle_health)
+
+    def _worker_url(self, index: int, path: str) -> str:
+        return f"http://127.0.0.1:{WORKER_BASE_PORT + index}{path}"
+
+    def pick_worker(self, data: dict) -> int:
+        key = route_key(data)
+        if key is None:
+            self._rr = (self._rr + 1) % self.workers
+            return self._rr
+        return key % self.workers
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), WEBHOOK_SECRET):
+            return web.Response(status=403)
+        body = await request.read()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        index = self.pick_worker(data)
+        try:
+            async with self._session.post(
+                self._worker_url(index, WEBHOOK_PATH), data=body,
+                headers={SECRET_HEADER: self.internal_secret, "Content-Type": "application/json"},
+            ) as resp:
+                # 透传 worker 的 503，让 Telegram 稍后重投
+                return web.Response(status=resp.status, headers={"Retry-After": "1"} if resp.status == 503 else None)
+        except aiohttp.ClientError as e:
+            logger.warning(f"⚠️ 转发到 worker {index} 失败: {e}")
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+    async def _worker_health(self, index: int) -> Optional[dict]:
+        try:
+            async with self._session.get(self._worker_url(index, "/healthz")) as resp:
+                return await resp.json() if resp.status == 200 else None
+        except (aiohttp.ClientError, ValueError):
+            return None
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        states = await asyncio.gather(*(self._worker_health(i) for i in range(self.workers)))
+        healthy = all(states)
+        return web.json_response(
+            {"status": "ok" if healthy else "degraded", "workers": states},
+            status=200 if healthy else 503,
+        )
+
+    async def _spawn(self, index: int):
+        env = dict(
+            os.environ,
+            BOT_MODE="webhook",
+            WORKER_INDEX=str(index),
+            WEBHOOK_URL="",
+            WEBHOOK_LISTEN="127.0.0.1",
+            WEBHOOK_PORT=str(WORKER_BASE_PORT + index),
+            WEBHOOK_SECRET=self.internal_secret,
+        )
+        self._procs[index] = await asyncio.create_subprocess_exec(sys.executable, MAIN_SCRIPT, env=env)
+        logger.info(f"👷 worker {index} 已启动 (pid {self._procs[index].pid})")
+
+    async def _wait_ready(self, index: int, timeout: float = 60):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            if await self._worker_health(index): return
+            if self._procs[index].returncode is not None:
+                raise RuntimeError(f"worker {index} 启动失败 (退出码 {self._procs[index].returncode})")
+            await asyncio.sleep(0.5)
+        raise RuntimeError(f"worker {index} 启动超时")
+
+    async def _monitor(self, index: int):
+        """worker 意外退出时自动拉起"""
+        while not self._stopping:
+            code = await self._procs[index].wait()
+            if self._stopping: break
+            logger.error(f"❌ worker {index} 退出 (退出码 {code})，2 秒后重启")
+            await asyncio.sleep(2)
+            await self._spawn(index)
+
+    async def run(self):
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        monitors = []
+        try:
+            # worker 0 先完成建表迁移，其余 worker 再并行启动
+            await self._spawn(0)
+            await self._wait_ready(0)
+            await asyncio.gather(*(self._spawn(i) for i in range(1, self.workers)))
+            await asyncio.gather(*(self._wait_ready(i) for i in range(1, self.workers)))
+            monitors = [asyncio.create_task(self._monitor(i)) for i in range(self.workers)]
+
+            self._runner = web.AppRunner(self.app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+            logger.info(f"🌐 入口已监听 {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}，{self.workers} 个 worker")
+
+            if WEBHOOK_URL:
+                bot = Bot(TOKEN, base_url=BOT_API_BASE_URL) if BOT_API_BASE_URL else Bot(TOKEN)
+                async with bot:
+                    await bot.set_webhook(
+                        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                        secret_token=WEBHOOK_SECRET or None,
+                        allowed_updates=Update.ALL_TYPES,
+                    )
+                logger.info(f"✅ 已设置 Webhook: {WEBHOOK_URL}")
+
+            await stop_event.wait()
+        finally:
+            self._stopping = True
+            for task in monitors:
+                task.cancel()
+            if self._runner:
+                await self._runner.cleanup()
+            for proc in self._procs:
+                if proc and proc.returncode is None:
+                    proc.send_signal(signal.SIGTERM)
+            await asyncio.gather(*(proc.wait() for proc in self._procs if proc))
+            await self._session.close()
+            logger.info("🛑 所有 worker 已退出")
+
+
+def run_supervisor():
+    asyncio.run(Supervisor(WORKER_PROCESSES).run())
@@ -26,5 +26,93 @@ except KeyError as e:
     BROWSING_COLLECTIONS, 
     COMMENTING,
     DELETING_COMMENT,
-    DELETING_WORK
-) = range(9)
+    DELETING_WORK,
+    SEARCHING             # 等待输入搜索关键词
+) = range(10)
+
+# --- 性能调优 (可选，均有默认值) ---
+EDIT_DEBOUNCE_MS = int(os.environ.get('EDIT_DEBOUNCE_MS', '500'))   # 频道消息编辑合并窗口
+COMMENT_CACHE_SIZE = int(os.environ.get('COMMENT_CACHE_SIZE', '1024'))  # 评论区渲染缓存条目上限
+BASE_CAPTION_CACHE_SIZE = int(os.environ.get('BASE_CAPTION_CACHE_SIZE', '4096'))  # 帖子正文+页脚缓存条目上限
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))     # 用户目录内存缓存条目上限
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '3600'))        # 用户目录内存缓存有效期 (秒)
+USER_REFRESH_INTERVAL = int(os.environ.get('USER_REFRESH_INTERVAL', '600'))  # 后台刷新作者资料的周期 (秒)
+USER_REFRESH_MAX_AGE = int(os.environ.get('USER_REFRESH_MAX_AGE', '604800')) # 作者资料超过多久视为过期 (秒)
+OUTBOX_PER_CHAT_INTERVAL = float(os.environ.get('OUTBOX_PER_CHAT_INTERVAL', '1'))  # 同一用户两条私信的最小间隔 (秒)
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '50'))              # 每批领取的私信数
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1'))       # 空闲时轮询发件箱的间隔 (秒)
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))           # 单条私信最多重试次数
+NOTIFY_AGGREGATE_WINDOW = int(os.environ.get('NOTIFY_AGGREGATE_WINDOW', '60'))  # 同一帖子的互动通知合并窗口 (秒)
+NOTIFY_DIGEST_INTERVAL = int(os.environ.get('NOTIFY_DIGEST_INTERVAL', '3600'))  # 汇总模式的发送周期 (秒)
+USER_TOTAL_CACHE_TTL = int(os.environ.get('USER_TOTAL_CACHE_TTL', '300'))     # "我的收藏" 总数缓存有效期 (秒)
+RECONCILE_INTERVAL = int(os.environ.get('RECONCILE_INTERVAL', '300'))        # 巡检已删除频道帖子的周期 (秒)
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '30'))     # 每轮巡检的帖子数
+RECONCILE_RATE = float(os.environ.get('RECONCILE_RATE', '1'))                # 巡检探测速率 (次/秒)，必须大于 0
+if RECONCILE_RATE <= 0:
+    raise RuntimeError("错误: RECONCILE_RATE 必须大于 0。")
+# 开启后 comments/reactions/collections/pinned_posts 通过外键级联到 submissions，
+# 未在 submissions 中登记的频道帖子仍可展开评论区，但点赞/收藏/评论会提示"未登记"并被拒绝
+POST_FOREIGN_KEYS = os.environ.get('POST_FOREIGN_KEYS', '').lower() in ('1', 'true', 'yes')
+
+# --- 运行模式 ---
+BOT_MODE = os.environ.get('BOT_MODE', 'polling').lower()                    # polling (本地开发) / webhook
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')                             # 公网地址，为空时不调用 setWebhook (本地测试)
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')                       # X-Telegram-Bot-Api-Secret-Token
+INGRESS_QUEUE_SIZE = int(os.environ.get('INGRESS_QUEUE_SIZE', '1000'))      # 待处理更新上限 (含处理器中排队/处理中的)，webhook 满了返回 503
+
+# --- 数据库连接池 ---
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))            # 多进程时为每个 worker 的上限，总数不要超过 max_connections
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '256'))  # 每个连接缓存的预编译语句数，0 为关闭 (PgBouncer 事务模式)
+DB_COMMAND_TIMEOUT = float(os.environ.get('DB_COMMAND_TIMEOUT', '60'))      # 单条语句客户端超时 (秒)，0 为不限
+DB_MAX_INACTIVE_LIFETIME = float(os.environ.get('DB_MAX_INACTIVE_LIFETIME', '300'))  # 空闲连接超过该时间 (秒) 后关闭
+
+# --- 多进程 (仅 webhook 模式) ---
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', '1'))             # >1 时由主进程接收 webhook 并分发给 N 个 worker
+WORKER_INDEX = int(os.environ.get('WORKER_INDEX', '-1'))                    # 由主进程设置，-1 表示非 worker 进程
+WORKER_BASE_PORT = int(os.environ.get('WORKER_BASE_PORT', '18600'))         # worker i 监听 127.0.0.1:(BASE + i)
+if WORKER_PROCESSES > 1 and BOT_MODE != 'webhook':
+    # 多个进程对同一 token 调用 getUpdates 会被 Telegram 以 Conflict 拒绝
+    raise RuntimeError("错误: WORKER_PROCESSES > 1 仅支持 BOT_MODE=webhook。")
+
+# --- 并发处理 ---
+MAX_CONCURRENT_UPDATES = int(os.environ.get('MAX_CONCURRENT_UPDATES', '64'))  # 同时处理的更新上限 (同一会话/同一帖子仍按顺序)
+
+# --- 热度榜 / 自动置顶 ---
+HOT_HALF_LIFE_HOURS = float(os.environ.get('HOT_HALF_LIFE_HOURS', '24'))    # 热度半衰期
+HOT_WEIGHT_LIKE = float(os.environ.get('HOT_WEIGHT_LIKE', '1'))
+HOT_WEIGHT_COLLECT = float(os.environ.get('HOT_WEIGHT_COLLECT', '2'))
+HOT_WEIGHT_COMMENT = float(os.environ.get('HOT_WEIGHT_COMMENT', '1.5'))  # 权重设为 0 即不计入该信号
+TRENDING_TOP_K = int(os.environ.get('TRENDING_TOP_K', '3'))                 # 同时置顶的热帖数
+TRENDING_MIN_SCORE = float(os.environ.get('TRENDING_MIN_SCORE', '30'))      # 置顶门槛 (当前衰减后的热度)
+TRENDING_INTERVAL = int(os.environ.get('TRENDING_INTERVAL', '300'))         # 置顶集合刷新间隔 (秒)
+# 热度按对数存储：权重不能为负，半衰期和置顶门槛必须为正
+if min(HOT_WEIGHT_LIKE, HOT_WEIGHT_COLLECT, HOT_WEIGHT_COMMENT) < 0 or HOT_HALF_LIFE_HOURS <= 0 or TRENDING_MIN_SCORE <= 0:
+    raise RuntimeError("错误: HOT_WEIGHT_* 不能为负数，HOT_HALF_LIFE_HOURS / TRENDING_MIN_SCORE 必须大于 0。")
+
+# --- 排行榜 ---
+LEADERBOARD_INTERVAL = int(os.environ.get('LEADERBOARD_INTERVAL', '300'))   # 汇总表增量刷新间隔 (秒)
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', '10'))
+
+# --- 搜索 ---
+SEARCH_TIMEOUT_MS = int(os.environ.get('SEARCH_TIMEOUT_MS', '3000'))        # 单次搜索的语句超时，保证最坏延迟有界 (中文搜索要求数据库为 UTF-8 区域，见 database.py)
+
+# --- 监控 ---
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))                     # >0 时在 127.0.0.1 上暴露 /metrics (多进程时 worker i 使用 PORT + i)
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', '0'))                   # 慢查询阈值 (毫秒)，0 为关闭；运行中可用 /slowlog 调整
+SLOW_QUERY_SAMPLE = float(os.environ.get('SLOW_QUERY_SAMPLE', '0.1'))       # 慢查询中抓取 EXPLAIN ANALYZE 的比例
+SLOW_QUERY_PLAN_FILE = os.environ.get('SLOW_QUERY_PLAN_FILE', 'slow_query_plans.log')
+
+# --- Bot API 请求 ---
+BOT_API_PROXY = os.environ.get('BOT_API_PROXY', '')                         # 例如 http://127.0.0.1:7890，空为直连
+BOT_API_CONNECTION_POOL_SIZE = int(os.environ.get('BOT_API_CONNECTION_POOL_SIZE', '32'))  # HTTP 连接数，同时也是在途请求上限
+BOT_API_GLOBAL_RATE = float(os.environ.get('BOT_API_GLOBAL_RATE', '30'))    # 全局每秒发消息数 (仅 sendMessage/copyMessage 等，回调应答/编辑不计；私信发件箱也受它限制)，0 为不限
+BOT_API_CHAT_RATE = float(os.environ.get('BOT_API_CHAT_RATE', '1'))         # 单个私聊每秒发消息数 (可短时突发 3 条)，0 为不限
+BOT_API_GROUP_RATE = float(os.environ.get('BOT_API_GROUP_RATE', '0'))       # 单个群/频道每秒发消息数，0 为不限 (频道编辑已由合并器按帖子限频)
+
+# --- 压测 ---
+BOT_API_BASE_URL = os.environ.get('BOT_API_BASE_URL', '')                   # 非空时 Bot API 请求发往该地址 (如本地模拟器 http://127.0.0.1:8081/bot)
+UPDATE_RECORD_PATH = os.environ.get('UPDATE_RECORD_PATH', '')               # 非空时把脱敏后的入站更新追加到该文件 (多进程时加 .worker 序号后缀)
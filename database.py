@@ -1,31 +1,130 @@
 # database.py
 
+import math
+import time
+import asyncio
 import asyncpg
 import logging
+from contextlib import asynccontextmanager
 from telegram.ext import Application
-from config import DATABASE_URL
+from metrics import InstrumentedConnection, MeteredPool
+from config import (
+    DATABASE_URL,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_COMMAND_TIMEOUT,
+    DB_MAX_INACTIVE_LIFETIME,
+    POST_FOREIGN_KEYS,
+    WORKER_PROCESSES,
+    HOT_HALF_LIFE_HOURS,
+    HOT_WEIGHT_LIKE,
+    HOT_WEIGHT_COLLECT,
+    HOT_WEIGHT_COMMENT,
+)
 
 logger = logging.getLogger(__name__)
 
 _pool = None
+_pool_lock = asyncio.Lock()
+
+
+# ==================== 热点语句 ====================
+
+# 名称 -> HotStatement；连接建立时统一预编译，之后按名称直接执行，省去每次的解析/规划
+HOT_STATEMENTS = {}
+
+
+class HotStatement:
+    """注册一条热点语句：await STMT.fetchrow(conn, *args)"""
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        HOT_STATEMENTS[name] = self
+
+    async def fetch(self, conn, *args):
+        return await _run_hot(conn, "fetch", self, args)
+
+    async def fetchrow(self, conn, *args):
+        return await _run_hot(conn, "fetchrow", self, args)
+
+    async def fetchval(self, conn, *args):
+        return await _run_hot(conn, "fetchval", self, args)
+
+
+async def _run_hot(conn, op: str, stmt: HotStatement, args):
+    prepared = getattr(conn, "hot_statements", None)
+    if prepared is None:
+        # 连接池之外的连接 (脚本/专用连接) 或关闭了语句缓存：按普通语句执行
+        return await getattr(conn, op)(stmt.sql, *args)
+    ps = prepared.get(stmt.name)
+    if ps is None:
+        ps = prepared[stmt.name] = await conn.prepare(stmt.sql)
+    try:
+        return await conn._timed(op, lambda _query, *a: getattr(ps, op)(*a), stmt.sql, args, {})
+    except (asyncpg.InvalidCachedStatementError, asyncpg.InvalidSQLStatementNameError):
+        # 表结构变化导致预编译失效：丢弃，下次重新预编译
+        prepared.pop(stmt.name, None)
+        raise
+
+
+class BotConnection(InstrumentedConnection):
+    """连接池连接：带计时，并持有本连接上预编译好的热点语句"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hot_statements = {} if DB_STATEMENT_CACHE_SIZE > 0 else None
+
+
+async def _init_connection(conn) -> None:
+    """新连接：预编译全部热点语句 (新库尚未建表时跳过，首次使用时再预编译)"""
+    if conn.hot_statements is None: return
+    for stmt in HOT_STATEMENTS.values():
+        try:
+            conn.hot_statements[stmt.name] = await conn.prepare(stmt.sql)
+        except asyncpg.PostgresError as e:
+            logger.debug(f"热点语句 {stmt.name} 暂不可预编译: {e}")
+
 
 async def get_pool():
     global _pool
-    if _pool is None:
-        try:
-            _pool = await asyncpg.create_pool(dsn=DATABASE_URL)
-            logger.info("✅ PostgreSQL 连接池已创建")
-        except Exception as e:
-            logger.error(f"❌ 无法连接到数据库: {e}")
-            raise e
+    if _pool is not None:
+        return _pool
+    # 加锁：并发的首次调用只会创建一个连接池
+    async with _pool_lock:
+        if _pool is None:
+            try:
+                # 始终使用带计时的连接类，慢查询日志可在运行中随时开启
+                pool = await asyncpg.create_pool(
+                    dsn=DATABASE_URL,
+                    min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+                    max_size=DB_POOL_MAX_SIZE,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    command_timeout=DB_COMMAND_TIMEOUT or None,
+                    max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+                    connection_class=BotConnection,
+                    init=_init_connection,
+                )
+                _pool = MeteredPool(pool)
+                logger.info(f"✅ PostgreSQL 连接池已创建 (连接数 {DB_POOL_MIN_SIZE}~{DB_POOL_MAX_SIZE}，热点语句 {len(HOT_STATEMENTS)} 条)")
+            except Exception as e:
+                logger.error(f"❌ 无法连接到数据库: {e}")
+                raise e
     return _pool
 
 async def close_pool():
     global _pool
     if _pool:
-        await _pool.close()
+        pool, _pool = _pool, None
+        await pool.close()
         logger.info("🛑 PostgreSQL 连接池已关闭")
 
+
+def pool_stats() -> dict:
+    """连接池占用与等待情况 (尚未创建时返回空字典)"""
+    return _pool.stats() if _pool is not None else {}
+
 async def setup_database(application: Application) -> None:
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -47,6 +146,8 @@ async def setup_database(application: Application) -> None:
             await conn.execute('ALTER TABLE comments ADD COLUMN IF NOT EXISTS parent_id BIGINT')
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_parent ON comments(parent_id)')
             logger.info("✅ 数据库迁移成功: 已添加 parent_id 字段")
+            # 评论区整楼加载 (按帖子 + 楼层 + 时间)
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_thread ON comments(channel_message_id, parent_id, timestamp)')
         except Exception as e:
             logger.warning(f"⚠️ 数据库迁移检查: {e}")
 
@@ -61,6 +162,9 @@ async def setup_database(application: Application) -> None:
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # 审核通过时预渲染的 正文+页脚，caption_version 与模板版本不一致时重新生成
+        await conn.execute('ALTER TABLE submissions ADD COLUMN IF NOT EXISTS base_caption TEXT')
+        await conn.execute('ALTER TABLE submissions ADD COLUMN IF NOT EXISTS caption_version SMALLINT NOT NULL DEFAULT 0')
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS reactions (
                 id SERIAL PRIMARY KEY, 
@@ -88,5 +192,492 @@ async def setup_database(application: Application) -> None:
                 like_count_at_pin INTEGER
             )
         ''')
+        # "我的作品"/"我的收藏" 游标分页用的覆盖索引 (不含 content_text，避免超长文案超出索引行大小)
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_submissions_user_ts ON submissions(user_id, timestamp DESC, id DESC) INCLUDE (channel_message_id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_collections_user_ts ON collections(user_id, timestamp DESC, id DESC) INCLUDE (channel_message_id)')
+        # 计数冗余表：每个帖子一行，与点赞/收藏/评论写入处于同一事务内更新
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS post_stats (
+                channel_message_id BIGINT PRIMARY KEY,
+                likes INTEGER NOT NULL DEFAULT 0,
+                dislikes INTEGER NOT NULL DEFAULT 0,
+                collections INTEGER NOT NULL DEFAULT 0,
+                comments INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # 频道帖子当前是否展开评论区 (后台巡检刷新按钮时保持原样)
+        await conn.execute('ALTER TABLE post_stats ADD COLUMN IF NOT EXISTS comments_open BOOLEAN NOT NULL DEFAULT FALSE')
+        # 渲染序号 (多进程模式下丢弃过期的编辑)
+        await conn.execute('ALTER TABLE post_stats ADD COLUMN IF NOT EXISTS render_seq BIGINT NOT NULL DEFAULT 0')
+        # 热度 (对数空间的衰减累加值，NULL 表示 0) 与置顶状态
+        await conn.execute('ALTER TABLE post_stats ADD COLUMN IF NOT EXISTS hot_score DOUBLE PRECISION')
+        await conn.execute('ALTER TABLE post_stats ADD COLUMN IF NOT EXISTS pinned BOOLEAN NOT NULL DEFAULT FALSE')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_post_stats_hot ON post_stats(hot_score DESC NULLS LAST)')
+        # 后台任务进度 (重启后续跑)
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS reconciler_state (
+                name TEXT PRIMARY KEY,
+                last_id BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # 用户目录：页脚展示作者用户名，避免每次点击都调用 get_chat
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                username TEXT,
+                full_name TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # 私信发件箱：与业务写入同一事务落库，由后台任务限速发送
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                chat_id BIGINT NOT NULL,
+                text TEXT NOT NULL,
+                parse_mode TEXT,
+                reply_markup JSONB,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON notification_outbox(next_attempt_at) WHERE status = 'pending'")
+        await conn.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS dm_blocked BOOLEAN NOT NULL DEFAULT FALSE')
+        # 后台刷新资料连续失败的次数 (已封禁/注销的账号按次数退避)
+        await conn.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS refresh_failures SMALLINT NOT NULL DEFAULT 0')
+
+        # 互动通知缓冲：按 (作者, 帖子) 合并或按作者汇总后再写入发件箱
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS notification_events (
+                id BIGSERIAL PRIMARY KEY,
+                author_id BIGINT NOT NULL,
+                channel_message_id BIGINT NOT NULL,
+                action TEXT NOT NULL,
+                actor_id BIGINT NOT NULL,
+                actor_name TEXT,
+                content_preview TEXT,
+                detail TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_notification_events_author ON notification_events(author_id, channel_message_id)')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS notification_prefs (
+                user_id BIGINT PRIMARY KEY,
+                mode TEXT NOT NULL DEFAULT 'instant'
+            )
+        ''')
+
+        # 排行榜：点赞/收藏的增减流水 (追加写入，由汇总任务消费后删除) 与按作者/天的汇总表
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS activity_log (
+                id BIGSERIAL PRIMARY KEY,
+                channel_message_id BIGINT NOT NULL,
+                kind TEXT NOT NULL,
+                delta SMALLINT NOT NULL,
+                txid BIGINT NOT NULL DEFAULT txid_current(),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_activity_log_txid ON activity_log(txid)')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS author_activity_daily (
+                author_id BIGINT NOT NULL,
+                day DATE NOT NULL,
+                likes INTEGER NOT NULL DEFAULT 0,
+                collections INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (author_id, day)
+            )
+        ''')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_author_activity_day ON author_activity_daily(day)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_post_stats_collections ON post_stats(collections DESC)')
+
+        # 搜索：pg_trgm GIN 索引支持任意位置的子串匹配 (中文无需分词)
+        # pg_trgm 按数据库的 LC_CTYPE 判断哪些字符属于"单词"：C/POSIX 下中文字符会被丢弃，
+        # 中文关键词提取不出三元组，只能全表扫描。数据库需使用 UTF-8 区域 (如 zh_CN.UTF-8、en_US.UTF-8)
+        ctype = await conn.fetchval("SELECT datctype FROM pg_database WHERE datname = current_database()")
+        if ctype in ("C", "POSIX"):
+            logger.warning(f"⚠️ 数据库 LC_CTYPE 为 {ctype}，pg_trgm 无法索引中文，中文搜索会退化为全表扫描")
+        try:
+            await conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_submissions_content_trgm ON submissions USING gin (content_text gin_trgm_ops)')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_text_trgm ON comments USING gin (comment_text gin_trgm_ops)')
+        except Exception as e:
+            logger.warning(f"⚠️ 无法启用 pg_trgm，搜索将退化为全表扫描: {e}")
+
+        # 可选外键：删除 submissions 时级联删除子表 (NOT VALID 跳过存量数据校验)
+        if POST_FOREIGN_KEYS:
+            for table in ("comments", "reactions", "collections", "pinned_posts"):
+                await conn.execute(f'''
+                    DO $$ BEGIN
+                        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'fk_{table}_post') THEN
+                            ALTER TABLE {table} ADD CONSTRAINT fk_{table}_post
+                                FOREIGN KEY (channel_message_id) REFERENCES submissions(channel_message_id)
+                                ON DELETE CASCADE NOT VALID;
+                        END IF;
+                    END $$
+                ''')
+            logger.info("✅ 已启用帖子外键级联删除")
+
+        # 点赞/收藏切换：单条语句完成 "读取旧状态 + 写入 + 更新计数"，并发点击由行锁和 ON CONFLICT 兜底
+        # hot_add 增加了事件时间参数，旧的两参数版本与新版本并存会造成调用歧义
+        await conn.execute("DROP FUNCTION IF EXISTS hot_add(double precision, double precision)")
+        await conn.execute(HOT_ADD_FUNCTION)
+        # 旧版本函数的返回列不同，CREATE OR REPLACE 无法修改返回类型，需要先删除
+        for signature in ("toggle_reaction(bigint, bigint, integer)", "toggle_collection(bigint, bigint)"):
+            result = await conn.fetchval("SELECT pg_get_function_result(to_regprocedure($1))", signature)
+            if result and "is_pinned" not in result:
+                await conn.execute(f"DROP FUNCTION {signature}")
+        await conn.execute(TOGGLE_REACTION_FUNCTION)
+        await conn.execute(TOGGLE_COLLECTION_FUNCTION)
+
+        # 首次上线时 post_stats 为空，自动回填一次
+        if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM post_stats)"):
+            filled = await rebuild_post_stats(conn)
+            logger.info(f"✅ post_stats 首次回填完成: {filled} 个帖子")
+        # 热度字段上线时按明细表的时间戳回填一次，并同步已有的置顶记录
+        if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM post_stats WHERE hot_score IS NOT NULL)"):
+            filled = await rebuild_hot_scores(conn)
+            logger.info(f"✅ 热度首次回填完成: {filled} 个帖子")
+        # 汇总表上线时从明细表回填最近 30 天。回填与清理 activity_log 使用同一快照 (可重复读)：
+        # 快照内可见的流水已经体现在明细表里，删掉以免 refresh_rollups 再计一次；
+        # 快照之后才提交的流水不在回填结果中，保留给 refresh_rollups 处理
+        async with conn.transaction(isolation='repeatable_read'):
+            if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM author_activity_daily)"):
+                await conn.execute('''
+                    INSERT INTO author_activity_daily (author_id, day, likes, collections)
+                    SELECT s.user_id, ev.day, SUM(ev.likes), SUM(ev.collections)
+                    FROM (
+                        SELECT channel_message_id, timestamp::date AS day, 1 AS likes, 0 AS collections
+                        FROM reactions WHERE reaction_type = 1 AND timestamp >= CURRENT_DATE - 30
+                        UNION ALL
+                        SELECT channel_message_id, timestamp::date, 0, 1
+                        FROM collections WHERE timestamp >= CURRENT_DATE - 30
+                    ) ev
+                    JOIN submissions s ON s.channel_message_id = ev.channel_message_id
+                    GROUP BY s.user_id, ev.day
+                ''')
+                await conn.execute("DELETE FROM activity_log")
+        await conn.execute('''
+            UPDATE post_stats SET pinned = TRUE
+            WHERE NOT pinned AND channel_message_id IN (SELECT channel_message_id FROM pinned_posts)
+        ''')
         
         logger.info("数据库结构初始化完成。")
+    # 建表/改函数之前建立的连接可能预编译失败或持有旧计划：全部换新，重新预编译热点语句
+    await pool.expire_connections()
+
+
+# 热度：score = Σ w·2^((t - HOT_EPOCH) / 半衰期)，以对数形式存储避免溢出。
+# 所有帖子共用同一个时间原点，排序时无需对每个帖子重新衰减，索引上直接取 Top-K。
+HOT_EPOCH = 1700000000
+HOT_DECAY = math.log(2) / (HOT_HALF_LIFE_HOURS * 3600)
+
+
+def hot_threshold(score: float) -> float:
+    """把 "当前时刻的热度" 换算成 hot_score 列上的比较值"""
+    return math.log(score) + (time.time() - HOT_EPOCH) * HOT_DECAY
+
+
+HOT_ADD_FUNCTION = f'''
+    CREATE OR REPLACE FUNCTION hot_add(score DOUBLE PRECISION, delta DOUBLE PRECISION, at_time TIMESTAMPTZ)
+    RETURNS DOUBLE PRECISION LANGUAGE plpgsql STABLE AS $$
+    DECLARE
+        b DOUBLE PRECISION;
+    BEGIN
+        IF delta = 0 THEN RETURN score; END IF;
+        b := ln(abs(delta)) + (extract(epoch FROM COALESCE(at_time, now())) - {HOT_EPOCH}) * {HOT_DECAY!r};
+        IF delta > 0 THEN
+            IF score IS NULL THEN RETURN b; END IF;
+            RETURN GREATEST(score, b) + ln(1 + exp(-abs(score - b)));
+        END IF;
+        -- 撤销：at_time 传被撤销事件当初的时间戳，扣除的正是它当时加上的权重；扣到 0 为止
+        IF score IS NULL OR b >= score THEN RETURN NULL; END IF;
+        RETURN score + ln(1 - exp(b - score));
+    END $$
+'''
+
+TOGGLE_REACTION_FUNCTION = f'''
+    CREATE OR REPLACE FUNCTION toggle_reaction(p_message_id BIGINT, p_user_id BIGINT, p_value INTEGER)
+    RETURNS TABLE (prev_value INTEGER, new_value INTEGER, like_count INTEGER, dislike_count INTEGER,
+                   collection_count INTEGER, comment_count INTEGER, is_pinned BOOLEAN)
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        v_prev INTEGER;
+        v_prev_at TIMESTAMP;
+        v_new INTEGER;
+        d_likes INTEGER;
+        d_dislikes INTEGER;
+    BEGIN
+        LOOP
+            SELECT r.reaction_type, r.timestamp INTO v_prev, v_prev_at FROM reactions r
+            WHERE r.channel_message_id = p_message_id AND r.user_id = p_user_id FOR UPDATE;
+            IF NOT FOUND THEN
+                v_prev := NULL;
+                INSERT INTO reactions (channel_message_id, user_id, reaction_type)
+                VALUES (p_message_id, p_user_id, p_value)
+                ON CONFLICT DO NOTHING;
+                IF FOUND THEN v_new := p_value; EXIT; END IF;
+                -- 同一用户的并发点击抢先插入了，重新读取后再切换
+            ELSIF v_prev = p_value THEN
+                DELETE FROM reactions r WHERE r.channel_message_id = p_message_id AND r.user_id = p_user_id;
+                v_new := NULL; EXIT;
+            ELSE
+                -- 改投视为新事件，时间戳随之更新 (rebuild_hot_scores 按它重算)
+                UPDATE reactions r SET reaction_type = p_value, timestamp = CURRENT_TIMESTAMP
+                WHERE r.channel_message_id = p_message_id AND r.user_id = p_user_id;
+                v_new := p_value; EXIT;
+            END IF;
+        END LOOP;
+
+        d_likes := (CASE WHEN v_new = 1 THEN 1 ELSE 0 END) - (CASE WHEN v_prev = 1 THEN 1 ELSE 0 END);
+        d_dislikes := (CASE WHEN v_new = -1 THEN 1 ELSE 0 END) - (CASE WHEN v_prev = -1 THEN 1 ELSE 0 END);
+
+        INSERT INTO post_stats AS ps (channel_message_id, likes, dislikes, hot_score)
+        VALUES (p_message_id, GREATEST(d_likes, 0), GREATEST(d_dislikes, 0), hot_add(NULL, GREATEST(d_likes, 0) * {HOT_WEIGHT_LIKE!r}, now()))
+        ON CONFLICT (channel_message_id) DO UPDATE SET
+            likes = GREATEST(ps.likes + d_likes, 0),
+            dislikes = GREATEST(ps.dislikes + d_dislikes, 0),
+            hot_score = hot_add(ps.hot_score, d_likes * {HOT_WEIGHT_LIKE!r},
+                                CASE WHEN d_likes < 0 THEN v_prev_at::timestamptz ELSE now() END)
+        RETURNING ps.likes, ps.dislikes, ps.collections, ps.comments, ps.pinned
+        INTO like_count, dislike_count, collection_count, comment_count, is_pinned;
+
+        IF d_likes <> 0 THEN
+            INSERT INTO activity_log (channel_message_id, kind, delta) VALUES (p_message_id, 'like', d_likes);
+        END IF;
+
+        prev_value := v_prev;
+        new_value := v_new;
+        RETURN NEXT;
+    END $$
+'''
+
+TOGGLE_COLLECTION_FUNCTION = f'''
+    CREATE OR REPLACE FUNCTION toggle_collection(p_message_id BIGINT, p_user_id BIGINT)
+    RETURNS TABLE (was_collected BOOLEAN, is_collected BOOLEAN, like_count INTEGER, dislike_count INTEGER,
+                   collection_count INTEGER, comment_count INTEGER, is_pinned BOOLEAN)
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        v_prev BOOLEAN;
+        v_prev_at TIMESTAMP;
+    BEGIN
+        LOOP
+            DELETE FROM collections c WHERE c.channel_message_id = p_message_id AND c.user_id = p_user_id
+            RETURNING c.timestamp INTO v_prev_at;
+            IF FOUND THEN v_prev := TRUE; EXIT; END IF;
+            INSERT INTO collections (channel_message_id, user_id) VALUES (p_message_id, p_user_id)
+            ON CONFLICT DO NOTHING;
+            IF FOUND THEN v_prev := FALSE; EXIT; END IF;
+            -- 并发点击抢先插入了，下一轮改为删除
+        END LOOP;
+
+        INSERT INTO post_stats AS ps (channel_message_id, collections, hot_score)
+        VALUES (p_message_id, CASE WHEN v_prev THEN 0 ELSE 1 END, CASE WHEN v_prev THEN NULL ELSE hot_add(NULL, {HOT_WEIGHT_COLLECT!r}, now()) END)
+        ON CONFLICT (channel_message_id) DO UPDATE SET
+            collections = GREATEST(ps.collections + CASE WHEN v_prev THEN -1 ELSE 1 END, 0),
+            hot_score = hot_add(ps.hot_score, CASE WHEN v_prev THEN -1 ELSE 1 END * {HOT_WEIGHT_COLLECT!r},
+                                CASE WHEN v_prev THEN v_prev_at::timestamptz ELSE now() END)
+        RETURNING ps.likes, ps.dislikes, ps.collections, ps.comments, ps.pinned
+        INTO like_count, dislike_count, collection_count, comment_count, is_pinned;
+
+        INSERT INTO activity_log (channel_message_id, kind, delta)
+        VALUES (p_message_id, 'collect', CASE WHEN v_prev THEN -1 ELSE 1 END);
+
+        was_collected := v_prev;
+        is_collected := NOT v_prev;
+        RETURN NEXT;
+    END $$
+'''
+
+
+# 频道按钮/评论区每次点击都会执行的语句
+TOGGLE_REACTION = HotStatement("toggle_reaction", "SELECT * FROM toggle_reaction($1, $2, $3)")
+TOGGLE_COLLECTION = HotStatement("toggle_collection", "SELECT * FROM toggle_collection($1, $2)")
+POST_LOCK = HotStatement("post_lock", "SELECT pg_advisory_xact_lock($1, $2)")
+BUMP_RENDER_SEQ = HotStatement("bump_render_seq", '''
+    INSERT INTO post_stats AS ps (channel_message_id, render_seq) VALUES ($1, 1)
+    ON CONFLICT (channel_message_id) DO UPDATE SET render_seq = ps.render_seq + 1
+    RETURNING render_seq
+''')
+RENDER_SEQ = HotStatement("render_seq", "SELECT render_seq FROM post_stats WHERE channel_message_id = $1")
+POST_COUNTS = HotStatement("post_counts", "SELECT likes, dislikes, collections, comments, pinned FROM post_stats WHERE channel_message_id = $1")
+COMMENTS_OPEN = HotStatement("comments_open", "SELECT comments_open FROM post_stats WHERE channel_message_id = $1")
+POST_SOURCE = HotStatement("post_source", """
+    SELECT content_text, user_id, user_name, base_caption, caption_version FROM submissions WHERE channel_message_id = $1
+""")
+USER_PROFILE = HotStatement("user_profile", "SELECT username, full_name FROM users WHERE user_id = $1")
+COMMENT_THREAD = HotStatement("comment_thread", '''
+    SELECT id, user_id, user_name, comment_text, parent_id, reply_count, total_count FROM (
+        SELECT id, user_id, user_name, comment_text, parent_id, timestamp,
+               COUNT(*) OVER (PARTITION BY parent_id) AS reply_count,
+               ROW_NUMBER() OVER (PARTITION BY parent_id ORDER BY timestamp ASC, id ASC) AS rn,
+               COUNT(*) OVER () AS total_count
+        FROM comments WHERE channel_message_id = $1
+    ) t
+    WHERE parent_id IS NULL OR $2::int IS NULL OR rn <= $2::int OR parent_id = $3::bigint
+    ORDER BY parent_id NULLS FIRST, timestamp ASC, id ASC
+''')
+
+
+async def toggle_reaction(conn, channel_message_id: int, user_id: int, value: int):
+    """原子切换点赞/点踩，返回 (旧状态, 新状态, 最新计数)，状态为 1 / -1 / None"""
+    row = await TOGGLE_REACTION.fetchrow(conn, channel_message_id, user_id, value)
+    return row['prev_value'], row['new_value'], _counts_from_row(row)
+
+
+async def toggle_collection(conn, channel_message_id: int, user_id: int):
+    """原子切换收藏，返回 (之前是否已收藏, 现在是否已收藏, 最新计数)"""
+    row = await TOGGLE_COLLECTION.fetchrow(conn, channel_message_id, user_id)
+    return row['was_collected'], row['is_collected'], _counts_from_row(row)
+
+
+def _counts_from_row(row):
+    return {
+        "likes": row['like_count'],
+        "dislikes": row['dislike_count'],
+        "comments": row['comment_count'],
+        "collections": row['collection_count'],
+        "pinned": row['is_pinned'],
+    }
+
+
+async def adjust_post_stats(conn, channel_message_id: int, likes: int = 0, dislikes: int = 0,
+                            collections: int = 0, comments: int = 0, at=None):
+    """
+    增量修改帖子计数与热度 (调用方负责与业务写入放在同一事务中)。
+    at: 撤销 (负增量) 时传被删除记录的时间戳，按它当初贡献的权重扣除热度；默认按当前时刻
+    """
+    hot_delta = likes * HOT_WEIGHT_LIKE + collections * HOT_WEIGHT_COLLECT + comments * HOT_WEIGHT_COMMENT
+    await conn.execute('''
+        INSERT INTO post_stats AS ps (channel_message_id, likes, dislikes, collections, comments, hot_score)
+        VALUES ($1, GREATEST($2, 0), GREATEST($3, 0), GREATEST($4, 0), GREATEST($5, 0), hot_add(NULL, GREATEST($6::float8, 0), COALESCE($7::timestamp::timestamptz, now())))
+        ON CONFLICT (channel_message_id) DO UPDATE SET
+            likes = GREATEST(ps.likes + $2, 0),
+            dislikes = GREATEST(ps.dislikes + $3, 0),
+            collections = GREATEST(ps.collections + $4, 0),
+            comments = GREATEST(ps.comments + $5, 0),
+            hot_score = hot_add(ps.hot_score, $6::float8, COALESCE($7::timestamp::timestamptz, now()))
+    ''', channel_message_id, likes, dislikes, collections, comments, float(hot_delta), at)
+
+
+# pg_advisory_xact_lock(int, int) 的命名空间，避免与其他用途的 advisory 锁冲突
+POST_LOCK_NAMESPACE = 0x504F
+
+# 单进程模式的帖子锁：channel_message_id -> [asyncio.Lock, 使用者数]
+_local_post_locks = {}
+
+
+@asynccontextmanager
+async def post_lock(conn, channel_message_id: int):
+    """
+    帖子级锁：串行化同一帖子的 读取-修改-渲染 (不可重入)。
+    多进程模式下是事务 advisory 锁，锁随事务结束释放，块内的 conn.transaction() 会成为保存点；
+    单进程模式下只用进程内锁，不增加数据库往返 (同一帖子的点击已由 KeyedUpdateProcessor 保序，
+    这里只需与热度榜等后台任务互斥)，块内不再隐含事务。
+    """
+    if WORKER_PROCESSES > 1:
+        async with conn.transaction():
+            await POST_LOCK.fetchval(conn, POST_LOCK_NAMESPACE, channel_message_id)
+            yield
+        return
+    entry = _local_post_locks.get(channel_message_id)
+    if entry is None:
+        entry = _local_post_locks[channel_message_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _local_post_locks[channel_message_id]
+
+
+async def bump_render_seq(conn, channel_message_id: int) -> int:
+    """在 post_lock 内调用：为本次渲染分配递增序号"""
+    return await BUMP_RENDER_SEQ.fetchval(conn, channel_message_id)
+
+
+def render_guard(channel_message_id: int, seq: int):
+    """编辑发送前的检查：其他进程已渲染过更新的版本时跳过本次编辑"""
+    async def guard() -> bool:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            current = await RENDER_SEQ.fetchval(conn, channel_message_id)
+        return current is None or current <= seq
+    return guard
+
+
+async def rebuild_post_stats(conn, channel_message_ids=None) -> int:
+    """从明细表重新统计计数 (回填/修复)，不传 ID 时处理全部帖子，返回处理的帖子数"""
+    ids_filter = "" if channel_message_ids is None else "WHERE channel_message_id = ANY($1::bigint[])"
+    args = [] if channel_message_ids is None else [list(channel_message_ids)]
+    result = await conn.execute(f'''
+        WITH ids AS (
+            SELECT channel_message_id FROM submissions
+            UNION SELECT channel_message_id FROM reactions
+            UNION SELECT channel_message_id FROM comments
+            UNION SELECT channel_message_id FROM collections
+        ),
+        r AS (
+            SELECT channel_message_id,
+                   COUNT(*) FILTER (WHERE reaction_type = 1) AS likes,
+                   COUNT(*) FILTER (WHERE reaction_type = -1) AS dislikes
+            FROM reactions GROUP BY channel_message_id
+        ),
+        c AS (SELECT channel_message_id, COUNT(*) AS n FROM comments GROUP BY channel_message_id),
+        k AS (SELECT channel_message_id, COUNT(*) AS n FROM collections GROUP BY channel_message_id)
+        INSERT INTO post_stats (channel_message_id, likes, dislikes, collections, comments)
+        SELECT ids.channel_message_id,
+               COALESCE(r.likes, 0), COALESCE(r.dislikes, 0), COALESCE(k.n, 0), COALESCE(c.n, 0)
+        FROM (SELECT channel_message_id FROM ids {ids_filter}) ids
+        LEFT JOIN r ON r.channel_message_id = ids.channel_message_id
+        LEFT JOIN c ON c.channel_message_id = ids.channel_message_id
+        LEFT JOIN k ON k.channel_message_id = ids.channel_message_id
+        ON CONFLICT (channel_message_id) DO UPDATE SET
+            likes = EXCLUDED.likes,
+            dislikes = EXCLUDED.dislikes,
+            collections = EXCLUDED.collections,
+            comments = EXCLUDED.comments
+    ''', *args)
+    return int(result.split()[-1])
+
+
+async def rebuild_hot_scores(conn, channel_message_ids=None) -> int:
+    """按点赞/收藏/评论的时间戳重算热度 (log-sum-exp)，返回处理的帖子数；权重为 0 的信号不参与"""
+    ids_filter = "" if channel_message_ids is None else "WHERE channel_message_id = ANY($1::bigint[])"
+    args = [] if channel_message_ids is None else [list(channel_message_ids)]
+    sources = (
+        (HOT_WEIGHT_LIKE, "reactions WHERE reaction_type = 1"),
+        (HOT_WEIGHT_COLLECT, "collections"),
+        (HOT_WEIGHT_COMMENT, "comments"),
+    )
+    branches = [
+        f"SELECT channel_message_id, ln({weight!r}) + (extract(epoch FROM timestamp::timestamptz) - {HOT_EPOCH}) * {HOT_DECAY!r} AS x FROM {source}"
+        for weight, source in sources if weight > 0
+    ]
+    if not branches: return 0
+    union = "\n            UNION ALL\n            ".join(branches)
+    result = await conn.execute(f'''
+        WITH ev AS (
+            {union}
+        ),
+        m AS (
+            SELECT channel_message_id, x, MAX(x) OVER (PARTITION BY channel_message_id) AS mx
+            FROM (SELECT * FROM ev {ids_filter}) ev
+        ),
+        scores AS (
+            SELECT channel_message_id, mx + ln(SUM(exp(x - mx))) AS score
+            FROM m GROUP BY channel_message_id, mx
+        )
+        UPDATE post_stats ps SET hot_score = scores.score
+        FROM scores WHERE ps.channel_message_id = scores.channel_message_id
+    ''', *args)
+    return int(result.split()[-1])
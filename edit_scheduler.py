@@ -0,0 +1,113 @@
+# edit_scheduler.py
+
+import asyncio
+import logging
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter, BadRequest
+
+from config import EDIT_DEBOUNCE_MS
+from request_scheduler import with_priority, CHANNEL_EDIT
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+def _merge(state, caption, markup, guard=None):
+    """合并一次提交：只改按钮的提交不覆盖已排队的整条文案编辑 (后者带有完整视图)"""
+    if caption is not _UNSET or state["caption"] is _UNSET:
+        state["markup"] = markup
+        state["guard"] = guard
+    if caption is not _UNSET:
+        state["caption"] = caption
+
+
+class EditScheduler:
+    """
+    频道消息编辑合并器：
+    调用方只提交"期望状态"(文案 + 按钮)，同一条消息在窗口期内的多次提交只发送最后一次，
+    且同一条消息同时最多只有一个编辑请求在途。
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._pending = {}   # message_id -> 待发送状态
+        self._workers = {}   # message_id -> asyncio.Task
+
+    def submit(self, bot, chat_id, message_id: int, caption=_UNSET, reply_markup=None, guard=None) -> asyncio.Future:
+        """
+        提交期望状态，返回 Future：
+        True 表示消息仍然存在 (已更新/无变化/临时失败)，False 表示消息已被删除。
+        guard: 可选的异步检查，发送前返回 False 时跳过本次编辑 (已有更新的版本)
+        """
+        fut = asyncio.get_running_loop().create_future()
+        state = self._pending.setdefault(message_id, {"caption": _UNSET, "markup": None, "guard": None, "waiters": []})
+        state["bot"] = bot
+        state["chat_id"] = chat_id
+        _merge(state, caption, reply_markup, guard)
+        state["waiters"].append(fut)
+
+        if message_id not in self._workers:
+            self._workers[message_id] = asyncio.create_task(self._run(message_id))
+        return fut
+
+    async def drain(self) -> None:
+        """等待所有排队中的编辑发送完毕 (包括等待期间新提交的)"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()))
+
+    async def _run(self, message_id: int):
+        try:
+            while message_id in self._pending:
+                await asyncio.sleep(self.window)
+                state = self._pending.pop(message_id, None)
+                if state is None: break
+                alive = await self._send(message_id, state)
+                for fut in state["waiters"]:
+                    if not fut.done(): fut.set_result(alive)
+        finally:
+            self._workers.pop(message_id, None)
+
+    @with_priority(CHANNEL_EDIT)
+    async def _send(self, message_id: int, state) -> bool:
+        while True:
+            try:
+                if state["guard"] is not None and not await state["guard"]():
+                    return True
+                if state["caption"] is _UNSET:
+                    await state["bot"].edit_message_reply_markup(
+                        chat_id=state["chat_id"], message_id=message_id, reply_markup=state["markup"]
+                    )
+                else:
+                    await state["bot"].edit_message_caption(
+                        chat_id=state["chat_id"], message_id=message_id, caption=state["caption"],
+                        parse_mode=ParseMode.HTML, reply_markup=state["markup"]
+                    )
+                return True
+            except RetryAfter as e:
+                logger.warning(f"⏳ 编辑频道消息 {message_id} 触发限流，{e.retry_after}s 后重试")
+                await asyncio.sleep(e.retry_after)
+                # 等待期间若有更新的期望状态，直接合并后发送最新的
+                newer = self._pending.pop(message_id, None)
+                if newer is not None:
+                    _merge(state, newer["caption"], newer["markup"], newer["guard"])
+                    state["waiters"].extend(newer["waiters"])
+            except BadRequest as e:
+                error_str = str(e).lower()
+                if "message is not modified" in error_str:
+                    return True
+                if "not found" in error_str or "deleted" in error_str or "message_id_invalid" in error_str:
+                    return False
+                logger.error(f"❌ 编辑频道消息 {message_id} 失败: {e}")
+                return True
+            except Exception as e:
+                logger.error(f"❌ 编辑频道消息 {message_id} 失败: {e}")
+                return True
+
+
+edit_scheduler = EditScheduler(EDIT_DEBOUNCE_MS / 1000)
+
+
+def schedule_edit(bot, chat_id, message_id: int, caption=_UNSET, reply_markup=None, guard=None) -> asyncio.Future:
+    """提交频道消息的期望状态；不传 caption 时只更新按钮"""
+    return edit_scheduler.submit(bot, chat_id, message_id, caption=caption, reply_markup=reply_markup, guard=guard)
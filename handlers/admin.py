@@ -0,0 +1,68 @@
+# handlers/admin.py
+
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import ADMIN_GROUP_ID
+from database import get_pool, pool_stats
+from slowlog import slow_query_log
+from cluster import register_invalidator, publish_invalidation
+
+logger = logging.getLogger(__name__)
+
+SLOWLOG_USAGE = (
+    "用法：\n"
+    "/slowlog — 查看状态\n"
+    "/slowlog 200 — 记录超过 200ms 的语句\n"
+    "/slowlog off — 关闭\n"
+    "/slowlog sample 0.1 — 10% 的慢查询抓取执行计划"
+)
+
+# 多进程模式：其他 worker 收到广播后同步配置 (采样比例按千分比传递)
+register_invalidator("slowlog_ms", lambda ms: slow_query_log.configure(threshold_ms=ms))
+register_invalidator("slowlog_sample", lambda permille: slow_query_log.configure(sample_rate=permille / 1000))
+
+
+async def handle_slowlog_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/slowlog：运行中开关慢查询日志 (仅限审核群)"""
+    if update.effective_chat.id != ADMIN_GROUP_ID: return
+    args = context.args or []
+    threshold_ms = sample_rate = None
+    try:
+        if not args:
+            pass
+        elif args[0] == "off":
+            threshold_ms = 0
+        elif args[0] == "sample":
+            sample_rate = float(args[1])
+        else:
+            threshold_ms = int(args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text(SLOWLOG_USAGE)
+        return
+
+    if threshold_ms is not None or sample_rate is not None:
+        slow_query_log.configure(threshold_ms=threshold_ms, sample_rate=sample_rate)
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            if threshold_ms is not None:
+                await publish_invalidation(conn, "slowlog_ms", slow_query_log.threshold_ms)
+            if sample_rate is not None:
+                await publish_invalidation(conn, "slowlog_sample", round(slow_query_log.sample_rate * 1000))
+        logger.info(f"🐢 管理员 {update.effective_user.id} 调整了慢查询日志")
+    await update.message.reply_text(slow_query_log.status())
+
+
+async def handle_dbpool_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/dbpool：查看本进程连接池的占用与等待情况 (仅限审核群)"""
+    if update.effective_chat.id != ADMIN_GROUP_ID: return
+    stats = pool_stats()
+    if not stats:
+        await update.message.reply_text("连接池尚未创建")
+        return
+    await update.message.reply_text(
+        f"🗄 连接池：使用中 {stats['in_use']}/{stats['max']} (已打开 {stats['open']}，空闲 {stats['idle']}，排队 {stats['waiting']})\n"
+        f"累计 acquire {stats['acquires']} 次，饱和 {stats['saturated']} 次 ({stats['saturated_ratio']:.1%})\n"
+        f"等待耗时：平均 {stats['wait_avg_ms']}ms，最大 {stats['wait_max_ms']}ms"
+    )
@@ -5,8 +5,11 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
 
-from config import CHANNEL_ID, CHANNEL_USERNAME, BOT_USERNAME
+from config import CHANNEL_ID, CHANNEL_USERNAME
 from database import get_pool
+from user_directory import lookup_user
+from notifier import enqueue_notification
+from .channel_interact import format_base_caption, build_post_markup, base_caption_cache, CAPTION_TEMPLATE_VERSION, EMPTY_COUNTS
 
 logger = logging.getLogger(__name__)
 
@@ -43,44 +46,36 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 content_to_save = caption_parts[1]
                 original_caption = caption_parts[1]
         
-        # 3. 构建页脚 (保持不变)
-        try:
-            submitter = await context.bot.get_chat(user_id)
-            author_username = submitter.username or ""
-            author_name = submitter.full_name or "匿名用户"
-        except:
-            author_username = ""
-            author_name = "匿名用户"
-        
-        if author_username:
-            author_link = f'👤 作者: <a href="https://t.me/{author_username}">{author_name}</a>'
-        else:
-            author_link = f'👤 作者: <a href="tg://user?id={user_id}">{author_name}</a>'
-        
-        my_link = f'<a href="https://t.me/{BOT_USERNAME}?start=main">📱 我的</a>'
-        footer = f"\n\n━━━━━━━━━━━━━━\n{author_link}  |  {my_link}"
-        full_caption = (original_caption or "") + footer
-        
-        # 4. 保存到数据库 (保持不变)
+        # 3. 构建页脚 (作者资料取自用户目录，投稿时已被动记录)
         pool = await get_pool()
         async with pool.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO submissions (user_id, user_name, channel_message_id, content_text) VALUES ($1, $2, $3, $4)",
-                user_id, author_name, msg_id, content_to_save
-            )
+            submitter = await lookup_user(conn, user_id)
+        author_username = submitter[0] if submitter else ""
+        author_name = (submitter[1] if submitter else "") or "匿名用户"
+        full_caption = format_base_caption(original_caption, user_id, author_name, author_username)
+        
+        # 4. 保存到数据库 (连同预渲染的正文+页脚)，同一事务写入给投稿者的通知 (后台发送，带跳转按钮)
+        post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
+        user_notify_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔗 前往查看信息", url=post_url)]
+        ])
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO submissions (user_id, user_name, channel_message_id, content_text, base_caption, caption_version)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    """,
+                    user_id, author_name, msg_id, content_to_save, full_caption, CAPTION_TEMPLATE_VERSION
+                )
+                await enqueue_notification(
+                    conn, user_id, "🎉 恭喜！您的作品已审核通过并发布。",
+                    parse_mode=None, reply_markup=user_notify_markup
+                )
+        base_caption_cache.put(msg_id, (full_caption, user_id, content_to_save))
         
-        # 5. 编辑频道消息按钮 (保持不变)
-        keyboard = [
-            [
-                InlineKeyboardButton(f"👍 赞 0", callback_data=f"react:like:{msg_id}"),
-                InlineKeyboardButton(f"👎 踩 0", callback_data=f"react:dislike:{msg_id}"),
-                InlineKeyboardButton(f"⭐ 收藏 0", callback_data=f"collect:{msg_id}"),
-            ],
-            [
-                InlineKeyboardButton("💬 评论 0", callback_data=f"comment:show:{msg_id}"),
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # 5. 编辑频道消息按钮 (初始计数全为 0)
+        reply_markup = build_post_markup(msg_id, EMPTY_COUNTS, show_comments=False)
 
         await context.bot.edit_message_caption(
             chat_id=CHANNEL_ID,
@@ -96,18 +91,7 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             caption=f"✅ 已通过 by {query.from_user.first_name}\n\n{original_admin_caption}",
             parse_mode=ParseMode.HTML
         )
-        
-        # 7. 【新功能】通知投稿者，并带上跳转按钮
-        post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
-        user_notify_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔗 前往查看信息", url=post_url)]
-        ])
-        
-        await context.bot.send_message(
-            chat_id=user_id, 
-            text="🎉 恭喜！您的作品已审核通过并发布。",
-            reply_markup=user_notify_markup
-        )
+
         
     except Exception as e:
         logger.error(f"审核通过失败: {e}")
@@ -128,4 +112,6 @@ async def handle_rejection(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         parse_mode=ParseMode.HTML
     )
     
-    await context.bot.send_message(chat_id=user_id, text="很抱歉，您的作品未通过审核。")
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await enqueue_notification(conn, user_id, "很抱歉，您的作品未通过审核。", parse_mode=None)
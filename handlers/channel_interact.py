@@ -1,63 +1,230 @@
 # handlers/channel_interact.py
 
 import logging
+import asyncpg
 from typing import Tuple, Dict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from config import BOT_USERNAME, CHANNEL_USERNAME, CHANNEL_ID
-from database import get_pool
+from config import (
+    BOT_USERNAME, CHANNEL_ID, COMMENT_CACHE_SIZE, BASE_CAPTION_CACHE_SIZE, USER_CACHE_SIZE, USER_TOTAL_CACHE_TTL,
+    WORKER_PROCESSES, POST_FOREIGN_KEYS,
+)
+from database import (
+    get_pool, toggle_reaction, toggle_collection, post_lock, bump_render_seq, render_guard,
+    POST_COUNTS, COMMENTS_OPEN, POST_SOURCE, COMMENT_THREAD,
+)
+from edit_scheduler import schedule_edit
+from cache import LRUCache, TTLCache
+from user_directory import lookup_user
+from cluster import register_invalidator, register_batch_invalidator, publish_invalidation
+from .notifications import record_notification_event
 
 logger = logging.getLogger(__name__)
 
+# 评论区渲染结果缓存：(channel_message_id, expanded_comment_id) -> 文本
+comment_section_cache = LRUCache(COMMENT_CACHE_SIZE)
+
+
+# 用户收藏总数缓存：user_id -> 总数 ("我的收藏" 翻页时不再每页 COUNT)
+collection_total_cache = TTLCache(USER_CACHE_SIZE, USER_TOTAL_CACHE_TTL)
+
+# 帖子静态部分缓存：channel_message_id -> (正文+页脚, 作者ID, 正文)
+base_caption_cache = LRUCache(BASE_CAPTION_CACHE_SIZE)
+
+# 页脚模板版本：修改 format_base_caption 的输出格式时 +1，
+# 旧版本的帖子在下次渲染时按新模板重新生成，或用 rerender_captions.py 批量处理
+CAPTION_TEMPLATE_VERSION = 1
+
+EMPTY_COUNTS = {"likes": 0, "dislikes": 0, "comments": 0, "collections": 0, "pinned": False}
+
+
+def invalidate_comment_section(message_id: int):
+    """评论增删后调用，清除该帖子所有展开状态下的缓存"""
+    comment_section_cache.invalidate_where(lambda key: key[0] == message_id)
+
+
+def invalidate_posts(message_ids):
+    """帖子被删除后调用：一次遍历清除这批帖子的评论区与正文缓存"""
+    ids = set(message_ids)
+    if not ids: return
+    comment_section_cache.invalidate_where(lambda key: key[0] in ids)
+    base_caption_cache.invalidate_where(lambda key: key in ids)
 
-async def check_and_pin_if_hot(context: ContextTypes.DEFAULT_TYPE, message_id: int, like_count: int):
-    """检查点赞数，如果达到100自动置顶"""
-    if like_count < 100: return
-    
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        already_pinned = await conn.fetchval("SELECT id FROM pinned_posts WHERE channel_message_id = $1", message_id)
-        if already_pinned: return
-        
-        try:
-            await context.bot.pin_chat_message(chat_id=CHANNEL_ID, message_id=message_id, disable_notification=True)
-            await conn.execute("INSERT INTO pinned_posts (channel_message_id, like_count_at_pin) VALUES ($1, $2)", message_id, like_count)
-            
-            # 通知作者
-            post_info = await conn.fetchrow("SELECT user_id, content_text FROM submissions WHERE channel_message_id = $1", message_id)
-            if post_info:
-                author_id = post_info['user_id']
-                content_text = post_info['content_text']
-                post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
-                preview_text = (content_text or "作品")[:20].replace('<', '&lt;').replace('>', '&gt;') + "..."
-                msg = f"🔥 <b>恭喜！作品火了！</b>\n<a href='{post_url}'>{preview_text}</a> 获赞 {like_count}，已自动置顶！"
-                try: await context.bot.send_message(chat_id=author_id, text=msg, parse_mode=ParseMode.HTML)
-                except: pass
-        except: pass
+
+def invalidate_collection_totals(user_ids):
+    """一批用户的收藏总数失效 (批量删除帖子时)"""
+    ids = set(user_ids)
+    if not ids: return
+    collection_total_cache.invalidate_where(lambda key: key in ids)
+
+
+# 多进程模式：其他 worker 的失效广播
+register_invalidator("comments", invalidate_comment_section)
+register_invalidator("collections", collection_total_cache.invalidate)
+register_invalidator("base_caption", base_caption_cache.invalidate)
+register_invalidator("author_captions", lambda author_id: base_caption_cache.invalidate_items(lambda _, v: v[1] == author_id))
+register_batch_invalidator("posts", invalidate_posts)
+# 单个用户的 "collections:ID" 广播同样按批量格式解析
+register_batch_invalidator("collections", invalidate_collection_totals)
 
 
 async def get_all_counts(conn, message_id: int) -> Dict[str, int]:
-    rows = await conn.fetch("SELECT reaction_type, COUNT(*) as count FROM reactions WHERE channel_message_id = $1 GROUP BY reaction_type", message_id)
-    counts = {row['reaction_type']: row['count'] for row in rows}
+    """读取 post_stats 中的冗余计数与置顶状态 (单行读取)"""
+    row = await POST_COUNTS.fetchrow(conn, message_id)
+    if not row:
+        return dict(EMPTY_COUNTS)
     return {
-        "likes": counts.get(1, 0),
-        "dislikes": counts.get(-1, 0),
-        "comments": await conn.fetchval("SELECT COUNT(*) FROM comments WHERE channel_message_id = $1", message_id) or 0,
-        "collections": await conn.fetchval("SELECT COUNT(*) FROM collections WHERE channel_message_id = $1", message_id) or 0,
+        "likes": row['likes'],
+        "dislikes": row['dislikes'],
+        "comments": row['comments'],
+        "collections": row['collections'],
+        "pinned": row['pinned'],
     }
 
 
-async def build_threaded_comment_section(conn, message_id: int, expanded_comment_id: int = None) -> str:
-    """构建楼中楼评论区"""
-    # 获取主评论
-    top_comments = await conn.fetch(
-        "SELECT id, user_id, user_name, comment_text FROM comments WHERE channel_message_id = $1 AND parent_id IS NULL ORDER BY timestamp ASC",
-        message_id
+def format_base_caption(content: str, author_id: int, author_name: str, author_username: str) -> str:
+    """作品正文 + 页脚 (作者 | 我的)"""
+    if author_username:
+        author_link = f'👤 作者: <a href="https://t.me/{author_username}">{author_name}</a>'
+    else:
+        author_link = f'👤 作者: <a href="tg://user?id={author_id}">{author_name}</a>'
+    my_link = f'<a href="https://t.me/{BOT_USERNAME}?start=main">📱 我的</a>'
+    return (content or "") + f"\n\n━━━━━━━━━━━━━━\n{author_link}  |  {my_link}"
+
+
+async def render_base_caption(conn, db_row) -> str:
+    """按当前模板和用户目录重新生成页脚"""
+    author_info = await lookup_user(conn, db_row['user_id'])
+    u_name = author_info[0] if author_info else ""
+    return format_base_caption(db_row['content_text'], db_row['user_id'], db_row['user_name'], u_name)
+
+
+async def get_post_source(conn, message_id: int):
+    """
+    帖子静态部分 (正文+页脚, 作者ID, 正文)：内存 LRU -> submissions 预渲染列 -> 现场生成并回写。
+    帖子不在 submissions 中时返回 None。
+    """
+    entry = base_caption_cache.get(message_id)
+    if entry is not None:
+        return entry
+    epoch = base_caption_cache.epoch
+    db_row = await POST_SOURCE.fetchrow(conn, message_id)
+    if not db_row: return None
+    caption = db_row['base_caption']
+    if caption is None or db_row['caption_version'] != CAPTION_TEMPLATE_VERSION:
+        caption = await render_base_caption(conn, db_row)
+        await conn.execute(
+            "UPDATE submissions SET base_caption = $2, caption_version = $3 WHERE channel_message_id = $1",
+            message_id, caption, CAPTION_TEMPLATE_VERSION
+        )
+    entry = (caption, db_row['user_id'], db_row['content_text'])
+    base_caption_cache.put(message_id, entry, epoch=epoch)
+    return entry
+
+
+async def render_channel_post(conn, message_id: int):
+    """按数据库状态完整渲染频道帖子，返回 (文案, 按钮)；帖子不在 submissions 中时返回 None"""
+    source = await get_post_source(conn, message_id)
+    if source is None: return None
+    caption = source[0]
+    counts = await get_all_counts(conn, message_id)
+    show_comments = await COMMENTS_OPEN.fetchval(conn, message_id) or False
+    if show_comments:
+        caption += await build_threaded_comment_section(conn, message_id, expanded_comment_id=None)
+    if counts['pinned']:
+        caption = "🔥 " + caption
+    return caption, build_post_markup(message_id, counts, show_comments)
+
+
+async def push_post_render(bot, conn, message_id: int) -> bool:
+    """在 post_lock 内调用：按数据库状态重新渲染并提交编辑，帖子不存在时返回 False"""
+    rendered = await render_channel_post(conn, message_id)
+    if rendered is None: return False
+    guard = None
+    if WORKER_PROCESSES > 1:
+        guard = render_guard(message_id, await bump_render_seq(conn, message_id))
+    schedule_edit(bot, CHANNEL_ID, message_id, caption=rendered[0], reply_markup=rendered[1], guard=guard)
+    return True
+
+
+async def load_comment_thread(conn, message_id: int, expanded_comment_id: int = None, replies_per_parent: int = 2):
+    """
+    一次查询取回整个评论区并在内存中组装成树。
+    replies_per_parent: 每个主评论最多取回的回复数 (窗口函数截断，展开的楼层不截断)；
+    未展开时超过 2 条回复的楼层本来就折叠，所以默认 2 条即可保证渲染结果不变。
+    返回 (评论总数, 主评论列表, {主评论ID: 回复列表}, {主评论ID: 回复总数})
+    """
+    rows = await COMMENT_THREAD.fetch(conn, message_id, replies_per_parent, expanded_comment_id)
+    total_count = rows[0]['total_count'] if rows else 0
+    top_comments = []
+    replies = {}
+    reply_counts = {}
+    for row in rows:
+        parent_id = row['parent_id']
+        if parent_id is None:
+            top_comments.append(row)
+        else:
+            replies.setdefault(parent_id, []).append(row)
+            reply_counts[parent_id] = row['reply_count']
+    return total_count, top_comments, replies, reply_counts
+
+
+def build_post_markup(message_id: int, counts: Dict[str, int], show_comments: bool) -> InlineKeyboardMarkup:
+    """频道帖子按钮：收起状态显示计数，阅读评论状态只显示功能键"""
+    if not show_comments:
+        # === 模式 A: 收起状态 ===
+        # 显示 [点赞栏] 和 [评论按钮]
+        row1 = [
+            InlineKeyboardButton(f"👍 赞 {counts['likes']}", callback_data=f"react:like:{message_id}"),
+            InlineKeyboardButton(f"👎 踩 {counts['dislikes']}", callback_data=f"react:dislike:{message_id}"),
+            InlineKeyboardButton(f"⭐ 收藏 {counts['collections']}", callback_data=f"collect:{message_id}"),
+        ]
+        row2 = [InlineKeyboardButton(f"💬 评论 {counts['comments']}", callback_data=f"comment:show:{message_id}")]
+        return InlineKeyboardMarkup([row1, row2])
+
+    # === 模式 B: 阅读评论状态 ===
+    # 【修复】隐藏点赞栏，只显示功能键
+    add_url = f"https://t.me/{BOT_USERNAME}?start=comment_{message_id}"
+    del_url = f"https://t.me/{BOT_USERNAME}?start=manage_comments_{message_id}"
+    
+    row1 = [
+        InlineKeyboardButton("✍️ 发表", url=add_url),
+        InlineKeyboardButton("🗑️ 删除", url=del_url),
+        InlineKeyboardButton("🔄 刷新", callback_data=f"comment:refresh:{message_id}")
+    ]
+    row2 = [InlineKeyboardButton("⬆️ 收起", callback_data=f"comment:hide:{message_id}")]
+    return InlineKeyboardMarkup([row1, row2])
+
+
+async def set_comments_open(conn, message_id: int, is_open: bool):
+    """记录帖子当前是否展开评论区，后台巡检据此还原同样的按钮"""
+    await conn.execute(
+        """
+        INSERT INTO post_stats AS ps (channel_message_id, comments_open) VALUES ($1, $2)
+        ON CONFLICT (channel_message_id) DO UPDATE SET comments_open = EXCLUDED.comments_open
+        WHERE ps.comments_open IS DISTINCT FROM EXCLUDED.comments_open
+        """,
+        message_id, is_open
     )
-    total_count = await conn.fetchval("SELECT COUNT(*) FROM comments WHERE channel_message_id = $1", message_id) or 0
+
+
+async def build_threaded_comment_section(conn, message_id: int, expanded_comment_id: int = None) -> str:
+    """构建楼中楼评论区 (优先读缓存)"""
+    key = (message_id, expanded_comment_id)
+    cached = comment_section_cache.get(key)
+    if cached is not None:
+        return cached
+    epoch = comment_section_cache.epoch
+    text = await render_threaded_comment_section(conn, message_id, expanded_comment_id)
+    comment_section_cache.put(key, text, epoch=epoch)
+    return text
+
+
+async def render_threaded_comment_section(conn, message_id: int, expanded_comment_id: int = None) -> str:
+    """从数据库渲染楼中楼评论区"""
+    total_count, top_comments, all_replies, reply_counts = await load_comment_thread(conn, message_id, expanded_comment_id)
     
     if not top_comments:
         return "\n\n--- 评论区 ---\n✨ 暂无评论，快来抢沙发吧！"
@@ -70,9 +237,9 @@ async def build_threaded_comment_section(conn, message_id: int, expanded_comment
         uname = top['user_name'].replace('<', '&lt;')
         content = top['comment_text'].replace('<', '&lt;')
         
-        # 查询回复
-        replies = await conn.fetch("SELECT id, user_name, comment_text FROM comments WHERE parent_id = $1 ORDER BY timestamp ASC", cid)
-        reply_count = len(replies)
+        # 回复已随评论区一并取回
+        replies = all_replies.get(cid, [])
+        reply_count = reply_counts.get(cid, 0)
         
         is_expanded = (cid == expanded_comment_id)
         action_link = ""
@@ -112,122 +279,95 @@ async def build_threaded_comment_section(conn, message_id: int, expanded_comment
     return text
 
 
-async def send_notification(context: ContextTypes.DEFAULT_TYPE, author_id: int, actor_id: int, actor_name: str, 
-                            message_id: int, content_preview: str, action_type: str):
-    if author_id == actor_id: return
-    post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
-    actor_link = f'<a href="tg://user?id={actor_id}">{actor_name}</a>'
-    preview = (content_preview or "作品")[:20].replace('<', '&lt;').replace('>', '&gt;') + "..."
-    post_link = f'<a href="{post_url}">{preview}</a>'
-    
-    msgs = {
-        "like": f"👍 {actor_link} 赞了你的作品 {post_link}",
-        "collect": f"⭐ {actor_link} 收藏了你的作品 {post_link}",
-        "comment": f"💬 {actor_link} 评论了你的作品 {post_link}"
-    }
-    if action_type in msgs:
-        try: await context.bot.send_message(chat_id=author_id, text=msgs[action_type], parse_mode=ParseMode.HTML)
-        except: pass
-
-
 async def handle_channel_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
-    
     user_id = query.from_user.id
     message_id = query.message.message_id
     data = query.data.split(':')
     action = data[0]
+
+    # 开启外键时未登记的帖子无法写入点赞/收藏，需确认帖子已登记后再应答 (已登记的帖子通常命中内存缓存)
+    needs_post = POST_FOREIGN_KEYS and action in ('react', 'collect')
+    if not needs_post:
+        await query.answer()
     
     pool = await get_pool()
     async with pool.acquire() as conn:
-        db_row = await conn.fetchrow("SELECT content_text, user_id, user_name FROM submissions WHERE channel_message_id = $1", message_id)
-        if db_row:
-            content = db_row['content_text']
-            author_id = db_row['user_id']
-            try: u_name = (await context.bot.get_chat(author_id)).username or ""
-            except: u_name = ""
-            author_link = f'👤 作者: <a href="https://t.me/{u_name}">{db_row["user_name"]}</a>' if u_name else f'👤 作者: <a href="tg://user?id={author_id}">{db_row["user_name"]}</a>'
-            my_link = f'<a href="https://t.me/{BOT_USERNAME}?start=main">📱 我的</a>'
-            base_caption = (content or "") + f"\n\n━━━━━━━━━━━━━━\n{author_link}  |  {my_link}"
+        # 正文+页脚在审核通过时已生成，点击时只拼接评论区和火标
+        source = await get_post_source(conn, message_id)
+        if needs_post:
+            if not source:
+                await query.answer("⚠️ 这条帖子未在机器人登记，暂不支持点赞/收藏", show_alert=True)
+                return
+            await query.answer()
+        if source:
+            base_caption, author_id, content = source
         else:
             base_caption = (query.message.caption_html or "").split("\n\n--- 评论区 ---")[0]
             author_id = None
             content = ""
 
-        # 处理动作
-        notify_type = None
-        check_pin = False
-        show_comments = False
+        # 帖子级锁：多进程下同一帖子的 读取-修改-渲染 串行执行
+        async with post_lock(conn, message_id):
+            # 处理动作
+            show_comments = False
+            counts = None
         
-        # 判断当前状态
-        if "--- 评论区" in (query.message.caption or ""): show_comments = True
+            # 判断当前状态
+            if "--- 评论区" in (query.message.caption or ""): show_comments = True
             
-        if action == 'comment':
-            sub = data[1]
-            if sub == 'show' or sub == 'refresh': show_comments = True
-            elif sub == 'hide': show_comments = False
+            if action == 'comment':
+                sub = data[1]
+                if sub == 'show' or sub == 'refresh': show_comments = True
+                elif sub == 'hide': show_comments = False
+                await set_comments_open(conn, message_id, show_comments)
         
-        elif action == 'react':
-            rtype = data[1]
-            val = 1 if rtype == 'like' else -1
-            curr = await conn.fetchval("SELECT reaction_type FROM reactions WHERE channel_message_id = $1 AND user_id = $2", message_id, user_id)
-            if curr is None:
-                await conn.execute("INSERT INTO reactions (channel_message_id, user_id, reaction_type) VALUES ($1, $2, $3)", message_id, user_id, val)
-                if rtype == 'like': notify_type = "like"; check_pin = True
-            elif curr == val:
-                await conn.execute("DELETE FROM reactions WHERE channel_message_id = $1 AND user_id = $2", message_id, user_id)
-            else:
-                await conn.execute("UPDATE reactions SET reaction_type = $1 WHERE channel_message_id = $2 AND user_id = $3", val, message_id, user_id)
-                if rtype == 'like': notify_type = "like"; check_pin = True
+            elif action == 'react':
+                rtype = data[1]
+                val = 1 if rtype == 'like' else -1
+                # 单次往返：切换 + 返回旧状态/新状态/最新计数；通知与切换同一事务落库
+                try:
+                    async with conn.transaction():
+                        _, new_value, counts = await toggle_reaction(conn, message_id, user_id, val)
+                        if new_value == 1:
+                            await record_notification_event(conn, author_id, user_id, query.from_user.full_name, message_id, content, "like")
+                except asyncpg.ForeignKeyViolationError:
+                    # 帖子在应答后被删除 (外键模式)
+                    logger.info(f"ℹ️ 帖子 {message_id} 已不在 submissions 中，忽略点赞")
+                    return
         
-        elif action == 'collect':
-            cid = await conn.fetchval("SELECT id FROM collections WHERE channel_message_id = $1 AND user_id = $2", message_id, user_id)
-            if cid: await conn.execute("DELETE FROM collections WHERE id = $1", cid)
-            else: await conn.execute("INSERT INTO collections (channel_message_id, user_id) VALUES ($1, $2)", message_id, user_id); notify_type = "collect"
-
-        if notify_type and author_id:
-            await send_notification(context, author_id, user_id, query.from_user.full_name, message_id, content, notify_type)
-
-        # 构建最终文案
-        final_caption = base_caption
-        if show_comments:
-            # 默认不展开任何楼中楼
-            c_text = await build_threaded_comment_section(conn, message_id, expanded_comment_id=None)
-            final_caption += c_text
-
-        # 4. 构建按钮 (重点修复)
-        counts = await get_all_counts(conn, message_id)
+            elif action == 'collect':
+                try:
+                    async with conn.transaction():
+                        _, is_collected, counts = await toggle_collection(conn, message_id, user_id)
+                        collection_total_cache.invalidate(user_id)
+                        await publish_invalidation(conn, "collections", user_id)
+                        if is_collected:
+                            await record_notification_event(conn, author_id, user_id, query.from_user.full_name, message_id, content, "collect")
+                except asyncpg.ForeignKeyViolationError:
+                    logger.info(f"ℹ️ 帖子 {message_id} 已不在 submissions 中，忽略收藏")
+                    return
+
+            # 构建最终文案
+            final_caption = base_caption
+            if show_comments:
+                # 默认不展开任何楼中楼
+                c_text = await build_threaded_comment_section(conn, message_id, expanded_comment_id=None)
+                final_caption += c_text
+
+            # 4. 构建按钮 (重点修复)
+            if counts is None:
+                counts = await get_all_counts(conn, message_id)
         
-        if not show_comments:
-            # === 模式 A: 收起状态 ===
-            # 显示 [点赞栏] 和 [评论按钮]
-            row1 = [
-                InlineKeyboardButton(f"👍 赞 {counts['likes']}", callback_data=f"react:like:{message_id}"),
-                InlineKeyboardButton(f"👎 踩 {counts['dislikes']}", callback_data=f"react:dislike:{message_id}"),
-                InlineKeyboardButton(f"⭐ 收藏 {counts['collections']}", callback_data=f"collect:{message_id}"),
-            ]
-            row2 = [InlineKeyboardButton(f"💬 评论 {counts['comments']}", callback_data=f"comment:show:{message_id}")]
-            markup = InlineKeyboardMarkup([row1, row2])
-            
-        else:
-            # === 模式 B: 阅读评论状态 ===
-            # 【修复】隐藏点赞栏，只显示功能键
-            add_url = f"https://t.me/{BOT_USERNAME}?start=comment_{message_id}"
-            del_url = f"https://t.me/{BOT_USERNAME}?start=manage_comments_{message_id}"
-            
-            row1 = [
-                InlineKeyboardButton("✍️ 发表", url=add_url),
-                InlineKeyboardButton("🗑️ 删除", url=del_url),
-                InlineKeyboardButton("🔄 刷新", callback_data=f"comment:refresh:{message_id}")
-            ]
-            row2 = [InlineKeyboardButton("⬆️ 收起", callback_data=f"comment:hide:{message_id}")]
-            markup = InlineKeyboardMarkup([row1, row2])
-
-        if check_pin and counts['likes'] >= 100:
-            await check_and_pin_if_hot(context, message_id, counts['likes'])
-            if not final_caption.startswith("🔥"): final_caption = "🔥 " + final_caption
-
-        if final_caption != query.message.caption_html or markup != query.message.reply_markup:
-            try: await query.edit_message_caption(caption=final_caption, parse_mode=ParseMode.HTML, reply_markup=markup)
-            except: pass
+            markup = build_post_markup(message_id, counts, show_comments)
+
+            # 置顶由热度榜任务维护，这里只按置顶状态保持火标
+            if counts['pinned'] and not final_caption.startswith("🔥"):
+                final_caption = "🔥 " + final_caption
+
+            if final_caption != query.message.caption_html or markup != query.message.reply_markup:
+                # 交给合并器异步发送，连续点击只会落地最后一次状态
+                guard = None
+                if WORKER_PROCESSES > 1:
+                    guard = render_guard(message_id, await bump_render_seq(conn, message_id))
+                schedule_edit(context.bot, query.message.chat_id, message_id, caption=final_caption, reply_markup=markup, guard=guard)
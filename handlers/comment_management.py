@@ -6,7 +6,9 @@ from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 
 from config import CHANNEL_USERNAME, DELETING_COMMENT
-from database import get_pool
+from database import get_pool, adjust_post_stats
+from .channel_interact import invalidate_comment_section
+from cluster import publish_invalidation
 
 logger = logging.getLogger(__name__)
 
@@ -184,7 +186,14 @@ async def handle_delete_comment_input(update: Update, context: ContextTypes.DEFA
             await update.message.reply_text("❌ 你没有权限删除这条评论。")
             return ConversationHandler.END
         
-        await conn.execute("DELETE FROM comments WHERE id = $1", comment_id)
+        async with conn.transaction():
+            deleted = await conn.fetchrow("DELETE FROM comments WHERE id = $1 RETURNING channel_message_id, timestamp", comment_id)
+            deleted_from = deleted['channel_message_id'] if deleted else None
+            if deleted_from is not None:
+                await adjust_post_stats(conn, deleted_from, comments=-1, at=deleted['timestamp'])
+                await publish_invalidation(conn, "comments", deleted_from)
+        if deleted_from is not None:
+            invalidate_comment_section(deleted_from)
     
     preview = comment_text[:50] + "..." if len(comment_text) > 50 else comment_text
     await update.message.reply_text(
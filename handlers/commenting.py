@@ -1,13 +1,17 @@
 # handlers/commenting.py
 
 import logging
+import asyncpg
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 from telegram.error import TelegramError
 
 from config import COMMENTING, CHANNEL_USERNAME
-from database import get_pool
+from database import get_pool, adjust_post_stats
+from .channel_interact import invalidate_comment_section
+from cluster import publish_invalidation
+from .notifications import record_notification_event
 
 logger = logging.getLogger(__name__)
 
@@ -61,22 +65,39 @@ async def handle_new_comment(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ 会话已过期，请重新从频道点击评论。")
         return ConversationHandler.END
 
+    post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
+
     pool = await get_pool()
     async with pool.acquire() as conn:
-        # 保存评论
-        await conn.execute(
-            "INSERT INTO comments (channel_message_id, user_id, user_name, comment_text, parent_id) VALUES ($1, $2, $3, $4, $5)",
-            message_id, user.id, user.full_name, comment_text, parent_id
-        )
-        
-        # 获取作者信息用于通知
-        post_info = await conn.fetchrow(
-            "SELECT user_id, content_text FROM submissions WHERE channel_message_id = $1",
-            message_id
-        )
+        # 保存评论 (同一事务内更新计数、写入通知)
+        try:
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO comments (channel_message_id, user_id, user_name, comment_text, parent_id) VALUES ($1, $2, $3, $4, $5)",
+                    message_id, user.id, user.full_name, comment_text, parent_id
+                )
+                await adjust_post_stats(conn, message_id, comments=1)
+                await publish_invalidation(conn, "comments", message_id)
+            
+                # 获取作者信息用于通知
+                post_info = await conn.fetchrow(
+                    "SELECT user_id, content_text FROM submissions WHERE channel_message_id = $1",
+                    message_id
+                )
+
+                # --- 通知逻辑 (通知楼主，按窗口合并后发送；不通知自己) ---
+                if post_info:
+                    await record_notification_event(
+                        conn, post_info['user_id'], user.id, user.full_name, message_id,
+                        post_info['content_text'], "comment", detail=comment_text
+                    )
+        except asyncpg.ForeignKeyViolationError:
+            # 开启外键时，未登记或已删除的帖子无法评论
+            await update.message.reply_text("❌ 这条帖子不存在或未在机器人登记，无法评论。")
+            return ConversationHandler.END
+        invalidate_comment_section(message_id)
 
     # === 核心修改：发送带有返回按钮的成功消息 ===
-    post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
     
     # 如果是楼中楼回复，文字稍微区分一下
     success_text = "✅ <b>回复成功！</b>" if parent_id else "✅ <b>评论成功！</b>"
@@ -93,21 +114,5 @@ async def handle_new_comment(update: Update, context: ContextTypes.DEFAULT_TYPE)
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-    # --- 通知逻辑 (通知楼主) ---
-    if post_info:
-        author_id = post_info['user_id']
-        content_text = post_info['content_text']
-        # 不通知自己
-        if author_id != user.id:
-            actor = f'<a href="tg://user?id={user.id}">{user.full_name}</a>'
-            preview = (content_text or "作品")[:20].replace('<', '&lt;').replace('>', '&gt;')
-            
-            # 这里的链接也做成跳回频道的
-            msg = f"💬 {actor} 评论了你的作品 <a href='{post_url}'>{preview}</a>\n\n内容：{comment_text}"
-            try: 
-                await context.bot.send_message(chat_id=author_id, text=msg, parse_mode=ParseMode.HTML)
-            except: 
-                pass
-
     context.user_data.clear()
     return ConversationHandler.END
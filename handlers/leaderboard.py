@@ -0,0 +1,141 @@
+# handlers/leaderboard.py
+
+import asyncio
+import logging
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from config import CHANNEL_USERNAME, LEADERBOARD_INTERVAL, LEADERBOARD_SIZE
+from database import get_pool
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+BOARDS = {
+    "week": "🏆 本周作者",
+    "month": "📅 本月作者",
+    "collected": "⭐ 最多收藏",
+}
+BOARD_DAYS = {"week": 7, "month": 30}
+
+# 渲染好的榜单文本：汇总任务刷新后重建，其他进程最多滞后一个刷新周期
+_board_cache = TTLCache(len(BOARDS), LEADERBOARD_INTERVAL)
+_rollup_lock = asyncio.Lock()
+
+
+async def refresh_rollups(conn) -> int:
+    """
+    把 activity_log 中的增减流水并入按作者/天的汇总表，返回更新的汇总行数。
+    水位线取当前最老的活跃事务号：txid 小于它的事务都已结束，流水不会再变化，
+    消费后即删除，下次只处理水位线之后新产生的流水。
+    """
+    async with conn.transaction():
+        watermark = await conn.fetchval("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        result = await conn.execute('''
+            WITH ev AS (
+                DELETE FROM activity_log WHERE txid < $1
+                RETURNING channel_message_id, kind, delta, created_at
+            ),
+            agg AS (
+                SELECT s.user_id AS author_id, ev.created_at::date AS day,
+                       COALESCE(SUM(ev.delta) FILTER (WHERE ev.kind = 'like'), 0) AS likes,
+                       COALESCE(SUM(ev.delta) FILTER (WHERE ev.kind = 'collect'), 0) AS collections
+                FROM ev JOIN submissions s ON s.channel_message_id = ev.channel_message_id
+                GROUP BY s.user_id, ev.created_at::date
+            )
+            INSERT INTO author_activity_daily AS a (author_id, day, likes, collections)
+            SELECT author_id, day, likes, collections FROM agg
+            ON CONFLICT (author_id, day) DO UPDATE SET
+                likes = a.likes + EXCLUDED.likes,
+                collections = a.collections + EXCLUDED.collections
+        ''', watermark)
+        # 榜单最多看 30 天，更早的汇总行没有用处
+        await conn.execute("DELETE FROM author_activity_daily WHERE day < CURRENT_DATE - 60")
+    return int(result.split()[-1])
+
+
+async def render_board(conn, board: str) -> str:
+    """从汇总表渲染榜单 (只读最近 N 天的汇总行 / post_stats 索引前 N 条，与明细表大小无关)"""
+    lines = [f"<b>{BOARDS[board]}</b>\n"]
+    if board == "collected":
+        rows = await conn.fetch(
+            """
+            SELECT ps.channel_message_id, ps.collections, s.content_text
+            FROM post_stats ps JOIN submissions s ON s.channel_message_id = ps.channel_message_id
+            WHERE ps.collections > 0
+            ORDER BY ps.collections DESC LIMIT $1
+            """,
+            LEADERBOARD_SIZE
+        )
+        for idx, row in enumerate(rows, 1):
+            preview = (row['content_text'] or "作品")[:20].replace('<', '&lt;').replace('>', '&gt;')
+            post_url = f"https://t.me/{CHANNEL_USERNAME}/{row['channel_message_id']}"
+            lines.append(f"{idx}. <a href='{post_url}'>{preview}</a>  ⭐ {row['collections']}")
+    else:
+        rows = await conn.fetch(
+            """
+            SELECT a.author_id, u.full_name, SUM(a.likes) AS likes, SUM(a.collections) AS collections
+            FROM author_activity_daily a LEFT JOIN users u ON u.user_id = a.author_id
+            WHERE a.day > CURRENT_DATE - $1::int
+            GROUP BY a.author_id, u.full_name
+            HAVING SUM(a.likes) + SUM(a.collections) > 0
+            ORDER BY SUM(a.likes) + SUM(a.collections) DESC LIMIT $2
+            """,
+            BOARD_DAYS[board], LEADERBOARD_SIZE
+        )
+        for idx, row in enumerate(rows, 1):
+            name = (row['full_name'] or "匿名用户").replace('<', '&lt;').replace('>', '&gt;')
+            lines.append(f"{idx}. {name}  👍 {row['likes']}  ⭐ {row['collections']}")
+    if len(lines) == 1:
+        lines.append("暂无数据，快去频道互动吧！")
+    lines.append(f"\n<i>每 {max(1, LEADERBOARD_INTERVAL // 60)} 分钟更新</i>")
+    return "\n".join(lines)
+
+
+async def get_board_text(board: str) -> str:
+    text = _board_cache.get(board)
+    if text is None:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            text = await render_board(conn, board)
+        _board_cache.put(board, text)
+    return text
+
+
+async def refresh_leaderboards(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """定时任务：增量刷新汇总表并重建榜单缓存"""
+    if _rollup_lock.locked(): return
+    async with _rollup_lock:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            updated = await refresh_rollups(conn)
+            for board in BOARDS:
+                _board_cache.put(board, await render_board(conn, board))
+        if updated:
+            logger.info(f"🏆 排行榜汇总已更新 {updated} 行")
+
+
+def _board_markup(current: str) -> InlineKeyboardMarkup:
+    row = [
+        InlineKeyboardButton(("✅ " if key == current else "") + title, callback_data=f"top:{key}")
+        for key, title in BOARDS.items()
+    ]
+    return InlineKeyboardMarkup([row, [InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]])
+
+
+async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/top 命令与主菜单 "排行榜" 按钮"""
+    query = update.callback_query
+    board = "week"
+    if query:
+        await query.answer()
+        board = query.data.split(':')[1]
+        if board not in BOARDS: return
+    text = await get_board_text(board)
+    if query:
+        try:
+            await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=_board_markup(board), disable_web_page_preview=True)
+        except Exception: pass
+    else:
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=_board_markup(board), disable_web_page_preview=True)
@@ -0,0 +1,172 @@
+# handlers/notifications.py
+
+import logging
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from config import CHANNEL_USERNAME, NOTIFY_AGGREGATE_WINDOW, NOTIFY_DIGEST_INTERVAL
+from database import get_pool
+from notifier import enqueue_notification
+
+logger = logging.getLogger(__name__)
+
+# 通知模板：{actors} 为一个或多个互动者，{post_link} 为帖子链接
+NOTIFY_TEMPLATES = {
+    "like": "👍 {actors} 赞了你的作品 {post_link}",
+    "collect": "⭐ {actors} 收藏了你的作品 {post_link}",
+    "comment": "💬 {actors} 评论了你的作品 {post_link}",
+}
+
+NOTIFY_MODES = {
+    "instant": "🔔 即时 (同一作品的互动合并发送)",
+    "digest": "📬 每小时汇总",
+    "mute": "🔕 关闭互动通知",
+}
+
+MAX_NAMED_ACTORS = 2
+
+
+def _escape(text: str) -> str:
+    return (text or "").replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+async def record_notification_event(conn, author_id: int, actor_id: int, actor_name: str, message_id: int,
+                                    content_preview: str, action_type: str, detail: str = None) -> None:
+    """记录一次互动 (需与触发动作处于同一事务)，由后台任务按窗口合并后写入发件箱"""
+    if not author_id or author_id == actor_id or action_type not in NOTIFY_TEMPLATES: return
+    await conn.execute(
+        """
+        INSERT INTO notification_events (author_id, channel_message_id, action, actor_id, actor_name, content_preview, detail)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        """,
+        author_id, message_id, action_type, actor_id, actor_name, content_preview, detail
+    )
+
+
+def _post_link(message_id: int, content_preview: str) -> str:
+    post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
+    preview = _escape((content_preview or "作品")[:20]) + "..."
+    return f'<a href="{post_url}">{preview}</a>'
+
+
+def _format_actors(events) -> str:
+    """合并互动者：同一人多次互动只算一次；超过两人时显示为 "A、B 等 N 人" """
+    actors = {}
+    for e in events:
+        actors.setdefault(e['actor_id'], e['actor_name'])
+    links = [f'<a href="tg://user?id={uid}">{_escape(name)}</a>' for uid, name in actors.items()]
+    if len(links) <= MAX_NAMED_ACTORS:
+        return "、".join(links)
+    return "、".join(links[:MAX_NAMED_ACTORS]) + f" 等 {len(links)} 人"
+
+
+def render_post_events(message_id: int, events) -> str:
+    """把同一帖子的一组互动渲染成通知文本 (每种动作一行)"""
+    post_link = _post_link(message_id, events[-1]['content_preview'])
+    lines = []
+    for action in NOTIFY_TEMPLATES:
+        group = [e for e in events if e['action'] == action]
+        if not group: continue
+        lines.append(NOTIFY_TEMPLATES[action].format(actors=_format_actors(group), post_link=post_link))
+        # 只有一条评论时附上评论内容
+        if action == "comment" and len(group) == 1 and group[0]['detail']:
+            lines[-1] += f"\n\n内容：{_escape(group[0]['detail'])}"
+    return "\n".join(lines)
+
+
+async def _take_ready_events(conn, mode: str, age_seconds: int, per_post: bool):
+    """取出并删除已到期的互动：instant 按 (作者, 帖子) 计时，digest 按作者计时"""
+    group_cols = "e.author_id, e.channel_message_id" if per_post else "e.author_id"
+    join_cond = "e.author_id = r.author_id AND e.channel_message_id = r.channel_message_id" if per_post else "e.author_id = r.author_id"
+    return await conn.fetch(
+        f"""
+        WITH ready AS (
+            SELECT {group_cols} FROM notification_events e
+            LEFT JOIN notification_prefs p ON p.user_id = e.author_id
+            WHERE COALESCE(p.mode, 'instant') = $1
+            GROUP BY {group_cols}
+            HAVING MIN(e.created_at) <= CURRENT_TIMESTAMP - make_interval(secs => $2)
+        )
+        DELETE FROM notification_events e USING ready r WHERE {join_cond}
+        RETURNING e.id, e.author_id, e.channel_message_id, e.action, e.actor_id, e.actor_name, e.content_preview, e.detail
+        """,
+        mode, age_seconds
+    )
+
+
+def _group_by(rows, *keys):
+    groups = {}
+    for row in sorted(rows, key=lambda r: r['id']):
+        groups.setdefault(tuple(row[k] for k in keys), []).append(row)
+    return groups
+
+
+async def flush_notification_events(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """后台任务：合并到期的互动通知并写入发件箱"""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # 关闭通知的用户：直接丢弃
+            await conn.execute(
+                "DELETE FROM notification_events e USING notification_prefs p WHERE p.user_id = e.author_id AND p.mode = 'mute'"
+            )
+
+            # 即时模式：同一作品的互动在窗口期内合并成一条
+            rows = await _take_ready_events(conn, "instant", NOTIFY_AGGREGATE_WINDOW, per_post=True)
+            for (author_id, message_id), events in _group_by(rows, 'author_id', 'channel_message_id').items():
+                await enqueue_notification(conn, author_id, render_post_events(message_id, events))
+
+            # 汇总模式：每个作者每个周期一条，按作品分段
+            rows = await _take_ready_events(conn, "digest", NOTIFY_DIGEST_INTERVAL, per_post=False)
+            for (author_id,), author_events in _group_by(rows, 'author_id').items():
+                sections = [
+                    render_post_events(message_id, events)
+                    for (message_id,), events in _group_by(author_events, 'channel_message_id').items()
+                ]
+                text = "📬 <b>互动汇总</b>\n\n" + "\n\n".join(sections)
+                await enqueue_notification(conn, author_id, text)
+
+
+def _prefs_markup(current: str) -> InlineKeyboardMarkup:
+    rows = []
+    for mode, label in NOTIFY_MODES.items():
+        mark = "✅ " if mode == current else ""
+        rows.append([InlineKeyboardButton(mark + label, callback_data=f"notify_mode:{mode}")])
+    return InlineKeyboardMarkup(rows)
+
+
+async def show_notify_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/notify：查看并修改互动通知方式"""
+    user_id = update.effective_user.id
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        mode = await conn.fetchval("SELECT mode FROM notification_prefs WHERE user_id = $1", user_id) or "instant"
+    await update.message.reply_text(
+        "🔔 <b>互动通知设置</b>\n\n点赞、收藏和评论通知的接收方式：",
+        parse_mode=ParseMode.HTML,
+        reply_markup=_prefs_markup(mode)
+    )
+
+
+async def handle_notify_mode(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    mode = query.data.split(':')[1]
+    if mode not in NOTIFY_MODES: return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO notification_prefs (user_id, mode) VALUES ($1, $2)
+            ON CONFLICT (user_id) DO UPDATE SET mode = EXCLUDED.mode
+            """,
+            query.from_user.id, mode
+        )
+    try:
+        await query.edit_message_text(
+            f"🔔 <b>互动通知设置</b>\n\n已切换为：{NOTIFY_MODES[mode]}",
+            parse_mode=ParseMode.HTML,
+            reply_markup=_prefs_markup(mode)
+        )
+    except Exception: pass
@@ -0,0 +1,167 @@
+# handlers/search.py
+
+import logging
+import asyncpg
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from config import CHOOSING, SEARCHING, CHANNEL_USERNAME, SEARCH_TIMEOUT_MS
+from database import get_pool
+
+logger = logging.getLogger(__name__)
+
+RESULTS_PER_PAGE = 10
+MAX_TERMS = 5
+MAX_TERM_LENGTH = 50
+# pg_trgm 从不足 3 个字符的关键词里提取不出三元组，ILIKE 无法用索引缩小范围，只会全表扫描到超时；
+# 因此至少要有一个关键词达到该长度 (其余短关键词只在索引命中的结果里过滤)
+MIN_INDEXED_TERM_LENGTH = 3
+SHORT_TERMS_HINT = (
+    f"⚠️ 关键词太短：请至少包含一个 {MIN_INDEXED_TERM_LENGTH} 个字以上的关键词，"
+    "例如搜 “周末活动” 而不是 “周末”。"
+)
+
+BACK_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]])
+
+
+def _parse_terms(text: str):
+    """按空白切分关键词 (多个关键词需同时命中)"""
+    terms = [t[:MAX_TERM_LENGTH] for t in (text or "").split() if t.strip()]
+    return terms[:MAX_TERMS]
+
+
+def _has_indexed_term(terms) -> bool:
+    return any(len(t) >= MIN_INDEXED_TERM_LENGTH for t in terms)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def _search_sql(term_count: int, cond: str, order: str) -> str:
+    """
+    帖子正文或评论命中全部关键词的帖子，按 channel_message_id 游标分页。
+    两个分支各自走 trgm 索引并只取一页，合并后再截断。
+    $1 游标，$2 条数，$3.. 关键词
+    """
+    def matches(column):
+        return " AND ".join(f"{column} ILIKE ${i + 3}" for i in range(term_count))
+    return f"""
+        SELECT s.channel_message_id, s.content_text FROM submissions s
+        WHERE s.channel_message_id IN (
+            (SELECT channel_message_id FROM submissions
+             WHERE {matches('content_text')} AND channel_message_id {cond} $1
+             ORDER BY channel_message_id {order} LIMIT $2)
+            UNION
+            (SELECT DISTINCT channel_message_id FROM comments
+             WHERE {matches('comment_text')} AND channel_message_id {cond} $1
+             ORDER BY channel_message_id {order} LIMIT $2)
+        )
+        ORDER BY s.channel_message_id {order} LIMIT $2
+    """
+
+
+async def _fetch_results(terms, direction: str, cursor: int):
+    """返回 (本页结果, 是否还有更早的结果)；超时抛出 asyncpg.QueryCanceledError"""
+    patterns = [_like_pattern(t) for t in terms]
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL statement_timeout = {int(SEARCH_TIMEOUT_MS)}")
+            if direction == 'p':
+                rows = await conn.fetch(_search_sql(len(terms), ">", "ASC"), cursor, RESULTS_PER_PAGE, *patterns)
+                return list(reversed(rows)), True
+            if cursor is None:
+                cursor = 2 ** 63 - 1
+            rows = await conn.fetch(_search_sql(len(terms), "<", "DESC"), cursor, RESULTS_PER_PAGE + 1, *patterns)
+            return rows[:RESULTS_PER_PAGE], len(rows) > RESULTS_PER_PAGE
+
+
+async def _render_results(context: ContextTypes.DEFAULT_TYPE, page: int, direction: str = None, cursor: int = None):
+    """返回 (文本, 按钮)"""
+    terms = context.user_data.get('search_terms')
+    if not terms:
+        return "⚠️ 搜索已过期，请重新搜索。", BACK_MARKUP
+    try:
+        rows, has_older = await _fetch_results(terms, direction, cursor)
+    except asyncpg.QueryCanceledError:
+        return "⏳ 搜索超时，请换用更长或更具体的关键词。", BACK_MARKUP
+
+    keyword = " ".join(terms).replace('<', '&lt;').replace('>', '&gt;')
+    if not rows and page == 1:
+        return f"🔍 没有找到包含 “{keyword}” 的作品或评论。", BACK_MARKUP
+
+    text = f"🔍 <b>搜索：</b>{keyword} (第 {page} 页)\n\n"
+    for i, row in enumerate(rows):
+        msg_id = row['channel_message_id']
+        post_text = (row['content_text'] or "[媒体文件]").strip().replace('<', '&lt;').replace('>', '&gt;')
+        if len(post_text) > 20: post_text = post_text[:20] + "..."
+        post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
+        text += f"<b>{(page - 1) * RESULTS_PER_PAGE + i + 1}.</b> <a href='{post_url}'>{post_text}</a>\n"
+
+    nav_buttons = []
+    if page > 1 and rows:
+        nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f"search_page:{page - 1}:p:{rows[0]['channel_message_id']}"))
+    if has_older and rows:
+        nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f"search_page:{page + 1}:n:{rows[-1]['channel_message_id']}"))
+    keyboard = [nav_buttons, [InlineKeyboardButton("🔍 重新搜索", callback_data='search_prompt')], [InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def prompt_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """主菜单 "搜索" 按钮"""
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(
+        "🔍 请输入要搜索的关键词 (多个关键词用空格分开)：\n\n回复 /cancel 取消。",
+        reply_markup=BACK_MARKUP
+    )
+    return SEARCHING
+
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """/search [关键词]"""
+    terms = _parse_terms(" ".join(context.args or []))
+    if not terms:
+        await update.message.reply_text("🔍 请输入要搜索的关键词 (多个关键词用空格分开)：\n\n回复 /cancel 取消。")
+        return SEARCHING
+    if not _has_indexed_term(terms):
+        await update.message.reply_text(SHORT_TERMS_HINT + "\n\n回复 /cancel 取消。")
+        return SEARCHING
+    context.user_data['search_terms'] = terms
+    text, markup = await _render_results(context, 1)
+    await update.message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+    return CHOOSING
+
+
+async def handle_search_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    terms = _parse_terms(update.message.text)
+    if not terms:
+        await update.message.reply_text("请输入有效的关键词。")
+        return SEARCHING
+    if not _has_indexed_term(terms):
+        await update.message.reply_text(SHORT_TERMS_HINT)
+        return SEARCHING
+    context.user_data['search_terms'] = terms
+    text, markup = await _render_results(context, 1)
+    await update.message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+    return CHOOSING
+
+
+async def navigate_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """翻页按钮：search_page:页码:方向:游标，方向 n=更早 p=更新"""
+    query = update.callback_query
+    await query.answer()
+    parts = query.data.split(':')
+    try:
+        page, direction, cursor = max(1, int(parts[1])), parts[2], int(parts[3])
+    except (IndexError, ValueError):
+        page, direction, cursor = 1, None, None
+    if direction not in ('n', 'p') or page == 1:
+        direction, cursor = None, None
+    text, markup = await _render_results(context, page, direction, cursor)
+    try:
+        await query.edit_message_text(text, reply_markup=markup, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+    except Exception: pass
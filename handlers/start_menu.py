@@ -2,12 +2,12 @@
 
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
 
-from config import CHOOSING, CHANNEL_ID, CHANNEL_USERNAME
-from .channel_interact import build_threaded_comment_section
-from database import get_pool
+from config import CHOOSING, CHANNEL_ID, CHANNEL_USERNAME, WORKER_PROCESSES
+from .channel_interact import build_threaded_comment_section, set_comments_open, get_post_source, build_post_markup, EMPTY_COUNTS
+from database import get_pool, post_lock, bump_render_seq, render_guard
+from edit_scheduler import schedule_edit
 
 logger = logging.getLogger(__name__)
 
@@ -15,51 +15,29 @@ async def update_thread_view(context, message_id, expanded_cid=None):
     """更新频道消息（展开/收起楼中楼）"""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        db_row = await conn.fetchrow("SELECT content_text, user_id, user_name FROM submissions WHERE channel_message_id = $1", message_id)
-        if not db_row: return
+        source = await get_post_source(conn, message_id)
+        if not source: return
+        base_caption = source[0]
         
-        # 重建页脚
-        content = db_row['content_text']
-        author_id = db_row['user_id']
-        try: u_name = (await context.bot.get_chat(author_id)).username or ""
-        except: u_name = ""
+        # 帖子级锁：与频道按钮回调串行执行
+        async with post_lock(conn, message_id):
+            # 构建评论内容
+            await set_comments_open(conn, message_id, True)
+            c_text = await build_threaded_comment_section(conn, message_id, expanded_comment_id=expanded_cid)
+            final_caption = base_caption + c_text
         
-        author_link = f'👤 作者: <a href="https://t.me/{u_name}">{db_row["user_name"]}</a>' if u_name else f'👤 作者: <a href="tg://user?id={author_id}">{db_row["user_name"]}</a>'
-        my_link = f'<a href="https://t.me/{context.bot.username}?start=main">📱 我的</a>'
-        base_caption = (content or "") + f"\n\n━━━━━━━━━━━━━━\n{author_link}  |  {my_link}"
-        
-        # 构建评论内容
-        c_text = await build_threaded_comment_section(conn, message_id, expanded_comment_id=expanded_cid)
-        final_caption = base_caption + c_text
-        
-        # 保持火标
-        is_pinned = await conn.fetchval("SELECT id FROM pinned_posts WHERE channel_message_id = $1", message_id)
-        if is_pinned and not final_caption.startswith("🔥"):
-            final_caption = "🔥 " + final_caption
+            # 保持火标
+            is_pinned = await conn.fetchval("SELECT pinned FROM post_stats WHERE channel_message_id = $1", message_id)
+            if is_pinned and not final_caption.startswith("🔥"):
+                final_caption = "🔥 " + final_caption
 
-        # === 按钮栏 (展开状态下：不显示点赞栏) ===
-        add_url = f"https://t.me/{context.bot.username}?start=comment_{message_id}"
-        del_url = f"https://t.me/{context.bot.username}?start=manage_comments_{message_id}"
-        
-        row_ops = [
-            InlineKeyboardButton("✍️ 发表", url=add_url),
-            InlineKeyboardButton("🗑️ 删除", url=del_url),
-            InlineKeyboardButton("🔄 刷新", callback_data=f"comment:refresh:{message_id}")
-        ]
-        row_close = [InlineKeyboardButton("⬆️ 收起", callback_data=f"comment:hide:{message_id}")]
-        
-        markup = InlineKeyboardMarkup([row_ops, row_close])
+            # === 按钮栏 (展开状态下：不显示点赞栏，与频道回调同一套按钮) ===
+            markup = build_post_markup(message_id, EMPTY_COUNTS, show_comments=True)
         
-        try:
-            await context.bot.edit_message_caption(
-                chat_id=CHANNEL_ID,
-                message_id=message_id,
-                caption=final_caption,
-                parse_mode=ParseMode.HTML,
-                reply_markup=markup
-            )
-        except Exception as e:
-            logger.error(f"Thread update error: {e}")
+            guard = None
+            if WORKER_PROCESSES > 1:
+                guard = render_guard(message_id, await bump_render_seq(conn, message_id))
+            schedule_edit(context.bot, CHANNEL_ID, message_id, caption=final_caption, reply_markup=markup, guard=guard)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -111,7 +89,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return await show_delete_comment_menu(update, context)
 
     # 主菜单
-    kb = [[InlineKeyboardButton("✍️ 发布作品", callback_data='submit_post'), InlineKeyboardButton("📂 我的作品", callback_data='my_posts_page:1')], [InlineKeyboardButton("⭐ 我的收藏", callback_data='my_collections_page:1')]]
+    kb = [[InlineKeyboardButton("✍️ 发布作品", callback_data='submit_post'), InlineKeyboardButton("📂 我的作品", callback_data='my_posts_page:1')], [InlineKeyboardButton("⭐ 我的收藏", callback_data='my_collections_page:1'), InlineKeyboardButton("🏆 排行榜", callback_data='top:week')], [InlineKeyboardButton("🔍 搜索", callback_data='search_prompt')]]
     text = "👋 你好！欢迎使用发布助手。\n\n请选择一个操作："
     if update.callback_query: await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
     else: await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(kb))
@@ -3,6 +3,7 @@
 import math
 import logging
 import asyncio
+from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, ConversationHandler
@@ -18,9 +19,16 @@ from config import (
     CHOOSING, 
     BROWSING_POSTS, 
     BROWSING_COLLECTIONS,
-    DELETING_WORK
+    DELETING_WORK,
+    RECONCILE_BATCH_SIZE,
+    RECONCILE_RATE,
+    POST_FOREIGN_KEYS,
 )
-from database import get_pool
+from database import get_pool, COMMENTS_OPEN
+from cluster import publish_invalidation_batch
+from .channel_interact import get_all_counts, build_post_markup, invalidate_posts, invalidate_collection_totals, collection_total_cache
+from edit_scheduler import schedule_edit
+from request_scheduler import with_priority, BACKGROUND
 
 logger = logging.getLogger(__name__)
 
@@ -35,70 +43,91 @@ async def safe_delete_message(bot, chat_id, message_id):
 
 # ================== 数据库与工具函数 (保持不变) ==================
 
+# 子表：开启外键时由 submissions 级联删除
+_POST_CHILD_TABLES = ("comments", "reactions", "collections", "pinned_posts")
+# 无外键的附属表：始终显式删除
+_POST_AUX_TABLES = ("post_stats", "notification_events")
+
+
+async def purge_posts(conn, channel_message_ids) -> int:
+    """批量删除帖子及其所有相关数据 (单事务、数组参数，每张表一条语句)，返回删除的帖子数"""
+    ids = list(set(channel_message_ids))
+    if not ids: return 0
+    async with conn.transaction():
+        # 收藏过这些帖子的用户："我的收藏" 总数缓存需要失效
+        if POST_FOREIGN_KEYS:
+            # 收藏随 submissions 级联删除，先查出收藏者
+            collectors = await conn.fetchval(
+                "SELECT array_agg(DISTINCT user_id) FROM collections WHERE channel_message_id = ANY($1::bigint[])", ids
+            ) or []
+        else:
+            rows = await conn.fetch("DELETE FROM collections WHERE channel_message_id = ANY($1::bigint[]) RETURNING user_id", ids)
+            collectors = list({row['user_id'] for row in rows})
+        tables = _POST_AUX_TABLES if POST_FOREIGN_KEYS else tuple(t for t in _POST_CHILD_TABLES if t != "collections") + _POST_AUX_TABLES
+        for table in tables:
+            await conn.execute(f"DELETE FROM {table} WHERE channel_message_id = ANY($1::bigint[])", ids)
+        result = await conn.execute("DELETE FROM submissions WHERE channel_message_id = ANY($1::bigint[])", ids)
+        await publish_invalidation_batch(conn, "posts", ids)
+        await publish_invalidation_batch(conn, "collections", collectors)
+    invalidate_posts(ids)
+    invalidate_collection_totals(collectors)
+    return int(result.split()[-1])
+
+
 async def delete_post_data(conn, channel_message_id: int):
     """级联删除所有相关数据"""
-    await conn.execute("DELETE FROM comments WHERE channel_message_id = $1", channel_message_id)
-    await conn.execute("DELETE FROM reactions WHERE channel_message_id = $1", channel_message_id)
-    await conn.execute("DELETE FROM collections WHERE channel_message_id = $1", channel_message_id)
-    await conn.execute("DELETE FROM pinned_posts WHERE channel_message_id = $1", channel_message_id)
-    await conn.execute("DELETE FROM submissions WHERE channel_message_id = $1", channel_message_id)
+    await purge_posts(conn, [channel_message_id])
 
 async def check_channel_post_directly(context: ContextTypes.DEFAULT_TYPE, pool, post):
-    """直接尝试在频道内刷新该消息的按钮"""
+    """直接尝试在频道内刷新该消息的按钮 (按记录的视图状态还原按钮)，消息已被删除时返回 None"""
     msg_id = post['channel_message_id']
     async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT reaction_type, COUNT(*) as count FROM reactions WHERE channel_message_id = $1 GROUP BY reaction_type", msg_id)
-        counts = {row['reaction_type']: row['count'] for row in rows}
-        likes = counts.get(1, 0)
-        dislikes = counts.get(-1, 0)
-        col_count = await conn.fetchval("SELECT COUNT(*) FROM collections WHERE channel_message_id = $1", msg_id) or 0
-        com_count = await conn.fetchval("SELECT COUNT(*) FROM comments WHERE channel_message_id = $1", msg_id) or 0
-    
-    keyboard = [
-        [
-            InlineKeyboardButton(f"👍 赞 {likes}", callback_data=f"react:like:{msg_id}"),
-            InlineKeyboardButton(f"👎 踩 {dislikes}", callback_data=f"react:dislike:{msg_id}"),
-            InlineKeyboardButton(f"⭐ 收藏 {col_count}", callback_data=f"collect:{msg_id}"),
-        ],
-        [
-            InlineKeyboardButton(f"💬 评论 {com_count}", callback_data=f"comment:show:{msg_id}"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        counts = await get_all_counts(conn, msg_id)
+        comments_open = await COMMENTS_OPEN.fetchval(conn, msg_id) or False
+    reply_markup = build_post_markup(msg_id, counts, comments_open)
 
-    try:
-        await context.bot.edit_message_reply_markup(
-            chat_id=CHANNEL_ID,
-            message_id=msg_id,
-            reply_markup=reply_markup
-        )
-        return post 
-    except TelegramError as e:
-        error_str = str(e).lower()
-        if "not found" in error_str or "deleted" in error_str or "message_id_invalid" in error_str:
-            return None 
-        if "message is not modified" in error_str:
-            return post
-        return post
-
-async def verify_and_clean_posts(context: ContextTypes.DEFAULT_TYPE, raw_posts, pool):
-    """批量执行检测"""
-    tasks = []
-    for post in raw_posts:
-        tasks.append(check_channel_post_directly(context, pool, post))
-    results = await asyncio.gather(*tasks)
-    valid_posts = []
-    ids_to_delete = []
-    for original_post, result in zip(raw_posts, results):
-        if result:
-            valid_posts.append(result)
-        else:
-            ids_to_delete.append(original_post['channel_message_id'])
-    if ids_to_delete:
+    # 经合并器发送：与同一帖子上排队中的编辑合并，结果里带回消息是否已被删除
+    alive = await schedule_edit(context.bot, CHANNEL_ID, msg_id, reply_markup=reply_markup)
+    return post if alive else None
+
+
+_reconcile_lock = asyncio.Lock()
+
+
+@with_priority(BACKGROUND)
+async def reconcile_channel_posts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    后台巡检：按 submissions.id 顺序分批限速探测频道帖子，清理已被删除的帖子。
+    进度记录在 reconciler_state 中，重启后从上次位置继续；扫到末尾后从头开始下一轮。
+    """
+    if _reconcile_lock.locked(): return
+    async with _reconcile_lock:
+        pool = await get_pool()
         async with pool.acquire() as conn:
-            for mid in ids_to_delete:
-                await delete_post_data(conn, mid)
-    return valid_posts
+            last_id = await conn.fetchval("SELECT last_id FROM reconciler_state WHERE name = 'channel_posts'") or 0
+            posts = await conn.fetch(
+                "SELECT id, channel_message_id FROM submissions WHERE id > $1 ORDER BY id LIMIT $2",
+                last_id, RECONCILE_BATCH_SIZE
+            )
+
+        dead_ids = []
+        for post in posts:
+            if await check_channel_post_directly(context, pool, post) is None:
+                dead_ids.append(post['channel_message_id'])
+            await asyncio.sleep(1 / RECONCILE_RATE)
+
+        async with pool.acquire() as conn:
+            await purge_posts(conn, dead_ids)
+            next_id = posts[-1]['id'] if posts else 0
+            await conn.execute(
+                """
+                INSERT INTO reconciler_state (name, last_id, updated_at) VALUES ('channel_posts', $1, CURRENT_TIMESTAMP)
+                ON CONFLICT (name) DO UPDATE SET last_id = EXCLUDED.last_id, updated_at = EXCLUDED.updated_at
+                """,
+                next_id
+            )
+        if dead_ids:
+            logger.info(f"🧹 巡检清理了 {len(dead_ids)} 个已删除的频道帖子")
 
 
 # ================== 投稿/发布流程 (UX优化版) ==================
@@ -329,53 +358,104 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-# ================== 我的作品列表 (保持不变) ==================
+# ================== 我的作品列表 (游标分页) ==================
+
+POSTS_PER_PAGE = 10
+_CURSOR_EPOCH = datetime(1970, 1, 1)
+
+
+def _page_callback(prefix: str, page: int, direction: str, row, id_key: str = 'id') -> str:
+    """翻页按钮数据：prefix:页码:方向:时间戳(微秒):ID，方向 n=更早 p=更新"""
+    ts_us = (row['timestamp'] - _CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{prefix}:{page}:{direction}:{ts_us}:{row[id_key]}"
+
+
+def _parse_page_callback(data: str):
+    """解析翻页按钮，返回 (页码, 方向, 游标)；没有游标时一律按第一页处理"""
+    parts = data.split(':')
+    try:
+        if len(parts) >= 5:
+            page = max(1, int(parts[1]))
+            cursor = (_CURSOR_EPOCH + timedelta(microseconds=int(parts[3])), int(parts[4]))
+            if page > 1 and parts[2] in ('n', 'p'):
+                return page, parts[2], cursor
+    except ValueError:
+        pass
+    return 1, None, None
+
+
+async def _fetch_keyset_page(conn, sql: str, user_id: int, direction: str, cursor):
+    """
+    按 (timestamp, id) 游标取一页，任意页都只走一次索引范围扫描。
+    sql 中 {cond} 为游标条件占位，{order} 为排序方向占位。
+    返回 (本页记录, 是否还有更早的记录)
+    """
+    if direction == 'p':
+        rows = await conn.fetch(sql.format(cond=">", order="ASC"), user_id, POSTS_PER_PAGE, *cursor)
+        return list(reversed(rows)), True
+    if direction == 'n':
+        rows = await conn.fetch(sql.format(cond="<", order="DESC"), user_id, POSTS_PER_PAGE + 1, *cursor)
+    else:
+        # 第一页：游标取无穷大
+        rows = await conn.fetch(sql.format(cond="<", order="DESC"), user_id, POSTS_PER_PAGE + 1, datetime.max, 0)
+    return rows[:POSTS_PER_PAGE], len(rows) > POSTS_PER_PAGE
+
+
+MY_POSTS_SQL = (
+    "SELECT id, content_text, timestamp, channel_message_id FROM submissions "
+    "WHERE user_id = $1 AND (timestamp, id) {cond} ($3, $4) "
+    "ORDER BY timestamp {order}, id {order} LIMIT $2"
+)
+
+MY_COLLECTIONS_SQL = (
+    "SELECT c.id, c.timestamp, s.content_text, s.channel_message_id "
+    "FROM collections c JOIN submissions s ON c.channel_message_id = s.channel_message_id "
+    "WHERE c.user_id = $1 AND (c.timestamp, c.id) {cond} ($3, $4) "
+    "ORDER BY c.timestamp {order}, c.id {order} LIMIT $2"
+)
+
 
 async def navigate_my_posts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
+    target_page, direction, cursor = _parse_page_callback(query.data)
+    try: await query.answer()
+    except: pass
+    return await _render_my_posts(query, context, target_page, direction, cursor)
+
+
+async def _render_my_posts(query, context: ContextTypes.DEFAULT_TYPE, target_page: int, direction, cursor) -> int:
+    """渲染 "我的作品" 的一页；游标指向的帖子已被删除导致空页时回到第一页"""
     user_id = query.from_user.id
-    try:
-        target_page = int(query.data.split(':')[1])
-    except:
-        target_page = 1
-    posts_per_page = 10
     pool = await get_pool()
     async with pool.acquire() as conn:
-        total_posts = await conn.fetchval("SELECT COUNT(*) FROM submissions WHERE user_id = $1", user_id)
-        if total_posts == 0:
+        raw_posts, has_older = await _fetch_keyset_page(conn, MY_POSTS_SQL, user_id, direction, cursor)
+
+    # 已删除帖子由后台巡检清理，这里是纯数据库读取
+    if not raw_posts:
+        if target_page == 1:
             try:
-                await query.answer()
                 await query.edit_message_text("您还没有发布过任何作品。", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]))
             except: pass
             return BROWSING_POSTS
-        total_pages = math.ceil(total_posts / posts_per_page)
-        offset = (target_page - 1) * posts_per_page
-        raw_posts = await conn.fetch("SELECT id, content_text, timestamp, channel_message_id FROM submissions WHERE user_id = $1 ORDER BY timestamp DESC LIMIT $2 OFFSET $3", user_id, posts_per_page, offset)
-
-    valid_posts = await verify_and_clean_posts(context, raw_posts, pool)
-    try: await query.answer()
-    except: pass
-
-    if not valid_posts and target_page > 1 and len(raw_posts) > 0:
-         query.data = f"my_posts_page:{target_page - 1}"
-         return await navigate_my_posts(update, context)
-    if not valid_posts and len(raw_posts) > 0:
-        await query.edit_message_text("您的作品列表已更新，当前暂无作品。", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]))
-        return BROWSING_POSTS
+        return await _render_my_posts(query, context, 1, None, None)
 
+    # 记录本页 "序号 -> 帖子"，删除作品时按序号直接定位，无需 OFFSET
+    page_index = {}
     response_text = f"📂 <b>我的作品管理</b> (第 {target_page} 页)：\n<i>(系统已自动移除被管理员删除的作品)</i>\n\n"
-    for i, post in enumerate(valid_posts):
+    for i, post in enumerate(raw_posts):
         content = post['content_text']
         msg_id = post['channel_message_id']
         post_text = (content or "[媒体文件]").strip().replace('<', '&lt;').replace('>', '&gt;')
         if len(post_text) > 20: post_text = post_text[:20] + "..."
         post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
-        display_idx = (target_page - 1) * posts_per_page + i + 1
+        display_idx = (target_page - 1) * POSTS_PER_PAGE + i + 1
+        page_index[str(display_idx)] = msg_id
         response_text += f"<b>{display_idx}.</b> <a href='{post_url}'>{post_text}</a>\n"
+    context.user_data['my_posts_index'] = page_index
 
     nav_buttons = []
-    if target_page > 1: nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f'my_posts_page:{target_page - 1}'))
-    if len(valid_posts) == posts_per_page or (total_pages > target_page): nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f'my_posts_page:{target_page + 1}'))
+    if target_page > 1: nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=_page_callback('my_posts_page', target_page - 1, 'p', raw_posts[0])))
+    if has_older: nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=_page_callback('my_posts_page', target_page + 1, 'n', raw_posts[-1])))
     
     keyboard = [nav_buttons, [InlineKeyboardButton("🗑️ 删除本页作品", callback_data=f'delete_work_prompt:{target_page}')], [InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]
     await query.edit_message_text(response_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML, disable_web_page_preview=True)
@@ -405,15 +485,19 @@ async def handle_delete_work_input(update: Update, context: ContextTypes.DEFAULT
         msg = await update.message.reply_text("❌ 请输入数字序号。", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]))
         context.user_data['last_bot_msg'] = msg.message_id
         return DELETING_WORK
-    offset = int(text) - 1
-    if offset < 0:
+    if int(text) < 1:
          msg = await update.message.reply_text("❌ 序号无效。", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]))
          context.user_data['last_bot_msg'] = msg.message_id
          return DELETING_WORK
 
+    # 序号取自最近一次展示的作品页
+    target_msg_id = context.user_data.get('my_posts_index', {}).get(str(int(text)))
+
     pool = await get_pool()
     async with pool.acquire() as conn:
-        target_post = await conn.fetchrow("SELECT id, channel_message_id, content_text FROM submissions WHERE user_id = $1 ORDER BY timestamp DESC LIMIT 1 OFFSET $2", user_id, offset)
+        target_post = None
+        if target_msg_id is not None:
+            target_post = await conn.fetchrow("SELECT id, channel_message_id, content_text FROM submissions WHERE user_id = $1 AND channel_message_id = $2", user_id, target_msg_id)
         if not target_post:
             msg = await update.message.reply_text("❌ 找不到该序号对应的作品。", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]))
             context.user_data['last_bot_msg'] = msg.message_id
@@ -437,35 +521,40 @@ async def handle_delete_work_input(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text("❌ 删除时发生系统错误。", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]))
 
     context.user_data.pop('delete_work_page', None)
+    context.user_data.pop('my_posts_index', None)
     return ConversationHandler.END
 
 async def show_my_collections(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    target_page = int(query.data.split(':')[1])
-    posts_per_page = 10
+    target_page, direction, cursor = _parse_page_callback(query.data)
     pool = await get_pool()
     async with pool.acquire() as conn:
-        total_posts = await conn.fetchval("SELECT COUNT(*) FROM collections WHERE user_id = $1", user_id)
+        # 总数只在缓存失效时 COUNT 一次，翻页不再重复统计
+        total_posts = collection_total_cache.get(user_id)
+        if total_posts is None:
+            total_posts = await conn.fetchval("SELECT COUNT(*) FROM collections WHERE user_id = $1", user_id)
+            collection_total_cache.put(user_id, total_posts)
         if total_posts == 0:
             await query.edit_message_text("您还没有任何收藏哦。", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]))
             return BROWSING_COLLECTIONS
-        total_pages = math.ceil(total_posts / posts_per_page)
-        offset = (target_page - 1) * posts_per_page
-        posts = await conn.fetch("SELECT s.content_text, s.timestamp, s.channel_message_id FROM collections c JOIN submissions s ON c.channel_message_id = s.channel_message_id WHERE c.user_id = $1 ORDER BY c.timestamp DESC LIMIT $2 OFFSET $3", user_id, posts_per_page, offset)
+        total_pages = max(math.ceil(total_posts / POSTS_PER_PAGE), target_page)
+        posts, has_older = await _fetch_keyset_page(conn, MY_COLLECTIONS_SQL, user_id, direction, cursor)
     
+    offset = (target_page - 1) * POSTS_PER_PAGE
     response_text = f"⭐ <b>我的收藏</b> (第 {target_page}/{total_pages} 页)：\n\n"
     for i, post in enumerate(posts):
-        content, timestamp, msg_id = post
+        content = post['content_text']
+        msg_id = post['channel_message_id']
         post_text = (content or "[媒体文件]").strip().replace('<', '&lt;').replace('>', '&gt;')
         if len(post_text) > 20: post_text = post_text[:20] + "..."
         post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
         response_text += f"{offset + i + 1}. <a href='{post_url}'>{post_text}</a>\n"
     
     nav_buttons = []
-    if target_page > 1: nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f'my_collections_page:{target_page - 1}'))
-    if target_page < total_pages: nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f'my_collections_page:{target_page + 1}'))
+    if target_page > 1 and posts: nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=_page_callback('my_collections_page', target_page - 1, 'p', posts[0])))
+    if has_older and posts: nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=_page_callback('my_collections_page', target_page + 1, 'n', posts[-1])))
     
     keyboard = [nav_buttons, [InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]]
     await query.edit_message_text(response_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML, disable_web_page_preview=True)
@@ -0,0 +1,88 @@
+# handlers/trending.py
+
+import asyncio
+import logging
+from telegram.ext import ContextTypes
+from telegram.error import BadRequest, TelegramError
+
+from config import CHANNEL_ID, CHANNEL_USERNAME, TRENDING_TOP_K, TRENDING_MIN_SCORE
+from database import get_pool, post_lock, hot_threshold
+from notifier import enqueue_notification
+from request_scheduler import with_priority, BACKGROUND
+from .channel_interact import push_post_render
+
+logger = logging.getLogger(__name__)
+
+_trending_lock = asyncio.Lock()
+
+
+async def _pin_post(context: ContextTypes.DEFAULT_TYPE, conn, message_id: int, like_count: int):
+    await context.bot.pin_chat_message(chat_id=CHANNEL_ID, message_id=message_id, disable_notification=True)
+    async with post_lock(conn, message_id), conn.transaction():
+        await conn.execute(
+            "INSERT INTO pinned_posts (channel_message_id, like_count_at_pin) VALUES ($1, $2) ON CONFLICT (channel_message_id) DO NOTHING",
+            message_id, like_count
+        )
+        await conn.execute("UPDATE post_stats SET pinned = TRUE WHERE channel_message_id = $1", message_id)
+
+        # 通知作者 (写入发件箱)
+        post_info = await conn.fetchrow("SELECT user_id, content_text FROM submissions WHERE channel_message_id = $1", message_id)
+        if post_info:
+            post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
+            preview_text = (post_info['content_text'] or "作品")[:20].replace('<', '&lt;').replace('>', '&gt;') + "..."
+            msg = f"🔥 <b>恭喜！作品上热榜了！</b>\n<a href='{post_url}'>{preview_text}</a> 获赞 {like_count}，已自动置顶！"
+            await enqueue_notification(conn, post_info['user_id'], msg)
+        await push_post_render(context.bot, conn, message_id)
+
+
+async def _unpin_post(context: ContextTypes.DEFAULT_TYPE, conn, message_id: int):
+    try:
+        await context.bot.unpin_chat_message(chat_id=CHANNEL_ID, message_id=message_id)
+    except BadRequest as e:
+        # 消息已删除或早已被手动取消置顶，照常清理记录
+        logger.info(f"ℹ️ 取消置顶 {message_id}: {e}")
+    async with post_lock(conn, message_id), conn.transaction():
+        await conn.execute("DELETE FROM pinned_posts WHERE channel_message_id = $1", message_id)
+        await conn.execute("UPDATE post_stats SET pinned = FALSE WHERE channel_message_id = $1", message_id)
+        await push_post_render(context.bot, conn, message_id)
+
+
+@with_priority(BACKGROUND)
+async def refresh_trending(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    定时任务：维护热度 Top-K 置顶集合。
+    热度在每次互动时增量更新，这里只在 hot_score 索引上取前 K 个，与现有置顶做差集。
+    """
+    if _trending_lock.locked(): return
+    async with _trending_lock:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT ps.channel_message_id, ps.likes FROM post_stats ps
+                JOIN submissions s ON s.channel_message_id = ps.channel_message_id
+                WHERE ps.hot_score >= $1
+                ORDER BY ps.hot_score DESC NULLS LAST
+                LIMIT $2
+                """,
+                hot_threshold(TRENDING_MIN_SCORE), TRENDING_TOP_K
+            )
+            pinned = {r['channel_message_id'] for r in await conn.fetch("SELECT channel_message_id FROM pinned_posts")}
+            top = [r['channel_message_id'] for r in rows]
+
+            for message_id in pinned - set(top):
+                try:
+                    await _unpin_post(context, conn, message_id)
+                    logger.info(f"📉 帖子 {message_id} 跌出热榜，已取消置顶")
+                except TelegramError as e:
+                    logger.error(f"❌ 取消置顶 {message_id} 失败: {e}")
+
+            # 热度低的先置顶，最热的最后置顶，显示在频道顶部
+            for row in reversed(rows):
+                message_id = row['channel_message_id']
+                if message_id in pinned: continue
+                try:
+                    await _pin_post(context, conn, message_id, row['likes'])
+                    logger.info(f"🔥 帖子 {message_id} 进入热榜，已置顶")
+                except TelegramError as e:
+                    logger.error(f"❌ 置顶 {message_id} 失败: {e}")
@@ -2,12 +2,14 @@
 
 import logging
 import asyncio
+import signal
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
     ConversationHandler,
+    TypeHandler,
     filters,
     ContextTypes,
 )
@@ -16,6 +18,26 @@ from telegram import Update
 
 from config import (
     TOKEN, 
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    INGRESS_QUEUE_SIZE,
+    WORKER_PROCESSES,
+    WORKER_INDEX,
+    MAX_CONCURRENT_UPDATES,
+    BOT_API_BASE_URL,
+    BOT_API_PROXY,
+    BOT_API_CONNECTION_POOL_SIZE,
+    UPDATE_RECORD_PATH,
+    USER_REFRESH_INTERVAL,
+    OUTBOX_POLL_INTERVAL,
+    NOTIFY_AGGREGATE_WINDOW,
+    RECONCILE_INTERVAL,
+    TRENDING_INTERVAL,
+    LEADERBOARD_INTERVAL,
     CHOOSING, 
     GETTING_POST,
     WAITING_CAPTION,
@@ -24,9 +46,28 @@ from config import (
     BROWSING_COLLECTIONS,
     COMMENTING,
     DELETING_COMMENT,
-    DELETING_WORK
+    DELETING_WORK,
+    SEARCHING,
 )
-from database import setup_database, close_pool
+from database import setup_database, get_pool, close_pool
+from user_directory import track_user, refresh_stale_users
+from notifier import drain_outbox
+from webhook import WebhookServer
+from update_processor import KeyedUpdateProcessor, log_processor_stats
+from request_scheduler import ScheduledRequest, api_scheduler
+from metrics import (
+    METRICS_ENABLED,
+    InstrumentedRequest,
+    instrument_handlers,
+    register_caches,
+    register_update_processor,
+    register_request_scheduler,
+    start_metrics_server,
+    stop_metrics_server,
+)
+from user_directory import _user_cache
+from update_recorder import UpdateRecorder, RecordingQueue
+from cluster import run_supervisor, start_invalidation_listener, stop_invalidation_listener
 from handlers.start_menu import start, back_to_main
 from handlers.submission import (
     prompt_submission, 
@@ -36,14 +77,20 @@ from handlers.submission import (
     handle_confirm_submission,
     navigate_my_posts, 
     show_my_collections, 
+    reconcile_channel_posts,
     prompt_delete_work,
     handle_delete_work_input,
     cancel
 )
 from handlers.approval import handle_approval, handle_rejection
-from handlers.channel_interact import handle_channel_interaction
+from handlers.channel_interact import handle_channel_interaction, comment_section_cache, collection_total_cache, base_caption_cache
 from handlers.commenting import prompt_comment, handle_new_comment
 from handlers.comment_management import show_delete_comment_menu, handle_delete_comment_input
+from handlers.trending import refresh_trending
+from handlers.search import prompt_search, search_command, handle_search_input, navigate_search
+from handlers.admin import handle_slowlog_command, handle_dbpool_command
+from handlers.leaderboard import refresh_leaderboards, show_leaderboard, _board_cache
+from handlers.notifications import flush_notification_events, show_notify_settings, handle_notify_mode
 
 
 logging.basicConfig(
@@ -53,26 +100,88 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def main():
-    """
-    机器人主程序 (V10.6 - UX极致优化版)
-    """
-    USE_PROXY = False 
-    PROXY_URL = "http://127.0.0.1:7890"
+async def post_init(application: Application) -> None:
+    """启动时初始化数据库并注册后台任务"""
+    if METRICS_ENABLED:
+        register_caches({
+            "comment_section": comment_section_cache,
+            "collection_total": collection_total_cache,
+            "base_caption": base_caption_cache,
+            "user": _user_cache,
+            "leaderboard": _board_cache,
+        })
+        register_update_processor(application.update_processor)
+        register_request_scheduler(api_scheduler)
+        await start_metrics_server()
+    application.job_queue.run_repeating(log_processor_stats, interval=60, first=60, name="log_processor_stats")
+    if WORKER_INDEX > 0:
+        # 非主 worker：建表和后台任务由 worker 0 负责
+        await get_pool()
+        await start_invalidation_listener()
+        return
+    await setup_database(application)
+    await start_invalidation_listener()
+    application.job_queue.run_repeating(refresh_stale_users, interval=USER_REFRESH_INTERVAL, first=60, name="refresh_stale_users")
+    application.job_queue.run_repeating(drain_outbox, interval=OUTBOX_POLL_INTERVAL, first=1, name="drain_outbox",
+                                        job_kwargs={"max_instances": 2})
+    application.job_queue.run_repeating(flush_notification_events, interval=max(5, NOTIFY_AGGREGATE_WINDOW // 2), first=5,
+                                        name="flush_notification_events")
+    application.job_queue.run_repeating(reconcile_channel_posts, interval=RECONCILE_INTERVAL, first=30, name="reconcile_channel_posts",
+                                        job_kwargs={"max_instances": 2})
+    application.job_queue.run_repeating(refresh_trending, interval=TRENDING_INTERVAL, first=45, name="refresh_trending",
+                                        job_kwargs={"max_instances": 2})
+    application.job_queue.run_repeating(refresh_leaderboards, interval=LEADERBOARD_INTERVAL, first=20, name="refresh_leaderboards",
+                                        job_kwargs={"max_instances": 2})
+
+
+async def post_shutdown(application: Application) -> None:
+    """polling 与 webhook 共用的收尾：关闭失效广播监听、监控服务和连接池"""
+    await stop_invalidation_listener()
+    await stop_metrics_server()
+    await close_pool()
+
+
+def build_application(mode: str = BOT_MODE) -> Application:
+    """构建 Application 并注册全部处理器"""
+    # 有界入口队列。并发处理时 PTB 会立即取走队列中的更新，
+    # 所以 webhook 按"队列 + 处理器排队/处理中"的总数判断是否返回 503 (见 WebhookServer.pending)；
+    # polling 模式没有入口背压，并发由 KeyedUpdateProcessor 的名额限制
+    if UPDATE_RECORD_PATH:
+        # 录制线上流量供 benchmarks/replay.py 回放
+        path = UPDATE_RECORD_PATH if WORKER_INDEX < 0 else f"{UPDATE_RECORD_PATH}.{WORKER_INDEX}"
+        update_queue = RecordingQueue(INGRESS_QUEUE_SIZE, UpdateRecorder(path))
+    else:
+        update_queue = asyncio.Queue(maxsize=INGRESS_QUEUE_SIZE)
+    builder = Application.builder().token(TOKEN).update_queue(update_queue)
+    # 并发处理：同一会话/同一帖子保序，其余并行
+    builder = builder.concurrent_updates(KeyedUpdateProcessor(MAX_CONCURRENT_UPDATES, max_pending=INGRESS_QUEUE_SIZE))
     
-    builder = Application.builder().token(TOKEN)
+    # 所有 Bot API 请求经优先级调度器发出 (长轮询 getUpdates 使用独立的请求对象，不排队)
+    # 开启监控时记录每个方法的耗时/状态码/429 次数，计时不含排队时间
+    request_class = InstrumentedRequest if METRICS_ENABLED else HTTPXRequest
+    http = request_class(connection_pool_size=BOT_API_CONNECTION_POOL_SIZE, proxy=BOT_API_PROXY or None)
+    builder = builder.request(ScheduledRequest(http, api_scheduler))
+    if BOT_API_PROXY:
+        builder = builder.get_updates_request(HTTPXRequest(proxy=BOT_API_PROXY))
     
-    if USE_PROXY:
-        builder = builder.request(HTTPXRequest(proxy=PROXY_URL))
+    if BOT_API_BASE_URL:
+        # 压测时指向本地 Bot API 模拟器 (benchmarks/bot_api_emulator.py)
+        builder = builder.base_url(BOT_API_BASE_URL)
+
+    if mode == "webhook":
+        # webhook 模式由 WebhookServer 接收更新，不需要 Updater
+        builder = builder.updater(None)
     
-    application = builder.post_init(setup_database).build()
+    application = builder.post_init(post_init).post_shutdown(post_shutdown).build()
 
     # 主对话处理器
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("start", start),
             # 【修复】这里添加 back_to_main，确保流程结束(END)后点击按钮依然能触发主菜单
-            CallbackQueryHandler(back_to_main, pattern='^back_to_main$')
+            CallbackQueryHandler(back_to_main, pattern='^back_to_main$'),
+            CommandHandler("search", search_command),
+            CallbackQueryHandler(prompt_search, pattern='^search_prompt$'),
         ],
         states={
             CHOOSING: [
@@ -113,6 +222,10 @@ def main():
             DELETING_COMMENT: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, handle_delete_comment_input)
             ],
+            SEARCHING: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, handle_search_input),
+                CallbackQueryHandler(back_to_main, pattern='^back_to_main$')
+            ],
             DELETING_WORK: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, handle_delete_work_input),
                 # 允许在删除输入阶段点击返回
@@ -131,29 +244,86 @@ def main():
         name="main_conversation",
     )
     
+    # 被动记录所有更新的发送者资料 (用户目录)
+    application.add_handler(TypeHandler(Update, track_user), group=-1)
     application.add_handler(conv_handler)
     application.add_handler(CallbackQueryHandler(handle_approval, pattern='^approve:'))
     application.add_handler(CallbackQueryHandler(handle_rejection, pattern='^decline:'))
     application.add_handler(CallbackQueryHandler(handle_channel_interaction, pattern='^(react|collect|comment)'))
+    application.add_handler(CommandHandler("notify", show_notify_settings))
+    application.add_handler(CallbackQueryHandler(handle_notify_mode, pattern='^notify_mode:'))
+    application.add_handler(CommandHandler("top", show_leaderboard))
+    application.add_handler(CommandHandler("slowlog", handle_slowlog_command))
+    application.add_handler(CommandHandler("dbpool", handle_dbpool_command))
+    application.add_handler(CallbackQueryHandler(navigate_search, pattern='^search_page:'))
+    application.add_handler(CallbackQueryHandler(show_leaderboard, pattern='^top:'))
     
     async def debug_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.message and update.message.text:
             logger.warning(f"⚠️ 未处理的消息: '{update.message.text}'")
     
     application.add_handler(MessageHandler(filters.TEXT & filters.ChatType.PRIVATE, debug_handler), group=999)
+    if METRICS_ENABLED:
+        instrument_handlers(application)
+    return application
+
+
+async def run_webhook(application: Application) -> None:
+    """webhook 模式：手动管理生命周期，直到收到 SIGINT/SIGTERM"""
+    server = WebhookServer(application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # 与 run_polling 一致：post_init / post_shutdown 由这里手动调用
+    try:
+        async with application:
+            await application.post_init(application)
+            await application.start()
+            await server.start()
+            if WEBHOOK_URL:
+                # 不丢弃积压更新：重启期间的更新由 Telegram 重新投递
+                await application.bot.set_webhook(
+                    url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET or None,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+                logger.info(f"✅ 已设置 Webhook: {WEBHOOK_URL}")
+            else:
+                logger.info("ℹ️ 未配置 WEBHOOK_URL，跳过 setWebhook (本地测试模式)")
+            try:
+                await stop_event.wait()
+            finally:
+                await server.stop()
+                if application.running:
+                    await application.stop()
+    finally:
+        await application.post_shutdown(application)
+
+
+def main():
+    """
+    机器人主程序 (V10.6 - UX极致优化版)
+    """
+    if WORKER_PROCESSES > 1 and WORKER_INDEX < 0:
+        # config 已保证多进程只在 webhook 模式下出现
+        run_supervisor()
+        return
     
-    logger.info("🚀 机器人 V10.6 启动成功！(界面洁癖优化+全流程返回)")
+    application = build_application(BOT_MODE)
     
+    logger.info(f"🚀 机器人 V10.6 启动成功！(界面洁癖优化+全流程返回) 模式: {BOT_MODE}")
+    
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+        return
+    
+    # 退出时 (含 Ctrl+C / SIGTERM) run_polling 会调用 post_shutdown 完成收尾
     try:
         application.run_polling(drop_pending_updates=True)
     except Exception as e:
         logger.error(f"❌ 机器人运行错误: {e}")
-    finally:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            loop.create_task(close_pool())
-        else:
-            loop.run_until_complete(close_pool())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,365 @@
+# metrics.py
+
+import re
+import time
+import logging
+import functools
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+import asyncpg
+from aiohttp import web
+from telegram.request import HTTPXRequest
+
+from config import METRICS_PORT, WORKER_INDEX
+from slowlog import slow_query_log
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = METRICS_PORT > 0
+
+# 秒：覆盖 1ms (单行查询) 到 30s (限流等待)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values) -> str:
+    if not names: return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """固定桶直方图：observe 只做一次二分查找和三次加法"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}   # labels -> [各桶计数 (非累计), 总和, 次数]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class GaugeCollector:
+    """抓取时才计算的指标：func 返回 {标签值元组: 数值}；单调递增的外部计数可把 kind 设为 counter"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], func: Callable[[], dict]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.func = func
+        self.kind = "gauge"
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        try:
+            values = self.func()
+        except Exception as e:
+            logger.warning(f"⚠️ 采集 {self.name} 失败: {e}")
+            return
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+_registry = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_LATENCY = register(Histogram("bot_handler_seconds", "Update handler latency", ("handler",)))
+HANDLER_ERRORS = register(Counter("bot_handler_errors_total", "Exceptions raised by update handlers", ("handler", "error")))
+DB_LATENCY = register(Histogram("bot_db_query_seconds", "asyncpg call latency", ("op", "query")))
+DB_ERRORS = register(Counter("bot_db_errors_total", "asyncpg call failures", ("op", "query", "error")))
+POOL_ACQUIRE = register(Histogram("bot_db_pool_acquire_seconds", "Time spent waiting for a pooled connection"))
+POOL_SATURATED = register(Counter("bot_db_pool_saturated_total", "Acquires that found every pooled connection busy"))
+API_LATENCY = register(Histogram("bot_api_request_seconds", "Bot API request latency", ("method",)))
+API_RESPONSES = register(Counter("bot_api_responses_total", "Bot API responses by HTTP status", ("method", "status")))
+API_RETRY_AFTER = register(Counter("bot_api_retry_after_total", "Bot API 429 RetryAfter responses", ("method",)))
+API_ERRORS = register(Counter("bot_api_errors_total", "Bot API requests that failed without a response", ("method", "error")))
+
+
+def register_caches(caches: dict):
+    """导出进程内缓存的命中/未命中/淘汰/大小：caches 为 {名称: LRUCache}"""
+    def collect(field):
+        return lambda: {(name,): cache.stats()[field] for name, cache in caches.items()}
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("size", "gauge")):
+        collector = register(GaugeCollector(f"bot_cache_{field}", f"In-process cache {field}", ("cache",), collect(field)))
+        collector.kind = kind
+
+
+def register_update_processor(processor):
+    """导出并发更新处理器的在途/排队数量"""
+    register(GaugeCollector(
+        "bot_updates", "Updates in flight / waiting for their key or a slot", ("state",),
+        lambda: {("in_flight",): processor.in_flight, ("waiting",): processor.waiting}
+    ))
+
+
+def register_request_scheduler(scheduler):
+    """导出 Bot API 请求队列深度 (按优先级) 与在途数量"""
+    register(GaugeCollector(
+        "bot_api_queue_depth", "Bot API requests waiting for a send permit by priority class", ("priority",),
+        lambda: {(name,): n for name, n in scheduler.depth().items()}
+    ))
+    register(GaugeCollector("bot_api_in_flight", "Bot API requests in flight", (), lambda: {(): scheduler.in_flight}))
+
+
+# ==================== 处理器 ====================
+
+def _timed_callback(callback, name: str):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+    return wrapper
+
+
+def instrument_handlers(application) -> int:
+    """为已注册的全部处理器 (含 ConversationHandler 内部的) 套上计时，返回处理器数量"""
+    from telegram.ext import ConversationHandler
+
+    seen = set()
+
+    def visit(handler) -> int:
+        if isinstance(handler, ConversationHandler):
+            inner = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                inner.extend(state_handlers)
+            return sum(visit(h) for h in inner)
+        if id(handler) in seen: return 0
+        seen.add(id(handler))
+        handler.callback = _timed_callback(handler.callback, getattr(handler.callback, "__name__", repr(handler.callback)))
+        return 1
+
+    return sum(visit(h) for handlers in application.handlers.values() for h in handlers)
+
+
+# ==================== 数据库 ====================
+
+_VERB_RE = re.compile(r"^\s*(?:WITH\b.*?\)\s*)?(SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DO)\b", re.I | re.S)
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+([A-Za-z_][\w.]*)", re.I)
+_query_labels: Dict[str, str] = {}
+
+
+def query_label(sql: str) -> str:
+    """把 SQL 归类为 "动词:首个表名" 作为标签 (结果缓存，避免重复解析)"""
+    label = _query_labels.get(sql)
+    if label is None:
+        verb = _VERB_RE.search(sql)
+        table = _TABLE_RE.search(sql)
+        label = f"{(verb.group(1) if verb else 'other').lower()}:{table.group(1).lower() if table else '-'}"
+        if len(_query_labels) < 4096:
+            _query_labels[sql] = label
+    return label
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """记录每次调用的耗时与失败次数，并把超过阈值的语句交给慢查询日志"""
+
+    async def _timed(self, op: str, method, query, args, kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(query, *args, **kwargs)
+        except Exception as e:
+            if METRICS_ENABLED:
+                DB_ERRORS.inc(op, query_label(query), type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if METRICS_ENABLED:
+                DB_LATENCY.observe(elapsed, op, query_label(query))
+            if slow_query_log.enabled and elapsed * 1000 >= slow_query_log.threshold_ms:
+                slow_query_log.report(query, args if op != "executemany" else (), elapsed)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed("execute", super().execute, query, args, kwargs)
+
+    async def executemany(self, command, args, **kwargs):
+        return await self._timed("executemany", super().executemany, command, (args,), kwargs)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed("fetch", super().fetch, query, args, kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed("fetchrow", super().fetchrow, query, args, kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed("fetchval", super().fetchval, query, args, kwargs)
+
+
+class _TimedAcquire:
+    def __init__(self, ctx, pool: "MeteredPool"):
+        self._ctx = ctx
+        self._pool = pool
+
+    async def __aenter__(self):
+        pool = self._pool
+        raw = pool._pool
+        # 没有空闲连接且已到上限：本次必须排队等别人归还
+        saturated = raw.get_idle_size() == 0 and raw.get_size() >= raw.get_max_size()
+        pool.waiting += 1
+        start = time.perf_counter()
+        try:
+            conn = await self._ctx.__aenter__()
+        finally:
+            pool.waiting -= 1
+        pool._observe(time.perf_counter() - start, saturated)
+        return conn
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+
+class MeteredPool:
+    """连接池代理：记录 acquire 等待时间与饱和次数，其余属性透传"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.waiting = 0
+        self.acquires = 0
+        self.saturated = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        register(GaugeCollector("bot_db_pool_connections", "Pool connections by state", ("state",), self._pool_stats))
+
+    def _pool_stats(self) -> dict:
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {("max",): self._pool.get_max_size(), ("open",): size, ("idle",): idle, ("in_use",): size - idle,
+                ("waiting",): self.waiting}
+
+    def _observe(self, waited: float, saturated: bool):
+        self.acquires += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        if saturated:
+            self.saturated += 1
+        if METRICS_ENABLED:
+            POOL_ACQUIRE.observe(waited)
+            if saturated:
+                POOL_SATURATED.inc()
+
+    def stats(self) -> dict:
+        """当前占用 + 启动以来的 acquire 等待统计"""
+        gauges = {labels[0]: value for labels, value in self._pool_stats().items()}
+        return {
+            **gauges,
+            "min": self._pool.get_min_size(),
+            "acquires": self.acquires,
+            "saturated": self.saturated,
+            "saturated_ratio": round(self.saturated / self.acquires, 4) if self.acquires else 0.0,
+            "wait_avg_ms": round(self.wait_total / self.acquires * 1000, 2) if self.acquires else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+        }
+
+    def acquire(self, *args, **kwargs):
+        return _TimedAcquire(self._pool.acquire(*args, **kwargs), self)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+# ==================== Bot API ====================
+
+class InstrumentedRequest(HTTPXRequest):
+    """按 Bot API 方法记录耗时、HTTP 状态码与 429 次数"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - start, api_method)
+        API_RESPONSES.inc(api_method, str(code))
+        if code == 429:
+            API_RETRY_AFTER.inc(api_method)
+        return code, payload
+
+
+# ==================== HTTP ====================
+
+_runner = None
+
+
+async def start_metrics_server():
+    """在本机端口暴露 /metrics (Prometheus 文本格式)"""
+    global _runner
+    if not METRICS_ENABLED or _runner is not None: return
+    port = METRICS_PORT + max(WORKER_INDEX, 0)
+
+    async def handle(request):
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, "127.0.0.1", port).start()
+    logger.info(f"📈 监控指标已暴露在 127.0.0.1:{port}/metrics")
+
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is None: return
+    await _runner.cleanup()
+    _runner = None
@@ -0,0 +1,159 @@
+# notifier.py
+
+import json
+import time
+import asyncio
+import logging
+from telegram import InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter, Forbidden, BadRequest
+from telegram.ext import ContextTypes
+
+from config import (
+    OUTBOX_PER_CHAT_INTERVAL,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+)
+from database import get_pool
+from request_scheduler import with_priority, BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# 领取后的租约时长：进程崩溃时这批私信在租约到期后会被重新领取
+LEASE_SECONDS = 60
+
+_last_sent_at = {}   # chat_id -> 上次发送时间 (monotonic)
+_drain_lock = asyncio.Lock()
+
+
+async def enqueue_notification(conn, chat_id: int, text: str, parse_mode: str = ParseMode.HTML,
+                               reply_markup: InlineKeyboardMarkup = None) -> None:
+    """写入发件箱 (调用方负责与业务写入放在同一事务中)；已屏蔽机器人的用户直接跳过"""
+    markup_json = json.dumps(reply_markup.to_dict()) if reply_markup else None
+    await conn.execute(
+        """
+        INSERT INTO notification_outbox (chat_id, text, parse_mode, reply_markup)
+        SELECT $1, $2, $3, $4::jsonb
+        WHERE NOT EXISTS (SELECT 1 FROM users WHERE user_id = $1 AND dm_blocked)
+        """,
+        chat_id, text, parse_mode, markup_json
+    )
+
+
+async def _claim_batch(conn):
+    return await conn.fetch(
+        """
+        UPDATE notification_outbox SET next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT id FROM notification_outbox
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY id LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, chat_id, text, parse_mode, reply_markup, attempts
+        """,
+        OUTBOX_BATCH_SIZE, LEASE_SECONDS
+    )
+
+
+async def _reschedule(conn, ids, delay: float, count_attempt: bool = False, error: str = None):
+    await conn.execute(
+        """
+        UPDATE notification_outbox
+        SET next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => $2),
+            attempts = attempts + $3, last_error = COALESCE($4, last_error)
+        WHERE id = ANY($1::bigint[])
+        """,
+        list(ids), delay, 1 if count_attempt else 0, error
+    )
+
+
+async def _mark_undeliverable(conn, row, error: str):
+    async with conn.transaction():
+        await conn.execute(
+            "UPDATE notification_outbox SET status = 'undeliverable', last_error = $2 WHERE id = $1",
+            row['id'], error
+        )
+        # 同一用户排队中的其他私信也一并放弃，并记录为不可达
+        await conn.execute(
+            "UPDATE notification_outbox SET status = 'undeliverable', last_error = $2 WHERE chat_id = $1 AND status = 'pending'",
+            row['chat_id'], error
+        )
+        await conn.execute(
+            """
+            INSERT INTO users (user_id, dm_blocked) VALUES ($1, TRUE)
+            ON CONFLICT (user_id) DO UPDATE SET dm_blocked = TRUE
+            """,
+            row['chat_id']
+        )
+    logger.info(f"🚫 用户 {row['chat_id']} 无法接收私信，已标记为不可达: {error}")
+
+
+@with_priority(BACKGROUND)
+async def drain_outbox(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """后台任务：分批领取发件箱并发送，遵守全局/单用户速率限制，RetryAfter 时整体退避"""
+    # 上一轮还没发完时直接返回，由上一轮继续
+    if _drain_lock.locked(): return
+    async with _drain_lock:
+        await _drain(context)
+
+
+async def _drain(context: ContextTypes.DEFAULT_TYPE) -> None:
+    pool = await get_pool()
+    while True:
+        async with pool.acquire() as conn:
+            batch = await _claim_batch(conn)
+        if not batch: return
+
+        for idx, row in enumerate(batch):
+            chat_id = row['chat_id']
+            async with pool.acquire() as conn:
+                # 同一用户发送过于频繁：稍后再发
+                since_last = time.monotonic() - _last_sent_at.get(chat_id, 0)
+                if since_last < OUTBOX_PER_CHAT_INTERVAL:
+                    await _reschedule(conn, [row['id']], OUTBOX_PER_CHAT_INTERVAL - since_last)
+                    continue
+
+                # 全局发送速率由 Bot API 调度器统一限制 (BOT_API_GLOBAL_RATE)，私信以后台优先级排队，
+                # 不会挤占用户正在等待的回复
+                markup = None
+                if row['reply_markup']:
+                    markup = InlineKeyboardMarkup.de_json(json.loads(row['reply_markup']), context.bot)
+                try:
+                    await context.bot.send_message(
+                        chat_id=chat_id, text=row['text'], parse_mode=row['parse_mode'], reply_markup=markup
+                    )
+                    _last_sent_at[chat_id] = time.monotonic()
+                    await conn.execute("DELETE FROM notification_outbox WHERE id = $1", row['id'])
+                except RetryAfter as e:
+                    # 全局限流 (调度器已整体暂停)：本批剩余的私信全部延后
+                    logger.warning(f"⏳ 私信发送触发限流，暂停 {e.retry_after}s")
+                    await _reschedule(conn, [r['id'] for r in batch[idx:]], e.retry_after)
+                    break
+                except Forbidden as e:
+                    await _mark_undeliverable(conn, row, str(e))
+                except BadRequest as e:
+                    if "chat not found" in str(e).lower():
+                        await _mark_undeliverable(conn, row, str(e))
+                    else:
+                        await conn.execute(
+                            "UPDATE notification_outbox SET status = 'failed', last_error = $2 WHERE id = $1",
+                            row['id'], str(e)
+                        )
+                        logger.error(f"❌ 私信 {row['id']} 内容无效，已放弃: {e}")
+                except Exception as e:
+                    attempts = row['attempts'] + 1
+                    if attempts >= OUTBOX_MAX_ATTEMPTS:
+                        await conn.execute(
+                            "UPDATE notification_outbox SET status = 'failed', attempts = $2, last_error = $3 WHERE id = $1",
+                            row['id'], attempts, str(e)
+                        )
+                        logger.error(f"❌ 私信 {row['id']} 重试 {attempts} 次仍失败，已放弃: {e}")
+                    else:
+                        await _reschedule(conn, [row['id']], min(5 * 2 ** attempts, 3600), count_attempt=True, error=str(e))
+
+        # 清理过期的单用户发送记录，避免无限增长
+        if len(_last_sent_at) > 10000:
+            cutoff = time.monotonic() - OUTBOX_PER_CHAT_INTERVAL
+            for cid in [c for c, t in _last_sent_at.items() if t < cutoff]:
+                del _last_sent_at[cid]
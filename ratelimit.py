@@ -0,0 +1,43 @@
+# ratelimit.py
+
+import time
+import asyncio
+
+
+class TokenBucket:
+    """令牌桶限速：rate 个/秒，最多积攒 capacity 个；rate <= 0 表示不限速 (仍支持 pause)"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self):
+        if self.rate <= 0: return
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """距离下一个令牌可用还需等待的秒数 (0 表示立即可用)"""
+        self._refill()
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.rate <= 0: return wait
+        if self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.rate)
+        return wait
+
+    def try_acquire(self) -> bool:
+        if self.delay() > 0: return False
+        if self.rate > 0: self._tokens -= 1
+        return True
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep(self.delay())
+
+    def pause(self, seconds: float):
+        """整体暂停 (例如收到 RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
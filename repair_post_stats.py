@@ -0,0 +1,31 @@
+# repair_post_stats.py - 回填/修复 post_stats 计数表
+
+import sys
+import asyncio
+
+from database import get_pool, close_pool, rebuild_post_stats, rebuild_hot_scores
+
+
+async def repair(channel_message_ids=None):
+    """按明细表重算计数，可只修复指定帖子"""
+    pool = await get_pool()
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                count = await rebuild_post_stats(conn, channel_message_ids)
+                hot = await rebuild_hot_scores(conn, channel_message_ids)
+        print(f"✅ 已重算 {count} 个帖子的计数，{hot} 个帖子的热度")
+    finally:
+        await close_pool()
+
+# 使用方法：
+# python repair_post_stats.py            # 全量回填
+# python repair_post_stats.py 123 456    # 只修复指定的 channel_message_id
+
+if __name__ == "__main__":
+    try:
+        ids = [int(arg) for arg in sys.argv[1:]] or None
+    except ValueError:
+        print("请输入有效的数字ID")
+        sys.exit(1)
+    asyncio.run(repair(ids))
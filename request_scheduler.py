@@ -0,0 +1,243 @@
+# request_scheduler.py - Bot API 请求调度：优先级 + 全局/单聊天限速 + RetryAfter 全局退避
+
+import json
+import time
+import functools
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from telegram.request import BaseRequest
+
+from ratelimit import TokenBucket
+from config import BOT_API_GLOBAL_RATE, BOT_API_CHAT_RATE, BOT_API_GROUP_RATE, BOT_API_CONNECTION_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 优先级 (数值越小越先发)：用户正在等待的回复 > 频道帖子编辑 > 后台私信/巡检
+INTERACTIVE, CHANNEL_EDIT, BACKGROUND = range(3)
+PRIORITY_NAMES = ("interactive", "channel_edit", "background")
+
+_priority = contextvars.ContextVar("bot_api_priority", default=INTERACTIVE)
+
+CHAT_BURST = 3          # 单聊天令牌桶容量：允许一次回调里连发几条
+SCAN_LIMIT = 64         # 同一优先级内最多向后查看多少个请求 (队头的聊天被限速时跳过它)
+
+# 只有"发消息"类方法计入全局/单聊天发送限速；answerCallbackQuery、编辑、删除等只受在途上限和 429 退避约束
+SEND_METHODS = frozenset({
+    "sendMessage", "copyMessage", "copyMessages", "forwardMessage", "forwardMessages",
+    "sendPhoto", "sendVideo", "sendAnimation", "sendAudio", "sendDocument", "sendVoice",
+    "sendVideoNote", "sendMediaGroup", "sendSticker", "sendLocation", "sendVenue",
+    "sendContact", "sendPoll", "sendDice",
+})
+
+
+@contextmanager
+def request_priority(level: int):
+    """块内 (含其中创建的任务) 发出的 Bot API 请求使用指定优先级"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def with_priority(level: int):
+    """装饰器：整个协程内的请求使用指定优先级 (后台任务/编辑合并器)"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with request_priority(level):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Ticket:
+    __slots__ = ("chat_id", "rated", "future", "queued_at")
+
+    def __init__(self, chat_id, rated, future):
+        self.chat_id = chat_id
+        self.rated = rated
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class RequestScheduler:
+    """
+    所有 Bot API 请求先在这里排队领取"发送许可"：
+    - 按优先级出队，同一优先级先进先出
+    - 发消息类方法 (SEND_METHODS) 走全局令牌桶 + 单聊天令牌桶 (私聊/群频道分别限速)；
+      回调应答、编辑、删除等不占发送配额，否则会把按钮点击吞吐压到全局发送速率
+    - 在途请求数不超过 HTTP 连接池大小，避免在 httpx 连接池里无序排队
+    - 任意请求收到 429 时全局暂停 retry_after 秒
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, group_rate: float, max_in_flight: int):
+        self._global = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._queues = tuple(deque() for _ in PRIORITY_NAMES)
+        self._chat_buckets = {}
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self.sent = [0] * len(PRIORITY_NAMES)
+        self.wait_total = [0.0] * len(PRIORITY_NAMES)
+        self.retry_after_count = 0
+
+    def _chat_bucket(self, chat_id):
+        if chat_id is None: return None
+        rate = self.chat_rate if isinstance(chat_id, int) and chat_id > 0 else self.group_rate
+        if rate <= 0: return None
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # 清理已攒满令牌 (近期没有请求) 的聊天
+                for cid in [c for c, b in self._chat_buckets.items() if b.delay() == 0 and b._tokens >= b.capacity]:
+                    del self._chat_buckets[cid]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, capacity=max(rate, CHAT_BURST))
+        return bucket
+
+    async def acquire(self, chat_id, rated: bool = True) -> None:
+        """排队直到允许发送；rated=False 时不计入发送限速。调用方发送结束后必须调用 release()"""
+        level = _priority.get()
+        ticket = _Ticket(chat_id, rated, asyncio.get_running_loop().create_future())
+        self._queues[level].append(ticket)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            # 许可已发出但调用方被取消：归还在途名额
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release()
+            raise
+        self.sent[level] += 1
+        self.wait_total[level] += time.monotonic() - ticket.queued_at
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wakeup.set()
+
+    def retry_after(self, seconds: float) -> None:
+        """收到 429：所有优先级一起暂停"""
+        self.retry_after_count += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"⏳ Bot API 触发限流，全部请求暂停 {seconds}s (排队 {self.depth()})")
+
+    def _pick(self):
+        """按优先级找第一个未被限速的请求，返回 (请求, 最短需等待秒数)"""
+        shortest = None
+        global_wait = self._global.delay()
+        for queue in self._queues:
+            for idx, ticket in enumerate(queue):
+                if idx >= SCAN_LIMIT: break
+                if ticket.future.done():
+                    continue
+                if ticket.rated:
+                    if global_wait > 0:
+                        wait = global_wait
+                    else:
+                        bucket = self._chat_bucket(ticket.chat_id)
+                        if bucket is None or bucket.try_acquire():
+                            self._global.try_acquire()
+                            del queue[idx]
+                            return ticket, 0.0
+                        wait = bucket.delay()
+                    shortest = wait if shortest is None else min(shortest, wait)
+                    continue
+                del queue[idx]
+                return ticket, 0.0
+        return None, shortest
+
+    async def _dispatch(self):
+        while True:
+            # 调用方已取消的请求直接丢弃
+            for queue in self._queues:
+                while queue and queue[0].future.done():
+                    queue.popleft()
+            if not any(self._queues) or self.in_flight >= self.max_in_flight:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            ticket, wait = self._pick()
+            if ticket is None:
+                # 剩下的都在等发送令牌；期间有新请求 (可能无需限速) 到达时提前醒来
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.in_flight += 1
+            ticket.future.set_result(None)
+
+    def depth(self) -> dict:
+        return {name: sum(1 for t in queue if not t.future.done()) for name, queue in zip(PRIORITY_NAMES, self._queues)}
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.depth(),
+            "in_flight": self.in_flight,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "retry_after": self.retry_after_count,
+            "avg_wait_ms": {
+                name: round(self.wait_total[i] / self.sent[i] * 1000, 2) if self.sent[i] else 0.0
+                for i, name in enumerate(PRIORITY_NAMES)
+            },
+        }
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+
+def _retry_after_seconds(payload: bytes) -> float:
+    try:
+        return float(json.loads(payload)["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return 1.0
+
+
+class ScheduledRequest(BaseRequest):
+    """包装实际的 HTTP 请求对象：发送前经 RequestScheduler 排队，429 时触发全局退避"""
+
+    def __init__(self, inner: BaseRequest, scheduler: RequestScheduler):
+        self._inner = inner
+        self.scheduler = scheduler
+
+    @property
+    def read_timeout(self):
+        return self._inner.read_timeout
+
+    async def initialize(self) -> None:
+        await self._inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self.scheduler.close()
+        await self._inner.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data=None, **timeouts):
+        chat_id = request_data.parameters.get("chat_id") if request_data is not None else None
+        await self.scheduler.acquire(chat_id, rated=url.rsplit("/", 1)[-1] in SEND_METHODS)
+        try:
+            code, payload = await self._inner.do_request(url, method, request_data, **timeouts)
+        finally:
+            self.scheduler.release()
+        if code == 429:
+            # 照常把响应交回 PTB 抛出 RetryAfter，由调用方决定是否重试
+            self.scheduler.retry_after(_retry_after_seconds(payload))
+        return code, payload
+
+
+api_scheduler = RequestScheduler(BOT_API_GLOBAL_RATE, BOT_API_CHAT_RATE, BOT_API_GROUP_RATE, BOT_API_CONNECTION_POOL_SIZE)
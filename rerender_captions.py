@@ -0,0 +1,76 @@
+# rerender_captions.py - 页脚模板变化后批量重新生成帖子的 正文+页脚
+
+import sys
+import asyncio
+from telegram import Bot
+
+from config import TOKEN, BOT_API_BASE_URL, RECONCILE_RATE
+from database import get_pool, close_pool, post_lock
+from ratelimit import TokenBucket
+from edit_scheduler import edit_scheduler
+from handlers.channel_interact import render_base_caption, push_post_render, CAPTION_TEMPLATE_VERSION
+
+BATCH_SIZE = 500
+
+
+async def rerender(force: bool = False, push: bool = False):
+    """
+    按 submissions.id 分批重新生成 base_caption，只处理版本落后的帖子 (force 时全部处理)。
+    push 时同时按 RECONCILE_RATE 限速重新编辑频道消息，否则频道消息在下次点击时才更新。
+    """
+    pool = await get_pool()
+    bot = None
+    if push:
+        bot = Bot(TOKEN, base_url=BOT_API_BASE_URL) if BOT_API_BASE_URL else Bot(TOKEN)
+        await bot.initialize()
+    bucket = TokenBucket(RECONCILE_RATE)
+    last_id = total = pushed = 0
+    try:
+        while True:
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT id, channel_message_id, content_text, user_id, user_name FROM submissions
+                    WHERE id > $1 AND ($3 OR base_caption IS NULL OR caption_version <> $2)
+                    ORDER BY id LIMIT $4
+                    """,
+                    last_id, CAPTION_TEMPLATE_VERSION, force, BATCH_SIZE
+                )
+                if not rows: break
+                captions = [(row['channel_message_id'], await render_base_caption(conn, row)) for row in rows]
+                await conn.executemany(
+                    "UPDATE submissions SET base_caption = $2, caption_version = $3 WHERE channel_message_id = $1",
+                    [(mid, caption, CAPTION_TEMPLATE_VERSION) for mid, caption in captions]
+                )
+            last_id = rows[-1]['id']
+            total += len(rows)
+            print(f"🧾 已重新生成 {total} 个帖子的页脚 (id ≤ {last_id})")
+
+            if push:
+                for mid, _ in captions:
+                    await bucket.acquire()
+                    async with pool.acquire() as conn:
+                        # 多进程部署时与 worker 共用 advisory 锁；单进程部署时机器人只持进程内锁，
+                        # 两边都按数据库最新状态渲染，并发时最后一次编辑仍是最新状态
+                        async with post_lock(conn, mid):
+                            if await push_post_render(bot, conn, mid):
+                                pushed += 1
+        print(f"✅ 完成：{total} 个帖子已更新到模板版本 {CAPTION_TEMPLATE_VERSION}" + (f"，已提交 {pushed} 个频道消息编辑" if push else ""))
+    finally:
+        if bot is not None:
+            # 等合并器把排队的编辑发完
+            await edit_scheduler.drain()
+            await bot.shutdown()
+        await close_pool()
+
+# 使用方法 (一般在部署了新页脚模板、机器人重启后运行)：
+# python rerender_captions.py            # 只重新生成版本落后的帖子，频道消息在下次点击时更新
+# python rerender_captions.py --push     # 同时限速重新编辑频道消息
+# python rerender_captions.py --all      # 忽略版本，全部重新生成
+
+if __name__ == "__main__":
+    unknown = set(sys.argv[1:]) - {"--push", "--all"}
+    if unknown:
+        print(f"未知参数: {' '.join(unknown)}")
+        sys.exit(1)
+    asyncio.run(rerender(force="--all" in sys.argv, push="--push" in sys.argv))
@@ -0,0 +1,116 @@
+# slowlog.py
+
+import os
+import re
+import sys
+import random
+import asyncio
+import logging
+from datetime import datetime
+import asyncpg
+
+from config import DATABASE_URL, SLOW_QUERY_MS, SLOW_QUERY_SAMPLE, SLOW_QUERY_PLAN_FILE
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.join(PROJECT_DIR, name) for name in ("metrics.py", "slowlog.py")}
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+# 只对普通读写语句抓取执行计划；锁/通知/事务控制语句在另一个连接上重放会阻塞或产生副作用
+_EXPLAINABLE_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.I)
+_UNSAFE_RE = re.compile(r"pg_advisory|pg_notify|txid_current|FOR\s+UPDATE|\bSET\s+LOCAL\b", re.I)
+
+
+def normalize_sql(sql: str) -> str:
+    """折叠空白、把字面量替换为 ?，便于按语句归类"""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _SPACE_RE.sub(" ", sql).strip()
+    return sql if len(sql) <= 300 else sql[:300] + "..."
+
+
+def call_site() -> str:
+    """调用栈中第一个属于本项目 (且不是监控层本身) 的位置"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and filename not in _SKIP_FILES:
+            return f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class SlowQueryLog:
+    """慢查询日志：超过阈值的语句记录规范化 SQL 与调用位置，按比例抓取 EXPLAIN (ANALYZE, BUFFERS)"""
+
+    def __init__(self, threshold_ms: int, sample_rate: float, plan_file: str):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.plan_file = plan_file
+        self.logged = 0
+        self.explained = 0
+        self._explaining = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def configure(self, threshold_ms: int = None, sample_rate: float = None):
+        if threshold_ms is not None:
+            self.threshold_ms = max(0, int(threshold_ms))
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        logger.info(f"🐢 慢查询日志: 阈值 {self.threshold_ms}ms，采样 {self.sample_rate:.0%}")
+
+    def report(self, query: str, args: tuple, elapsed: float):
+        """在被计时的调用返回前同步调用 (调用栈仍然完整)"""
+        self.logged += 1
+        site = call_site()
+        normalized = normalize_sql(query)
+        logger.warning(f"🐢 慢查询 {elapsed * 1000:.0f}ms @ {site}: {normalized}")
+        if (not self._explaining and random.random() < self.sample_rate
+                and _EXPLAINABLE_RE.match(query) and not _UNSAFE_RE.search(query)):
+            self._explaining = True
+            asyncio.get_running_loop().create_task(self._capture_plan(query, args, elapsed, site, normalized))
+
+    async def _capture_plan(self, query: str, args: tuple, elapsed: float, site: str, normalized: str):
+        """在独立连接上重放并回滚，不占用连接池，也不影响原事务"""
+        try:
+            conn = await asyncpg.connect(dsn=DATABASE_URL)
+            try:
+                tr = conn.transaction()
+                await tr.start()
+                try:
+                    await conn.execute("SET LOCAL statement_timeout = 30000")
+                    await conn.execute("SET LOCAL lock_timeout = 1000")
+                    rows = await conn.fetch("EXPLAIN (ANALYZE, BUFFERS) " + query, *args)
+                finally:
+                    await tr.rollback()
+            finally:
+                await conn.close()
+            plan = "\n".join(row[0] for row in rows)
+            entry = (
+                f"===== {datetime.now().isoformat(timespec='seconds')} | {elapsed * 1000:.0f}ms | {site}\n"
+                f"{normalized}\n{plan}\n\n"
+            )
+            await asyncio.to_thread(self._append, entry)
+            self.explained += 1
+        except Exception as e:
+            logger.warning(f"⚠️ 抓取执行计划失败: {e}")
+        finally:
+            self._explaining = False
+
+    def _append(self, entry: str):
+        with open(self.plan_file, "a", encoding="utf-8") as f:
+            f.write(entry)
+
+    def status(self) -> str:
+        state = f"阈值 {self.threshold_ms}ms" if self.enabled else "已关闭"
+        return (f"🐢 慢查询日志：{state}\n执行计划采样：{self.sample_rate:.0%} → {self.plan_file}\n"
+                f"已记录 {self.logged} 条，已抓取计划 {self.explained} 个")
+
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_SAMPLE, SLOW_QUERY_PLAN_FILE)
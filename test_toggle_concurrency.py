@@ -0,0 +1,100 @@
+# test_toggle_concurrency.py - 并发点赞/收藏切换压力测试 (PostgreSQL版)
+
+import sys
+import random
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# 使用负数 ID，避免和真实频道消息冲突
+TEST_MESSAGE_ID = -900000001
+
+
+async def cleanup(pool):
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM reactions WHERE channel_message_id = $1", TEST_MESSAGE_ID)
+        await conn.execute("DELETE FROM collections WHERE channel_message_id = $1", TEST_MESSAGE_ID)
+        await conn.execute("DELETE FROM post_stats WHERE channel_message_id = $1", TEST_MESSAGE_ID)
+
+
+async def toggle(pool, kind: str, user_id: int, value: int = 1):
+    async with pool.acquire() as conn:
+        if kind == 'react':
+            await conn.fetchrow("SELECT * FROM toggle_reaction($1, $2, $3)", TEST_MESSAGE_ID, user_id, value)
+        else:
+            await conn.fetchrow("SELECT * FROM toggle_collection($1, $2)", TEST_MESSAGE_ID, user_id)
+
+
+async def check_consistency(pool) -> bool:
+    """post_stats 必须与明细表完全一致"""
+    async with pool.acquire() as conn:
+        stats = await conn.fetchrow("SELECT likes, dislikes, collections FROM post_stats WHERE channel_message_id = $1", TEST_MESSAGE_ID)
+        likes = await conn.fetchval("SELECT COUNT(*) FROM reactions WHERE channel_message_id = $1 AND reaction_type = 1", TEST_MESSAGE_ID)
+        dislikes = await conn.fetchval("SELECT COUNT(*) FROM reactions WHERE channel_message_id = $1 AND reaction_type = -1", TEST_MESSAGE_ID)
+        collections = await conn.fetchval("SELECT COUNT(*) FROM collections WHERE channel_message_id = $1", TEST_MESSAGE_ID)
+    actual = (likes, dislikes, collections)
+    recorded = (stats['likes'], stats['dislikes'], stats['collections']) if stats else (0, 0, 0)
+    print(f"明细表: 赞 {actual[0]} / 踩 {actual[1]} / 收藏 {actual[2]}")
+    print(f"post_stats: 赞 {recorded[0]} / 踩 {recorded[1]} / 收藏 {recorded[2]}")
+    return actual == recorded
+
+
+async def run_toggle_storm(users: int, taps_per_user: int):
+    """每个用户并发点击多次，验证奇偶结果和计数一致性"""
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=10, max_size=50)
+    try:
+        await cleanup(pool)
+
+        # 1. 只点赞：每个用户点 taps_per_user 次，奇数次的最终应为已赞
+        print(f"\n=== {users} 个用户 x {taps_per_user} 次并发点赞 ===")
+        tasks = [toggle(pool, 'react', uid) for uid in range(1, users + 1) for _ in range(taps_per_user)]
+        random.shuffle(tasks)
+        await asyncio.gather(*tasks)
+        expected_likes = users if taps_per_user % 2 else 0
+        ok = await check_consistency(pool)
+        async with pool.acquire() as conn:
+            likes = await conn.fetchval("SELECT likes FROM post_stats WHERE channel_message_id = $1", TEST_MESSAGE_ID) or 0
+        ok = ok and likes == expected_likes
+        print("✅ 点赞一致" if ok else f"❌ 点赞不一致 (期望 {expected_likes})")
+
+        # 2. 赞/踩混合：最终状态取决于执行顺序，只校验计数一致
+        print(f"\n=== {users} 个用户赞/踩混合并发 ===")
+        tasks = [toggle(pool, 'react', uid, random.choice((1, -1))) for uid in range(1, users + 1) for _ in range(taps_per_user)]
+        random.shuffle(tasks)
+        await asyncio.gather(*tasks)
+        mixed_ok = await check_consistency(pool)
+        print("✅ 赞/踩计数一致" if mixed_ok else "❌ 赞/踩计数不一致")
+
+        # 3. 收藏
+        print(f"\n=== {users} 个用户 x {taps_per_user} 次并发收藏 ===")
+        tasks = [toggle(pool, 'collect', uid) for uid in range(1, users + 1) for _ in range(taps_per_user)]
+        random.shuffle(tasks)
+        await asyncio.gather(*tasks)
+        collect_ok = await check_consistency(pool)
+        print("✅ 收藏计数一致" if collect_ok else "❌ 收藏计数不一致")
+
+        return ok and mixed_ok and collect_ok
+    finally:
+        await cleanup(pool)
+        await pool.close()
+
+# 使用方法 (需先启动过一次机器人以创建表和函数)：
+# python test_toggle_concurrency.py [用户数] [每人点击次数]
+
+if __name__ == "__main__":
+    if not DATABASE_URL:
+        print("错误: 环境变量 DATABASE_URL 未设置")
+        exit(1)
+
+    try:
+        users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+        taps = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    except ValueError:
+        print("请输入有效的数字")
+        exit(1)
+    passed = asyncio.run(run_toggle_storm(users, taps))
+    exit(0 if passed else 1)
@@ -0,0 +1,131 @@
+# update_processor.py
+
+import time
+import asyncio
+import logging
+from typing import Awaitable, Optional
+from telegram import Update
+from telegram.constants import ChatType
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[tuple]:
+    """
+    顺序 key：频道按钮回调按帖子串行，其余按 (chat, user) 会话串行；
+    无法归属的更新返回 None，直接并行处理
+    """
+    if not isinstance(update, Update): return None
+    query = update.callback_query
+    if query and query.message and query.message.chat.type == ChatType.CHANNEL:
+        return ("post", query.message.message_id)
+    chat = update.effective_chat
+    user = update.effective_user
+    if chat is None and user is None: return None
+    return ("chat", chat.id if chat else None, user.id if user else None)
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    按 key 保序的并发更新处理器：
+    同一 key 的更新严格按到达顺序逐个处理，不同 key 之间并行，总并发不超过 max_concurrent_updates。
+    排队中的更新不占用并发名额，因此一个慢会话不会挡住其他用户。
+    PTB 开启并发后会立即把 update_queue 中的更新取出交给这里，入口队列本身不会积压，
+    因此背压要看 pending (排队 + 处理中)。
+
+    保序和并发名额都在 do_process_update 里实现，process_update 沿用 PTB 的实现：
+    基类的信号量按 max_pending 设置，只作为已取出更新总数的上限，实际并发由 _slots 控制。
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending: int = 0):
+        super().__init__(max(max_pending, max_concurrent_updates))
+        self.max_in_flight = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._tails = {}    # key -> 该 key 最后一个更新完成时置位的 Future
+        self._depth = {}    # key -> 已到达未完成的更新数
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+        # key 类型 (post/chat/none) -> [次数, 总等待秒数, 最大等待秒数]
+        self._waits = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        # 必须在第一个 await 之前登记，保证同一 key 的先后顺序与进入处理器的顺序一致
+        # (基类信号量未满时不会让出；满了时 asyncio.Semaphore 按先来后到唤醒，顺序同样不变)
+        key = update_key(update)
+        arrived = time.monotonic()
+        self.waiting += 1
+        prev = done = None
+        if key is not None:
+            prev = self._tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._tails[key] = done
+            self._depth[key] = self._depth.get(key, 0) + 1
+        try:
+            if prev is not None:
+                await asyncio.shield(prev)
+            async with self._slots:
+                self.waiting -= 1
+                self._record_wait(key[0] if key else "none", time.monotonic() - arrived)
+                self.in_flight += 1
+                try:
+                    await coroutine
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+        finally:
+            if key is not None:
+                done.set_result(None)
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+                self._depth[key] -= 1
+                if not self._depth[key]:
+                    del self._depth[key]
+
+    @property
+    def pending(self) -> int:
+        """已从入口队列取出、尚未处理完的更新数"""
+        return self.waiting + self.in_flight
+
+    def _record_wait(self, kind: str, waited: float):
+        entry = self._waits.setdefault(kind, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += waited
+        entry[2] = max(entry[2], waited)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self, top: int = 5) -> dict:
+        """队列深度与按 key 类型统计的等待时间；max_wait_ms 每次读取后清零 (反映最近一段时间)"""
+        busiest = sorted(self._depth.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        waits = {}
+        for kind, entry in self._waits.items():
+            count, total, peak = entry
+            waits[kind] = {
+                "count": count,
+                "avg_wait_ms": round(total / count * 1000, 1) if count else 0.0,
+                "max_wait_ms": round(peak * 1000, 1),
+            }
+            entry[2] = 0.0
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "keys": len(self._depth),
+            "busiest_keys": [{"key": list(k), "depth": d} for k, d in busiest],
+            "processed": self.processed,
+            "waits": waits,
+        }
+
+
+async def log_processor_stats(context) -> None:
+    """定时任务：出现排队时记录处理器状态 (webhook 模式另见 /healthz)"""
+    processor = context.application.update_processor
+    if not isinstance(processor, KeyedUpdateProcessor): return
+    stats = processor.stats()
+    if stats["waiting"] or any(w["max_wait_ms"] > 1000 for w in stats["waits"].values()):
+        logger.info(f"📊 更新处理器: {stats}")
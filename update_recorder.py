@@ -0,0 +1,112 @@
+# update_recorder.py - 入站更新录制 (可选，用于线上流量回放)
+
+import re
+import json
+import hmac
+import time
+import atexit
+import asyncio
+import hashlib
+import logging
+import secrets
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# 个人信息：直接丢弃
+_DROP_KEYS = frozenset({"last_name", "phone_number", "email", "contact", "location", "venue", "bio", "language_code"})
+# 用户/私聊 ID：替换为同一录制文件内稳定的假名 (负数的群/频道 ID 保留，路由依赖它们)
+_ID_KEYS = frozenset({"id", "user_id", "chat_id"})
+_NAME_KEYS = frozenset({"first_name", "username", "title"})
+# 正文：逐字符打码，保留长度 (搜索/评论的性能与长度相关) 和命令名
+_TEXT_KEYS = frozenset({"text", "caption", "query", "url"})
+_FILE_KEYS = frozenset({"file_id", "file_unique_id"})
+# 回调数据中携带用户 ID 的按钮 (前缀:用户ID:...)
+_USER_ID_CALLBACKS = frozenset({"approve", "decline"})
+_NON_SPACE = re.compile(r"\S")
+# /start 深链参数 (thread_expand_、comment_、manage_comments_ 等) 只含帖子/评论 ID，原样保留以免回放时全部落到主菜单
+_DEEP_LINK_PAYLOAD = re.compile(r"[A-Za-z0-9_-]{1,64}")
+PSEUDO_ID_BASE = 10 ** 12   # 假名 ID 落在真实用户 ID 范围之外
+
+
+def _mask_text(text: str) -> str:
+    if text.startswith("/"):
+        command, sep, rest = text.partition(" ")
+        if command.split("@")[0] == "/start" and _DEEP_LINK_PAYLOAD.fullmatch(rest):
+            return text
+        return command + sep + _NON_SPACE.sub("x", rest)
+    return _NON_SPACE.sub("x", text)
+
+
+class UpdateRecorder:
+    """把每个入站更新脱敏后以 JSON 行追加到文件：{"t": 到达时间戳, "u": 更新}"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._salt = secrets.token_bytes(16)   # 每次录制独立，假名无法跨文件关联
+        self._file = open(path, "a", encoding="utf-8", buffering=64 * 1024)
+        self._flushed_at = time.monotonic()
+        self.recorded = 0
+        atexit.register(self.close)
+        logger.info(f"🎥 正在录制入站更新 -> {path}")
+
+    def _digest(self, value) -> bytes:
+        return hmac.new(self._salt, str(value).encode(), hashlib.sha256).digest()
+
+    def pseudo_id(self, value: int) -> int:
+        return PSEUDO_ID_BASE + int.from_bytes(self._digest(value)[:4], "big")
+
+    def scrub(self, value, key: str = None):
+        if isinstance(value, dict):
+            return {k: self.scrub(v, k) for k, v in value.items() if k not in _DROP_KEYS}
+        if isinstance(value, list):
+            return [self.scrub(v, key) for v in value]
+        if key in _ID_KEYS and isinstance(value, int) and value > 0:
+            return self.pseudo_id(value)
+        if not isinstance(value, str):
+            return value
+        if key in _NAME_KEYS:
+            return "u" + self._digest(value)[:4].hex()
+        if key in _TEXT_KEYS:
+            return _mask_text(value)
+        if key in _FILE_KEYS:
+            return self._digest(value)[:12].hex()
+        if key == "data":
+            parts = value.split(":")
+            if parts[0] in _USER_ID_CALLBACKS and len(parts) > 1 and parts[1].isdigit():
+                parts[1] = str(self.pseudo_id(int(parts[1])))
+                return ":".join(parts)
+        return value
+
+    def record(self, update: Update):
+        try:
+            line = json.dumps({"t": round(time.time(), 4), "u": self.scrub(update.to_dict())},
+                              ensure_ascii=False, separators=(",", ":"))
+            self._file.write(line + "\n")
+            self.recorded += 1
+            # 写入走缓冲，每秒最多落盘一次
+            now = time.monotonic()
+            if now - self._flushed_at >= 1:
+                self._file.flush()
+                self._flushed_at = now
+        except Exception as e:
+            logger.warning(f"⚠️ 录制更新失败: {e}")
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            logger.info(f"🎥 录制结束，共 {self.recorded} 条 -> {self.path}")
+
+
+class RecordingQueue(asyncio.Queue):
+    """入口队列：入队即录制，polling (put) 和 webhook (put_nowait) 都经过 put_nowait，时间戳即到达时间"""
+
+    def __init__(self, maxsize: int, recorder: UpdateRecorder):
+        super().__init__(maxsize)
+        self.recorder = recorder
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        # 队列满被拒绝的更新不录制 (webhook 返回 503 后 Telegram 会重新投递)
+        if isinstance(item, Update):
+            self.recorder.record(item)
@@ -0,0 +1,119 @@
+# user_directory.py
+
+import asyncio
+import logging
+from typing import Optional, Tuple
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL, USER_REFRESH_MAX_AGE
+from database import get_pool, USER_PROFILE
+from cache import TTLCache
+from request_scheduler import with_priority, BACKGROUND
+from cluster import invalidate_local, publish_invalidation
+
+logger = logging.getLogger(__name__)
+
+# user_id -> (username, full_name)
+_user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+REFRESH_BATCH_SIZE = 20
+REFRESH_MAX_BACKOFF = 6     # 连续失败的作者最多按 2^6 倍 USER_REFRESH_MAX_AGE 退避
+
+
+async def remember_user(user) -> None:
+    """记录用户资料：缓存中已有相同资料时不写库"""
+    entry = (user.username or "", user.full_name or "")
+    if _user_cache.get(user.id) == entry: return
+    _user_cache.put(user.id, entry)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        # RETURNING 中的子查询看到的是语句开始前的快照，即旧用户名
+        old_username = await conn.fetchval(
+            """
+            INSERT INTO users (user_id, username, full_name) VALUES ($1, $2, $3)
+            ON CONFLICT (user_id) DO UPDATE SET
+                username = EXCLUDED.username, full_name = EXCLUDED.full_name, updated_at = CURRENT_TIMESTAMP
+            RETURNING (SELECT username FROM users WHERE user_id = $1)
+            """,
+            user.id, entry[0], entry[1]
+        )
+        if (old_username or "") != entry[0]:
+            # 用户名变化：作者页脚链接作废，下次渲染时按新资料重新生成
+            async with conn.transaction():
+                await conn.execute("UPDATE submissions SET caption_version = 0 WHERE user_id = $1 AND caption_version <> 0", user.id)
+                await publish_invalidation(conn, "author_captions", user.id)
+            invalidate_local("author_captions", user.id)
+
+
+async def lookup_user(conn, user_id: int) -> Optional[Tuple[str, str]]:
+    """查询用户 (username, full_name)，先查内存再查 users 表，都没有时返回 None"""
+    entry = _user_cache.get(user_id)
+    if entry is not None:
+        return entry
+    row = await USER_PROFILE.fetchrow(conn, user_id)
+    if not row:
+        return None
+    entry = (row['username'] or "", row['full_name'] or "")
+    _user_cache.put(user_id, entry)
+    return entry
+
+
+async def track_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """被动刷新：每个更新都顺带记录发送者资料 (不阻塞后续处理器)"""
+    user = update.effective_user
+    if user and not user.is_bot:
+        context.application.create_task(remember_user(user))
+        # 用户主动 /start 说明又能收到私信了
+        message = update.message
+        if message and message.chat.type == "private" and (message.text or "").startswith("/start"):
+            context.application.create_task(mark_user_reachable(user.id))
+
+
+async def mark_user_reachable(user_id: int) -> None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE users SET dm_blocked = FALSE WHERE user_id = $1 AND dm_blocked", user_id)
+
+
+@with_priority(BACKGROUND)
+async def refresh_stale_users(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    低优先级后台任务：逐个调用 get_chat 刷新资料缺失或过期的作者 (最久未刷新的优先)。
+    无论成功失败都更新 updated_at，避免同一批用户每轮被反复选中；失败的用户按连续失败次数指数退避。
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT a.user_id FROM (SELECT DISTINCT user_id FROM submissions) a
+            LEFT JOIN users u ON u.user_id = a.user_id
+            WHERE u.user_id IS NULL
+               OR u.updated_at < CURRENT_TIMESTAMP - make_interval(secs => $1 * power(2, LEAST(u.refresh_failures, $3)))
+            ORDER BY u.updated_at NULLS FIRST
+            LIMIT $2
+            """,
+            USER_REFRESH_MAX_AGE, REFRESH_BATCH_SIZE, REFRESH_MAX_BACKOFF
+        )
+    for row in rows:
+        user_id = row['user_id']
+        failed = False
+        try:
+            chat = await context.bot.get_chat(user_id)
+            # 缓存中资料未变时 remember_user 不写库，下面统一标记已刷新
+            await remember_user(chat)
+        except Exception as e:
+            failed = True
+            logger.warning(f"⚠️ 刷新用户 {user_id} 资料失败: {e}")
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO users (user_id, refresh_failures) VALUES ($1, $2::int)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    updated_at = CURRENT_TIMESTAMP,
+                    refresh_failures = CASE WHEN $2::int = 0 THEN 0 ELSE LEAST(users.refresh_failures + 1, 32767) END
+                """,
+                user_id, 1 if failed else 0
+            )
+        # 控制节奏，把 API 额度留给前台请求
+        await asyncio.sleep(1)
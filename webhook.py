@@ -0,0 +1,102 @@
+# webhook.py
+
+import json
+import asyncio
+import hmac
+import logging
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from database import pool_stats
+from request_scheduler import api_scheduler
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    基于 aiohttp 的 Webhook 入口：
+    - 校验 secret token
+    - 待处理更新 (入口队列 + 处理器中排队/处理中) 达到上限时返回 503 让 Telegram 稍后重试
+    - GET /healthz 健康检查
+    本地测试可直接 POST 录制的 update JSON 到 WEBHOOK_PATH。
+    """
+
+    def __init__(self, application: Application, listen: str, port: int, path: str, secret: str = "",
+                 max_pending: int = 0):
+        self.application = application
+        # 默认与入口队列容量相同
+        self.max_pending = max_pending or application.update_queue.maxsize
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.accepted = 0
+        self.rejected = 0
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/healthz", self.handle_health)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"⚠️ Webhook 收到无法解析的更新: {e}")
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+
+        queue = self.application.update_queue
+        pending = self.pending()
+        try:
+            if self.max_pending and pending >= self.max_pending:
+                raise asyncio.QueueFull
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"⚠️ 待处理更新已满 ({pending})，拒绝 update {update.update_id}")
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        self.accepted += 1
+        return web.Response(status=200)
+
+    def pending(self) -> int:
+        """入口队列中的更新 + 处理器里排队/处理中的更新"""
+        return self.application.update_queue.qsize() + getattr(self.application.update_processor, "pending", 0)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        queue = self.application.update_queue
+        healthy = self.application.running
+        body = {
+            "status": "ok" if healthy else "stopped",
+            "queue_size": queue.qsize(),
+            "queue_max": queue.maxsize,
+            "pending": self.pending(),
+            "pending_max": self.max_pending,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }
+        processor = self.application.update_processor
+        if hasattr(processor, "stats"):
+            body["processor"] = processor.stats()
+        body["db_pool"] = pool_stats()
+        body["api_queue"] = api_scheduler.stats()
+        return web.json_response(body, status=200 if healthy else 503)
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"🌐 Webhook 服务已监听 {self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None